@@ -1,129 +1,319 @@
 # Author: Joaquin Cisneros & Rodrigo Manriquez
 # Date: October 2025
 
-import serial
+import queue
 import threading
 import time
 
+import serial
+
+import gripper_protocol as proto
+
 # === CONFIGURE YOUR PORT AND BAUD RATE ===
-ARDUINO_PORT = "COM3"   # change this to your Arduino port
+ARDUINO_PORT = "COM3"   # change this to your Arduino port ("sim" for the simulator)
 BAUD_RATE = 9600
+BOOT_TIMEOUT = 2.0      # max wait for the Arduino to come up after the port resets it
+BACKOFF_MIN = 0.5       # reconnect backoff (s), doubles up to BACKOFF_MAX
+BACKOFF_MAX = 10.0
+ACK_TIMEOUT = 0.5       # max wait for the ACK of a framed command (s)
+
+# Framed event payloads -> the legacy message they replace
+EVENT_KEYS = {"LISTO": "Listo", "FRESA_SI": "FresaSi"}
+
+
+class ArduinoLink:
+    """
+    Persistent serial link to the gripper Arduino.
+    The port is opened once and kept for the whole run. One reader thread owns the
+    port: it reconnects with exponential backoff after a SerialException, counts the
+    'Listo'/'FresaSi' messages and pushes every line to the `responses` queue.
+    Commands are queued and written by a single writer thread.
+    Framed messages (gripper_protocol) are used as soon as the Arduino sends one;
+    until then the legacy text commands are sent.
+    """
+
+    def __init__(self, port=ARDUINO_PORT, baud=BAUD_RATE, serial_factory=None):
+        self.port = port
+        self.baud = baud
+        if serial_factory is None:
+            if port == "sim":
+                import arduino_sim
+                serial_factory = arduino_sim.SimSerial
+            else:
+                serial_factory = lambda: serial.Serial(self.port, self.baud, timeout=1)
+        self.serial_factory = serial_factory
 
-# === GLOBAL VARIABLES ===
-ser = None
-is_listo = threading.Event()
-is_fresa_si = threading.Event()
+        self.ser = None
+        self.commands = queue.Queue()
+        self.responses = queue.Queue(maxsize=256)  # newest lines, oldest dropped when full
+        self.reconnects = 0
+        self.crc_errors = 0
 
+        # Framed protocol state: outstanding requests by sequence number and RTT log
+        self.framed = False
+        self._seq = 0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self.latencies = {}
 
-def read_from_arduino():
-    """Continuously read from Arduino and detect 'Listo' messages."""
-    global is_listo
-    while True:
+        # Messages received since the last reset, guarded by a condition so waits wake up on arrival
+        self._counts = {"Listo": 0, "FresaSi": 0, "any": 0}
+        self._cond = threading.Condition()
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._reader = None
+        self._writer = None
+
+    # ---- lifecycle ----
+    def open(self):
+        """Open the port and start the reader and writer threads (once)."""
+        if self._reader is not None:
+            return
+        self._stop.clear()
+        self._connect()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._reader.start()
+        self._writer.start()
+
+        # Opening the port resets the Arduino: continue as soon as it talks, at most BOOT_TIMEOUT
+        if self.wait_for("any", timeout=BOOT_TIMEOUT):
+            print("Arduino is up.")
+
+    def close(self):
+        """Flush queued commands, stop both threads and close the serial connection."""
+        self.commands.put(None)  # the writer exits once everything before it is written
+        if self._writer is not None:
+            self._writer.join(timeout=BOOT_TIMEOUT)
+        self._stop.set()
+        for thread in (self._reader, self._writer):
+            if thread is not None:
+                thread.join()
+        self._reader = self._writer = None
+        self._disconnect()
+        print("Serial connection closed.")
+
+    def _connect(self):
+        self.ser = self.serial_factory()
+        self.reset_events()
+        self._connected.set()
+        print(f"Connected to {self.port} at {self.baud} baud.")
+
+    def _disconnect(self):
+        self._connected.clear()
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+            self.ser = None
+
+    def _reconnect(self):
+        """Reopen the port with exponential backoff until it works or the link is closed."""
+        self._disconnect()
+        backoff = BACKOFF_MIN
+        while not self._stop.is_set():
+            try:
+                self._connect()
+                self.reconnects += 1
+                return
+            except serial.SerialException as e:
+                print(f"Reconnect failed ({e}), retrying in {backoff:.1f} s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+
+    # ---- threads ----
+    def _read_loop(self):
+        """Read lines (blocking with the port timeout) and dispatch them."""
+        while not self._stop.is_set():
+            try:
+                line = self.ser.readline().decode(errors="ignore").strip()
+            except (serial.SerialException, OSError):
+                print("Lost connection to Arduino.")
+                self._reconnect()
+                continue
+            if not line:
+                continue
+            print(f"[Arduino] {line}")
+            self._push_response(line)
+            self._notify("any")
+            if proto.is_frame(line):
+                self._handle_frame(line)
+            elif "Listo" in line:
+                self._notify("Listo")  # notify that Arduino is ready
+            elif "FresaSi" in line:
+                self._notify("FresaSi")  # notify that fresa is ready
+
+    def _handle_frame(self, line):
         try:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode(errors="ignore").strip()
-                if line:
-                    print(f"[Arduino] {line}")
-                    if "Listo" in line:
-                        is_listo.set()  # notify that Arduino is ready
-                    elif "FresaSi" in line:
-                        is_fresa_si.set()  # notify that fresa is ready
-        
-        
-        except serial.SerialException:
-            print("Lost connection to Arduino.")
-            break
-        except Exception as e:
-            print(f"Error reading: {e}")
-            break
-
-def connect_arduino(port=ARDUINO_PORT, baud=BAUD_RATE):
-    """Open serial connection and start background thread."""
-    global ser
-    ser = serial.Serial(port, baud, timeout=1)
-    time.sleep(2)  # wait for Arduino et
-    print(f"Connected to {port} at {baud} baud.")
-
-    thread = threading.Thread(target=read_from_arduino, daemon=True)
-    thread.start()
-
-
-def send_one():
-    """Send '1' to open the valve."""
-    if ser and ser.is_open:
-        ser.write(b"1\n")
-        print("[PC] Sent: 1 (abrir válvula)")
+            msg_type, seq, payload = proto.decode_frame(line)
+        except proto.ProtocolError as e:
+            self.crc_errors += 1
+            print(f"Dropped frame: {e}")
+            return
+        self.framed = True
 
+        if msg_type in (proto.MSG_ACK, proto.MSG_NACK):
+            with self._pending_lock:
+                entry = self._pending.get(seq)
+                if entry is not None:
+                    entry["replies"].append((msg_type, payload, time.monotonic()))
+                    entry["event"].set()
+        elif msg_type == proto.MSG_EVENT and payload in EVENT_KEYS:
+            self._notify(EVENT_KEYS[payload])
 
-def send_zero():
-    """Send '0' to close the valve."""
-    if ser and ser.is_open:
-        ser.write(b"0\n")
-        print("[PC] Sent: 0 (cerrar válvula)")
+    def _write_loop(self):
+        """Write queued commands in order; a command waits while the link is down."""
+        while True:
+            item = self.commands.get()
+            if item is None:
+                return
+            cmd, on_sent = item
+            while not self._stop.is_set():
+                if not self._connected.wait(timeout=0.5):
+                    continue
+                try:
+                    if on_sent is not None:
+                        on_sent(time.monotonic())
+                    self.ser.write(cmd)
+                    break
+                except (serial.SerialException, AttributeError):
+                    # The reader notices the broken port and reconnects
+                    self._connected.clear()
 
+    def _push_response(self, line):
+        try:
+            self.responses.put_nowait((time.monotonic(), line))
+        except queue.Full:
+            self.responses.get_nowait()
+            self.responses.put_nowait((time.monotonic(), line))
 
-def wait_for_ready(timeout=None):
-    """
-    Wait until Arduino sends 'Listo' twice.
-    Waits 3 seconds before starting to listen.
-    """
-    print("Waiting 3 seconds before reading for 'Listo'...")
-    time.sleep(3)
-
-    print("Waiting for 2 'Listo' signals from Arduino...")
-    listo_count = 0
-    start_time = time.time()
-
-    while True:
-        remaining = None
-        if timeout:
-            remaining = timeout - (time.time() - start_time)
-            if remaining <= 0:
-                print("Timeout waiting for 'Listo'")
-                return False
-
-        if is_listo.wait(timeout=remaining):
-            listo_count += 1
-            print(f"Received 'Listo' #{listo_count}")
-            is_listo.clear()  # reset event for next detection
-            if listo_count >= 3:
-                print("Arduino responded twice with 'Listo'")
-                return True
-        else:
-            print("Timeout waiting for 'Listo'")
-            return False
-
-def wait_for_fresa_si(timeout=None):
-    """
-    Wait until Arduino sends 'FresaSi'.
-    Waits 3 seconds before starting to listen.
-    """
-    print("Waiting 3 seconds before reading for 'FresaSi'...")
-    time.sleep(3)
+    # ---- events ----
+    def _notify(self, key):
+        with self._cond:
+            self._counts[key] += 1
+            self._cond.notify_all()
+
+    def reset_events(self, *keys):
+        """Forget messages received so far (all of them if no key is given)."""
+        with self._cond:
+            for key in keys or self._counts.keys():
+                self._counts[key] = 0
+
+    def wait_for(self, key, count=1, timeout=None):
+        """
+        Block until `count` messages of type `key` arrived since the last reset,
+        or until the timeout (s) expires. Consumes the messages on success.
+        """
+        with self._cond:
+            ok = self._cond.wait_for(lambda: self._counts[key] >= count, timeout=timeout)
+            if ok:
+                self._counts[key] -= count
+        return ok
+
+    # ---- gripper commands ----
+    def send(self, cmd, on_sent=None):
+        """Queue a raw command line; on_sent(t) is called once it is written."""
+        self.commands.put((cmd, on_sent))
 
-    print("Waiting for 'FresaSi' signal from Arduino...")
+    def request(self, payload, timeout=ACK_TIMEOUT, retries=1):
+        """
+        Send a framed command and wait for the ACK with the same sequence number.
+        Retries (same seq, the firmware does not run a retry twice) on timeout or NACK.
+        Returns the time from the first send to the ACK in ms, or None on failure.
+        Only commands acked on the first attempt add to latency_stats: after a retry
+        the ACK may answer either send.
+        """
+        with self._pending_lock:
+            self._seq = (self._seq + 1) % proto.SEQ_MOD
+            seq = self._seq
+            entry = {"event": threading.Event(), "replies": [], "sent": []}
+            self._pending[seq] = entry
 
-    start_time = time.time()
+        def on_sent(t):
+            entry["sent"].append(t)
 
-    while True:
-        remaining = None
-        if timeout:
-            remaining = timeout - (time.time() - start_time)
-            if remaining <= 0:
-                print("Timeout waiting for 'FresaSi'")
-                return False
+        try:
+            for attempt in range(retries + 1):
+                self.send(proto.encode_frame(proto.MSG_COMMAND, seq, payload), on_sent)
+                reply = self._wait_reply(entry, attempt, timeout)
+                if reply is None:
+                    print(f"[PC] No ACK for {payload} (seq {seq}, attempt {attempt + 1})")
+                    continue
+                msg_type, text, t_reply = reply
+                if msg_type == proto.MSG_NACK:
+                    print(f"[PC] NACK for {payload} (seq {seq}): {text}")
+                    continue
+                rtt = (t_reply - entry["sent"][0]) * 1000
+                if attempt == 0:
+                    self.latencies.setdefault(payload, []).append(rtt)
+                print(f"[PC] {payload} acked in {rtt:.1f} ms (seq {seq}, attempt {attempt + 1})")
+                return rtt
+            return None
+        finally:
+            with self._pending_lock:
+                self._pending.pop(seq, None)
+
+    def _wait_reply(self, entry, attempt, timeout):
+        """
+        Reply for one attempt of a request: any ACK (every attempt carries the same
+        command), or a NACK received after this attempt was written. A NACK for an
+        earlier attempt that arrives late is ignored. None after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._pending_lock:
+                sent = entry["sent"][attempt] if len(entry["sent"]) > attempt else None
+                for reply in entry["replies"]:
+                    if reply[0] == proto.MSG_ACK:
+                        return reply
+                for reply in entry["replies"]:
+                    if sent is not None and reply[2] >= sent:
+                        return reply
+                entry["event"].clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not entry["event"].wait(remaining):
+                return None
+
+    def latency_stats(self):
+        """Round-trip latency per command: count, median and max (ms)."""
+        stats = {}
+        for payload, samples in self.latencies.items():
+            ordered = sorted(samples)
+            stats[payload] = {"n": len(ordered), "p50_ms": ordered[len(ordered) // 2], "max_ms": ordered[-1]}
+        return stats
+
+    def send_one(self):
+        """Open the valve ('1', or VALVE=1 with ACK on framed firmware)."""
+        self.reset_events("Listo")  # only count 'Listo' that answer this command
+        if self.framed:
+            return self.request("VALVE=1") is not None
+        self.send(b"1\n")
+        print("[PC] Sent: 1 (abrir válvula)")
+        return True
+
+    def send_zero(self):
+        """Close the valve ('0', or VALVE=0 with ACK on framed firmware)."""
+        if self.framed:
+            return self.request("VALVE=0") is not None
+        self.send(b"0\n")
+        print("[PC] Sent: 0 (cerrar válvula)")
+        return True
+
+    def wait_for_ready(self, timeout=None, count=3):
+        """Wait until Arduino sends 'Listo' `count` times after the valve was opened."""
+        print(f"Waiting for {count} 'Listo' signals from Arduino...")
+        if self.wait_for("Listo", count=count, timeout=timeout):
+            print(f"Arduino responded {count} times with 'Listo'")
+            return True
+        print("Timeout waiting for 'Listo'")
+        return False
 
-        if is_fresa_si.wait(timeout=remaining):
+    def wait_for_fresa_si(self, timeout=None):
+        """Wait until Arduino sends 'FresaSi'."""
+        print("Waiting for 'FresaSi' signal from Arduino...")
+        if self.wait_for("FresaSi", timeout=timeout):
             print("Received 'FresaSi'")
-            is_fresa_si.clear()  # reset event for next detection
             return True
-        else:
-            print("Timeout waiting for 'FresaSi'")
-            return False
-
-def close_connection():
-    """Close the serial connection."""
-    global ser
-    if ser and ser.is_open:
-        ser.close()
-        print("Serial connection closed.")
\ No newline at end of file
+        print("Timeout waiting for 'FresaSi'")
+        return False
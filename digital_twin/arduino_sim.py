@@ -0,0 +1,178 @@
+# Author: Joaquin Cisneros & Rodrigo Manriquez
+# Date: November 2025
+# Description: Simulated gripper Arduino for running the pick cycle without hardware.
+# ArduinoFirmware mimics the sketch's serial messages; SimSerial plugs it into
+# arduino_comm in-process (port "sim"), and run_pty() exposes it on a pseudo-terminal
+# (Linux/macOS) so any serial client can talk to it. By default it speaks the framed
+# protocol from gripper_protocol; framed=False gives the legacy text messages.
+# Usage: python digital_twin/arduino_sim.py     (prints the pty path to connect to)
+
+import os
+import queue
+import threading
+
+import gripper_protocol as proto
+
+
+class ArduinoFirmware:
+    """
+    Serial behaviour of the gripper firmware:
+    - "Ready" after boot,
+    - "FresaSi" every `fresa_period` s while the valve is closed (strawberry in front of the sensor),
+    - "1" opens the valve and "Listo" is sent `listo_count` times as vacuum builds up,
+    - "0" closes the valve.
+    With framed=True the same messages are sent as protocol frames (READY, FRESA_SI,
+    LISTO events) and every command frame is answered with an ACK, or a NACK on a
+    bad CRC / unknown command. A command repeating the sequence number of the last
+    acked one is a retry: it is acked again but not executed twice.
+    """
+
+    def __init__(self, send_line, boot_time=0.2, fresa_period=0.3, vacuum_delay=0.3,
+                 listo_count=3, fail_fresa=False, fail_vacuum=False, framed=True):
+        self._send_text = send_line
+        self.framed = framed
+        self._event_seq = 0
+        self.fresa_period = fresa_period
+        self.vacuum_delay = vacuum_delay
+        self.listo_count = listo_count
+        self.fail_fresa = fail_fresa
+        self.fail_vacuum = fail_vacuum
+        self.valve_open = False
+        self.executed = []       # command payloads run, in order (retries not included)
+        self._last_ack = None    # (seq, ack frame) of the last executed command
+        self._stopped = threading.Event()
+        self._later(boot_time, self._boot)
+
+    def _later(self, delay, fn):
+        def run():
+            if not self._stopped.wait(delay):
+                fn()
+        threading.Thread(target=run, daemon=True).start()
+
+    def send_line(self, text):
+        """Send an event, framed or as legacy text."""
+        if not self.framed:
+            self._send_text(text)
+            return
+        event = {"Ready": "READY", "FresaSi": "FRESA_SI", "Listo": "LISTO"}[text]
+        self._event_seq += 1
+        self._send_text(proto.encode_frame(proto.MSG_EVENT, self._event_seq, event).decode().strip())
+
+    def _boot(self):
+        self.send_line("Ready")
+        self._later(self.fresa_period, self._sensor_tick)
+
+    def _sensor_tick(self):
+        if not self.valve_open and not self.fail_fresa:
+            self.send_line("FresaSi")
+        self._later(self.fresa_period, self._sensor_tick)
+
+    def on_line(self, line):
+        """Handle one command line from the PC."""
+        line = line.strip()
+        if proto.is_frame(line):
+            line = self._on_frame(line)
+        if line == "1":
+            self.valve_open = True
+            if not self.fail_vacuum:
+                for i in range(self.listo_count):
+                    self._later(self.vacuum_delay * (i + 1), lambda: self.send_line("Listo"))
+        elif line == "0":
+            self.valve_open = False
+
+    def _on_frame(self, line):
+        """ACK/NACK a command frame and return the equivalent legacy command."""
+        try:
+            msg_type, seq, payload = proto.decode_frame(line)
+        except proto.ProtocolError:
+            # Echo the sequence number if it can still be read
+            parts = line[1:].split(",")
+            seq = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+            self._send_text(proto.encode_frame(proto.MSG_NACK, seq, "CRC").decode().strip())
+            return None
+
+        commands = {"VALVE=1": "1", "VALVE=0": "0", "PING": None}
+        if msg_type != proto.MSG_COMMAND or payload not in commands:
+            self._send_text(proto.encode_frame(proto.MSG_NACK, seq, "UNKNOWN").decode().strip())
+            return None
+        if self._last_ack is not None and self._last_ack[0] == seq:
+            # Retry of a command whose ACK got lost or came late: ACK again, do not run it again
+            self._send_text(self._last_ack[1])
+            return None
+        ack = proto.encode_frame(proto.MSG_ACK, seq, "PONG" if payload == "PING" else "OK").decode().strip()
+        self._last_ack = (seq, ack)
+        self.executed.append(payload)
+        self._send_text(ack)
+        return commands[payload]
+
+    def stop(self):
+        self._stopped.set()
+
+
+class SimSerial:
+    """In-process stand-in for serial.Serial wired to an ArduinoFirmware."""
+
+    def __init__(self, timeout=1, **firmware_kwargs):
+        self.timeout = timeout
+        self.is_open = True
+        self._rx = queue.Queue()
+        self._pending = b""
+        self.firmware = ArduinoFirmware(lambda text: self._rx.put((text + "\r\n").encode()),
+                                        **firmware_kwargs)
+
+    @property
+    def in_waiting(self):
+        return self._rx.qsize()
+
+    def readline(self):
+        try:
+            return self._rx.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    def write(self, data):
+        self._pending += data
+        while b"\n" in self._pending:
+            line, self._pending = self._pending.split(b"\n", 1)
+            self.firmware.on_line(line.decode(errors="ignore"))
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+        self.firmware.stop()
+
+
+def run_pty(**firmware_kwargs):
+    """Serve the simulated firmware on a pseudo-terminal until interrupted (POSIX only)."""
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"Simulated Arduino on {os.ttyname(slave)}")
+
+    lock = threading.Lock()
+
+    def send_line(text):
+        with lock:
+            os.write(master, (text + "\r\n").encode())
+        print(f"[sim] -> {text}")
+
+    firmware = ArduinoFirmware(send_line, **firmware_kwargs)
+    pending = b""
+    try:
+        while True:
+            pending += os.read(master, 64)
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                print(f"[sim] <- {line.decode(errors='ignore').strip()}")
+                firmware.on_line(line.decode(errors="ignore"))
+    except (KeyboardInterrupt, OSError):
+        pass
+    finally:
+        firmware.stop()
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    run_pty()
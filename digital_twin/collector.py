@@ -2,17 +2,33 @@
 # Secuencia programada UR3e - RoboDK
 # ------------------------------------------------------
 # Autor: [Daniel De Regules & Joaquin Cisneros]
-# Descripción: Simula el ciclo de inspección, toma y depósito de una fresa.
+# Descripción: Simula el ciclo de inspección, toma y depósito de fresas.
+# Una sola foto de inspección da todas las fresas maduras; se ordenan con
+# harvest_planner y se cosechan una tras otra. Solo se vuelve a inspeccionar
+# cuando una fresa esperada no se confirma.
+# Uso: python digital_twin/collector.py [--sim [grabacion]]
+#   --sim: RoboDK en simulación y Arduino simulado; con una grabación de frame_source
+#   la percepción la reproduce, sin ella sigue usando la RealSense conectada.
 # ------------------------------------------------------
 
 import sys
 from robodk import robolink, robomath
-from strawberry_recognition import main
+from strawberry_recognition import PerceptionSession
+from frame_source import ReplaySource
+SIMULATE = "--sim" in sys.argv
+# Recording replayed instead of the live camera in simulation (argument after --sim)
+sim_args = sys.argv[sys.argv.index("--sim") + 1:] if SIMULATE else []
+REPLAY = sim_args[0] if sim_args else None
 RDK = robolink.Robolink()
-RDK.setRunMode(robolink.RUNMODE_RUN_ROBOT)  # Modo simulación
+if SIMULATE:
+    RDK.setRunMode(robolink.RUNMODE_SIMULATE)  # Modo simulación
+else:
+    RDK.setRunMode(robolink.RUNMODE_RUN_ROBOT)
 import numpy as np
-import time
 import arduino_comm
+import harvest_planner
+from cycle_timer import CycleTimer
+from harvest_executor import HarvestExecutor, still_valid
 
 
 # Global variables declaration
@@ -33,179 +49,254 @@ Pos_Approach_Caja =[45.829061, -58.787303, 34.653691, -60.168533, -93.065420, -1
 Pos_Caja = [82.944522, -30.021384, 21.647320, -86.033681, -93.644566, -1.855696]
 Out_range = [10.090000, -15.960000, -59.250000, -108.330000, 66.460000, 60.000000]
 
-# ------------------------------------------------------
-# Sequence of movements
-# ------------------------------------------------------
+# Stop after this many inspections in a row without a single successful pick
+MAX_EMPTY_TOURS = 3
 
-print("Starting programmed sequence...")
-
-# 1. POS_FOTO: environment observation
-print("→ POS_FOTO (Inspection position)")
-robot.MoveJ(Pos_foto)
+# Joints the base swings away from the plant with after a pick (set by pick_strawberry)
+swing_joints = None
 
-# Infinite loop of inspection and collection
-while True:
-    robot.setPoseFrame(foto) 
-
-    # Center strawberry
-    print("→ CENTER_STRAWBERRY")
-    # Pose of the strawberry relative to the camera (4x4 matrix)
-    matrix_center = main(second_iteration=False)
-
-    if matrix_center is None:
-        print("No ripe strawberry detected.")
-        break
-    else:
-        print("Strawberry detected, proceeding to pick.")
-        pass
+# Deadlines (s) for each acknowledged event of the cycle
+MOVE_TIMEOUT = 30
+FRESA_TIMEOUT = 7
+VACUUM_TIMEOUT = 7
 
-    matrix_center[2,3] = 0
+ARDUINO_PORT = "sim" if SIMULATE else arduino_comm.ARDUINO_PORT
 
-    tvec = matrix_center[0:3, 3]
-
-    # Preserve the current orientation of the robot and only change the translation
-    current_pose = robot.Pose()                    
-    target_pose = robomath.Mat(current_pose)     
-    # Offset to center the RGB Camera over the strawberry 
-    target_pose[0,3] = float(tvec[0]) + 30 
-    target_pose[1,3] = float(tvec[1]) + 100 
-    target_pose[2,3] = float(tvec[2]) - 100 
-
-    print("Moving only in translation to:", tvec)
+# ------------------------------------------------------
+# Helpers
+# ------------------------------------------------------
 
-    try:
-        robot.MoveJ(target_pose)
-    except Exception as e:
-        robot.MoveJ(Out_range)
+def move_j(target):
+    """MoveJ that returns once the controller reports the motion complete (or fails after MOVE_TIMEOUT)."""
+    robot.MoveJ(target, blocking=False)
+    robot.WaitMove(timeout=MOVE_TIMEOUT)
+
+def camera_pose_in_base():
+    """Pose of the camera frame with respect to the robot base (4x4 Mat)."""
+    return robomath.invH(robot.Parent().PoseAbs()) * camara.PoseAbs()
+
+def approach_pose(T_base_pick, tvec):
+    """Tool pose in the pick frame 200 mm in front of the strawberry, keeping the orientation of Pos_Approach_Fresa_in."""
+    pose = robomath.invH(T_base_pick) * robot.SolveFK(Pos_Approach_Fresa_in) * robot.PoseTool()
+    pose[0,3] = float(tvec[0])
+    pose[1,3] = float(tvec[1] + 200)
+    pose[2,3] = float(tvec[2])
+    return pose
+
+def approach_ik(T_base_pick):
+    """IK for the approach of a base-frame target, used by the planner (None if unreachable)."""
+    T_pick_base = np.linalg.inv(np.array(T_base_pick.Rows()))
+    def ik(pose_base):
+        tvec = (T_pick_base @ pose_base)[:3, 3]
+        joints = robot.SolveIK(approach_pose(T_base_pick, tvec), Pos_Approach_Fresa_in, robot.PoseTool(), T_base_pick)
+        joints = joints.list()
+        return joints if len(joints) >= 6 else None
+    return ik
+
+def snapshot_at_post_pick():
+    """
+    Frame grabbed at the lifted post-pick pose, still facing the plant, plus the camera
+    pose it was taken from (robot thread). The base swings away later, in place_strawberry.
+    """
+    return session.snapshot(), np.array(camera_pose_in_base().Rows())
+
+def verify_targets(snap, remaining):
+    """Worker thread: is each remaining target still seen in the post-pick frame?"""
+    pair, T_base_cam = snap
+    if pair is None:
+        return [True] * len(remaining)
+    detections = [T_base_cam @ d["pose"] for d in session.detect_all(pair=pair)]
+    return still_valid([t["pose_base"] for t in remaining], detections, T_base_cam,
+                       session.camera_matrix, session.image_size)
+
+def pick_strawberry(pick_frame, T_base_pick, matrix):
+    """
+    Pick the strawberry at matrix (4x4, mm, pick frame) and lift it clear of the plant.
+    Returns False if the gripper does not confirm the strawberry or the suction.
+    The camera still faces the plant when it returns, for the post-pick snapshot.
+    """
+    global swing_joints
+    timer = CycleTimer("pick")
+
+    # Only a 'FresaSi' seen from now on belongs to this strawberry
+    arduino.reset_events("FresaSi", "Listo")
 
     # 3. POS_APPROACH_FRESA: Approach the strawberry
     print("→ POS_APPROACH_FRESA (approach)")
+    with timer.step("approach"):
+        # Move to approach position
+        move_j(Pos_Approach_Fresa_in)
 
-    matrix = main(second_iteration=True)
-
-    if matrix is None:
-        print("No ripe strawberry detected in second iteration.")
-        robot.MoveJ(Pos_foto)
-        continue
-    
-    # Create temporary frame same as frame 3 to move relative to it
-    new_frame = RDK.AddFrame("temp_frame", RDK.Item("UR3e"))
-    new_frame.setPose(camara.Pose())
-    new_frame.setParentStatic(foto)
+        # Set robot reference frame to the pick frame (camera at inspection time)
+        robot.setPoseFrame(pick_frame)
 
-    # Move to approach position
-    robot.MoveJ(Pos_Approach_Fresa_in)
-
-    # Set robot reference frame to the new temporary frame
-    robot.setPoseFrame(new_frame) 
-
-    new_pose = robot.Pose()
-    new_target_pose = robomath.Mat(new_pose)     
-    new_target_pose[0,3] = float(matrix[0,3])
-    new_target_pose[1,3] = float(matrix[1,3]+200)
-    new_target_pose[2,3] = float(matrix[2,3]) 
-    print("Moving only in translation to:", tvec)
-
-    robot.MoveJ(new_target_pose)
+        tvec = matrix[0:3, 3]
+        print("Moving only in translation to:", tvec)
+        move_j(approach_pose(T_base_pick, tvec))
 
     # 4. POS_FRESA: smooth ascent towards the strawberry
     print("→ POS_FRESA (smooth ascent towards the strawberry)")
-    pose_fresa = robot.Pose() 
-    pose_fresa = robomath.Mat(pose_fresa)      
-    pose_fresa[1,3] = float(pose_fresa[1,3] - 153)  
-    robot.MoveJ(pose_fresa)
-
-    # Connect to Arduino
-    arduino_comm.connect_arduino()
+    with timer.step("ascent"):
+        pose_fresa = robot.Pose() 
+        pose_fresa = robomath.Mat(pose_fresa)      
+        pose_fresa[1,3] = float(pose_fresa[1,3] - 153)  
+        move_j(pose_fresa)
 
     # Open valve only if strawberry detected by Arduino (send 1)
-    ready0 = False
-    ready0 = arduino_comm.wait_for_fresa_si(timeout=7)
+    with timer.step("fresa_si"):
+        ready0 = arduino.wait_for_fresa_si(timeout=FRESA_TIMEOUT)
     if not ready0:
         print("No confirmation received for ready strawberry. Aborting cycle.")
-        robot.MoveJ(Pos_Approach_Fresa_in)
-        robot.MoveJ(Pos_foto)
-        arduino_comm.send_zero()
-        arduino_comm.close_connection()
-        continue
-
-    elif ready0:
-        arduino_comm.send_one()
+        arduino.send_zero()
+        move_j(Pos_Approach_Fresa_in)
+        timer.summary()
+        return False
+
+    # Valve open -> wait until Arduino confirms the vacuum with "Listo"
+    with timer.step("vacuum"):
+        arduino.send_one()
         print("Valve opened.")
-    
-    time.sleep(1)
-
-    # Wait until Arduino prints "Listo"
-    ready = False
-    ready=arduino_comm.wait_for_ready(timeout=7)
+        ready = arduino.wait_for_ready(timeout=VACUUM_TIMEOUT)
     if not ready:
         print("No confirmation received for suction. Aborting cycle.")
-        arduino_comm.send_zero()
-        robot.MoveJ(Pos_Approach_Fresa_in)
-        robot.MoveJ(Pos_foto)
-        time.sleep(2)    # Wait 1 second to ensure release
-        arduino_comm.close_connection()
-        continue
+        # Valve closes while the arm backs off, no extra wait needed
+        arduino.send_zero()
+        move_j(Pos_Approach_Fresa_in)
+        timer.summary()
+        return False
 
     #5. POS_POSTPICK: after picking the strawberry
     print("→ POS_POSTPICK (after picking the strawberry)") 
-    joints = robot.Joints()   # Convert to Python list
-    print("Current joints:", joints)
+    with timer.step("post_pick"):
+        joints = robot.Joints()   # Convert to Python list
+        print("Current joints:", joints)
 
-    # Move -30 in z 
-    post_pick_pose = robot.Pose() 
-    post_pick_pose = robomath.Mat(post_pick_pose)      
-    post_pick_pose[1,3] = float(post_pick_pose[1,3] + 50)
-    post_pick_pose[2,3] = float(post_pick_pose[2,3] - 100)
-    robot.MoveJ(post_pick_pose)
+        # Move -30 in z 
+        post_pick_pose = robot.Pose() 
+        post_pick_pose = robomath.Mat(post_pick_pose)      
+        post_pick_pose[1,3] = float(post_pick_pose[1,3] + 50)
+        post_pick_pose[2,3] = float(post_pick_pose[2,3] - 100)
+        move_j(post_pick_pose)
 
-    # Add +60 degrees to the first joint (index 0)
-    joints[0] -= 100
-    print("New joints:", joints)
+        # Add +60 degrees to the first joint (index 0)
+        joints[0] -= 100
+        swing_joints = joints
 
-    # Move robot to the new joint configuration
-    robot.MoveJ(joints)
+    timer.summary()
+    return True
+
+def place_strawberry():
+    """Swing the base away from the plant, carry the strawberry to the box, release it and back off."""
+    timer = CycleTimer("place")
+
+    with timer.step("swing"):
+        print("New joints:", swing_joints)
+        # Move robot to the new joint configuration
+        move_j(swing_joints)
 
     #6. PLACE/DROP: movement towards the box
     print("→ PLACE/DROP (placing the strawberry in the box)")
+    with timer.step("place"):
+        move_j(Pos_Approach_Caja)
+        move_j(Pos_Caja)
+
+    # Valve closes and the shake starts right away: the shake itself makes sure the
+    # strawberry has been released
+    with timer.step("release"):
+        arduino.send_zero()
+
+        robot.setSpeed(speed_linear=1400, speed_joints=100) 
+        robot.setAcceleration(10000)  
+
+        for i in range(2):
+            joints = robot.Joints()  
+            joints[4] -= 10
+            joints[5] -= 30
+            move_j(joints)
+            joints[4] += 10
+            joints[5] += 30
+            move_j(joints)
+            joints[4] -= 10
+            joints[5] -= 30
+            move_j(joints)
+            joints[4] += 10
+            joints[5] += 30
+            move_j(joints)
+        
+        robot.setSpeed(speed_linear=700, speed_joints=50) # restore normal speed
+
+    with timer.step("retreat"):
+        move_j(Pos_Approach_Caja)
+
+    timer.summary()
+
+# ------------------------------------------------------
+# Sequence of movements
+# ------------------------------------------------------
+
+print("Starting programmed sequence...")
+
+# Camera and detector are opened once and kept streaming for the whole run
+session = PerceptionSession(source=ReplaySource(REPLAY, loop=True) if REPLAY else None)
+
+# Single serial link to the gripper for the whole run
+arduino = arduino_comm.ArduinoLink(port=ARDUINO_PORT)
+arduino.open()
+
+executor = HarvestExecutor(place=place_strawberry, snapshot=snapshot_at_post_pick, verify=verify_targets)
 
-    robot.MoveJ(Pos_Approach_Caja)
-    robot.MoveJ(Pos_Caja)
-    arduino_comm.send_zero()
-
-    # Wait 2 second to ensure release
-    time.sleep(2)    
-
-    # Small shaking movement to ensure the strawberry has been released
-    robot.setSpeed(speed_linear=1400, speed_joints=100) 
-    robot.setAcceleration(10000)  
-
-    for i in range(2):
-        joints = robot.Joints()  
-        joints[4] -= 10
-        joints[5] -= 30
-        robot.MoveJ(joints)
-        joints[4] += 10
-        joints[5] += 30
-        robot.MoveJ(joints)
-        joints[4] -= 10
-        joints[5] -= 30
-        robot.MoveJ(joints)
-        joints[4] += 10
-        joints[5] += 30
-        robot.MoveJ(joints)
-    
-    robot.setSpeed(speed_linear=700, speed_joints=50) # restore normal speed
-
-    robot.MoveJ(Pos_Approach_Caja)
+empty_tours = 0
+
+# Loop of inspection and collection
+while True:
+    # 1. POS_FOTO: environment observation
+    print("→ POS_FOTO (Inspection position)")
+    move_j(Pos_foto)
+    robot.setPoseFrame(foto) 
+
+    # 2. INSPECTION: every ripe strawberry in one shot, poses relative to the camera (4x4, mm)
+    print("→ INSPECTION")
+    targets = session.detect_all()
+
+    if not targets:
+        print("No ripe strawberry detected.")
+        break
+
+    # Pick frame: camera pose at inspection time, so camera coordinates can be used directly
+    T_base_pick = camera_pose_in_base()
+    pick_frame = RDK.AddFrame("temp_frame", robot.Parent())
+    pick_frame.setPose(T_base_pick)
+    pick_frame.setParentStatic(foto)
+
+    # Order the picks by joint-space travel
+    T_base_pick_np = np.array(T_base_pick.Rows())
+    poses = [t["pose"] for t in targets]
+    order, skipped = harvest_planner.plan_harvest(poses, T_base_pick_np,
+                                                  start=Pos_Approach_Fresa_in, ik=approach_ik(T_base_pick))
+    print(f"{len(targets)} ripe strawberries, picking order {order}, unreachable {skipped}")
+
+    # Perception of the remaining targets runs while the arm places each strawberry
+    for t in targets:
+        t["pose_base"] = T_base_pick_np @ t["pose"]
+    result = executor.run([targets[idx] for idx in order],
+                          pick=lambda t: pick_strawberry(pick_frame, T_base_pick, t["pose"]))
+    picked = len(result["picked"])
+    if result["aborted"]:
+        # Expected strawberry not confirmed: the scene changed, inspect again
+        print("Target not confirmed, re-inspecting.")
+    executor.report()
 
     #7. RETURN TO PHOTO POSITION
     print("→ POS_FOTO (return to inspection position)")
+    move_j(Pos_foto)
+    pick_frame.Delete()
+
+    empty_tours = 0 if picked else empty_tours + 1
+    if empty_tours >= MAX_EMPTY_TOURS:
+        print("No strawberry could be picked in the last inspections. Stopping.")
+        break
 
-    robot.MoveJ(Pos_foto)
-    remove_frame = RDK.Item("temp_frame")
-    remove_frame.Delete()
-    
-    # Clean up
-    time.sleep(2)
-    arduino_comm.close_connection()
\ No newline at end of file
+arduino.send_zero()
+arduino.close()
+executor.close()
+session.close()
@@ -0,0 +1,37 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Per-step latency log for the pick cycle, so cycle-time changes can be
+# measured instead of guessed.
+
+import time
+from contextlib import contextmanager
+
+
+class CycleTimer:
+    """Times named steps of one cycle and prints them as they finish."""
+
+    def __init__(self, name="cycle"):
+        self.name = name
+        self.steps = []
+        self.t_start = time.perf_counter()
+
+    @contextmanager
+    def step(self, name):
+        """Time the enclosed block as one step."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            self.steps.append((name, dt))
+            print(f"[timing] {self.name}/{name}: {dt * 1000:.0f} ms")
+
+    def total(self):
+        return time.perf_counter() - self.t_start
+
+    def summary(self):
+        """Print every step and the total wall time of the cycle."""
+        total = self.total()
+        print(f"[timing] {self.name} summary ({total:.2f} s):")
+        for name, dt in self.steps:
+            print(f"    {name:<20} {dt * 1000:8.0f} ms  {100 * dt / max(total, 1e-9):5.1f}%")
@@ -0,0 +1,96 @@
+# Author: Joaquin Cisneros & Rodrigo Manriquez
+# Date: November 2025
+# Description: Framed PC <-> Arduino protocol for the gripper (reference implementation).
+#
+# One frame per line, plain ASCII so the sketch can build it with Serial.print:
+#
+#     $<type>,<seq>,<payload>*<crc>\n
+#
+#   type    C = command (PC -> Arduino)     A = ack, N = nack (Arduino -> PC, same seq as the command)
+#           E = event (Arduino -> PC, the Arduino's own sequence counter)
+#   seq     0-65535, decimal
+#   payload commands: VALVE=1, VALVE=0, PING    events: READY, FRESA_SI, LISTO
+#   crc     CRC-8 (poly 0x07, init 0x00) of everything between '$' and '*', two hex digits
+#
+# The PC retries a command with the same seq when its ACK does not arrive in time. The
+# Arduino keeps the seq of the last command it executed: a command with that seq again is
+# a retry and gets the same ACK without being executed a second time (VALVE=1 must not
+# restart the vacuum cycle). A frame failing the CRC is NACKed and not executed.
+#
+# Lines that do not start with '$' are the legacy free-text messages ("Listo", "FresaSi").
+
+MSG_COMMAND = "C"
+MSG_ACK = "A"
+MSG_NACK = "N"
+MSG_EVENT = "E"
+MSG_TYPES = (MSG_COMMAND, MSG_ACK, MSG_NACK, MSG_EVENT)
+
+SEQ_MOD = 65536
+
+
+class ProtocolError(ValueError):
+    """Malformed frame or CRC mismatch."""
+
+
+def crc8(data):
+    """CRC-8, polynomial 0x07, initial value 0 (same as the Arduino side)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(msg_type, seq, payload=""):
+    """Build one frame, newline included, as bytes."""
+    if msg_type not in MSG_TYPES:
+        raise ProtocolError(f"Unknown message type {msg_type!r}")
+    if any(c in payload for c in "$*,\n"):
+        raise ProtocolError(f"Reserved character in payload {payload!r}")
+    body = f"{msg_type},{seq % SEQ_MOD},{payload}"
+    return f"${body}*{crc8(body.encode()):02X}\n".encode()
+
+
+def decode_frame(line):
+    """Parse one frame (bytes or str, with or without newline) into (type, seq, payload)."""
+    if isinstance(line, bytes):
+        line = line.decode(errors="ignore")
+    line = line.strip()
+    if not line.startswith("$") or "*" not in line:
+        raise ProtocolError(f"Not a frame: {line!r}")
+
+    body, _, crc_text = line[1:].rpartition("*")
+    try:
+        crc = int(crc_text, 16)
+    except ValueError:
+        raise ProtocolError(f"Bad CRC field in {line!r}")
+    if crc != crc8(body.encode()):
+        raise ProtocolError(f"CRC mismatch in {line!r}")
+
+    parts = body.split(",", 2)
+    if len(parts) != 3 or parts[0] not in MSG_TYPES or not parts[1].isdigit():
+        raise ProtocolError(f"Malformed frame {line!r}")
+    return parts[0], int(parts[1]), parts[2]
+
+
+def is_frame(line):
+    if isinstance(line, bytes):
+        return line.lstrip().startswith(b"$")
+    return line.lstrip().startswith("$")
+
+
+if __name__ == "__main__":
+    # Loopback round-trip against the simulated firmware, with per-command latency
+    import arduino_comm
+
+    link = arduino_comm.ArduinoLink(port="sim")
+    link.open()
+    for _ in range(5):
+        link.request("PING")
+    link.send_one()
+    link.wait_for_ready(timeout=3)
+    link.send_zero()
+    link.close()
+    for payload, stats in link.latency_stats().items():
+        print(f"{payload:<8} n={stats['n']:<3} p50={stats['p50_ms']:.2f} ms  max={stats['max_ms']:.2f} ms")
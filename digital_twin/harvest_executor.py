@@ -0,0 +1,125 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Harvest executor that overlaps perception with motion. While the arm
+# carries a strawberry to the box and shakes it off, a worker thread checks the next
+# planned targets against a frame grabbed at the post-pick pose, so the camera and the
+# detector are not idle during the place phase. Targets that are no longer seen are
+# cancelled before the arm goes for them.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MATCH_TOL = 25.0  # mm, max distance between a planned target and a fresh detection
+
+
+def _xyz(pose):
+    pose = np.asarray(pose, dtype=np.float64)
+    return pose[:3, 3] if pose.shape == (4, 4) else pose[:3]
+
+
+def still_valid(targets_base, detections_base, T_base_cam, camera_matrix, image_size, tol=MATCH_TOL):
+    """
+    For each planned target (base frame, 4x4 or xyz in mm) decide if it is still valid.
+    Targets that project inside the image must have a detection within tol;
+    targets outside the field of view cannot be checked and are kept.
+    """
+    T_cam_base = np.linalg.inv(np.asarray(T_base_cam, dtype=np.float64))
+    width, height = image_size
+    detected = np.array([_xyz(d) for d in detections_base]).reshape(-1, 3)
+
+    valid = []
+    for target in targets_base:
+        xyz = _xyz(target)
+        x, y, z = (T_cam_base @ np.append(xyz, 1.0))[:3]
+        if z <= 0:
+            valid.append(True)
+            continue
+        u = camera_matrix[0, 0] * x / z + camera_matrix[0, 2]
+        v = camera_matrix[1, 1] * y / z + camera_matrix[1, 2]
+        if not (0 <= u < width and 0 <= v < height):
+            valid.append(True)
+            continue
+        valid.append(bool(len(detected)) and float(np.min(np.linalg.norm(detected - xyz, axis=1))) <= tol)
+    return valid
+
+
+class HarvestExecutor:
+    """
+    Runs ordered lists of targets with perception pipelined behind the place motion.
+    place()                  carry to the box and release
+    snapshot() -> obj        grab a frame at the post-pick pose (runs on the robot thread); the
+                             camera must still face the plant, targets out of view are kept
+    verify(obj, targets)     -> list of bool, one per target still planned (worker thread)
+    The pick depends on the inspection the tour came from, so it is given to run().
+    """
+
+    def __init__(self, place, snapshot, verify):
+        self.place = place
+        self.snapshot = snapshot
+        self.verify = verify
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self.busy = {"pick": 0.0, "place": 0.0, "perception": 0.0, "waiting": 0.0}
+        self.wall = 0.0
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _timed(self, stage, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.busy[stage] += time.perf_counter() - t0
+
+    def run(self, targets, pick):
+        """
+        Pick every target in order with pick(target) -> bool (approach and grasp; False
+        if the gripper does not confirm). Returns a dict with the picked and cancelled
+        targets and whether the tour was aborted (the caller should re-inspect).
+        """
+        t_start = time.perf_counter()
+        remaining = list(targets)
+        picked, cancelled, aborted = [], [], False
+
+        while remaining:
+            target = remaining.pop(0)
+            if not self._timed("pick", pick, target):
+                aborted = True
+                break
+            picked.append(target)
+
+            # Check the rest of the tour while the arm is busy placing
+            future = None
+            if remaining:
+                frame = self.snapshot()
+                future = self._pool.submit(self._timed, "perception", self.verify, frame, list(remaining))
+
+            self._timed("place", self.place)
+
+            if future is not None:
+                try:
+                    valid = self._timed("waiting", future.result)
+                except Exception as e:
+                    # A failed check cannot cancel anything: keep the tour as planned
+                    print(f"Could not verify the remaining targets ({e!r}), keeping them.")
+                    valid = [True] * len(remaining)
+                gone = [t for t, ok in zip(remaining, valid) if not ok]
+                remaining = [t for t, ok in zip(remaining, valid) if ok]
+                if gone:
+                    print(f"Cancelled {len(gone)} target(s) no longer seen.")
+                    cancelled += gone
+
+        self.wall += time.perf_counter() - t_start
+        return {"picked": picked, "cancelled": cancelled, "aborted": aborted}
+
+    def utilization(self):
+        """Share of wall time each stage was busy (perception overlaps the place stage)."""
+        wall = max(self.wall, 1e-9)
+        return {stage: t / wall for stage, t in self.busy.items()}
+
+    def report(self):
+        print(f"[executor] wall {self.wall:.2f} s")
+        for stage, share in self.utilization().items():
+            print(f"    {stage:<11} {self.busy[stage]:7.2f} s  {100 * share:5.1f}%")
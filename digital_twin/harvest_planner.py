@@ -0,0 +1,129 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Multi-target harvest planning. Takes every ripe strawberry found in one
+# inspection shot, moves the poses to the robot base frame and orders the picks with a
+# nearest-neighbour tour improved by 2-opt. Pure Python + numpy so it can be run and
+# checked without RoboDK (see the demo at the bottom).
+
+import numpy as np
+
+
+def to_base_frame(poses_cam, T_base_cam):
+    """Camera-frame 4x4 poses -> robot base frame, using the camera pose in the base frame."""
+    T_base_cam = np.asarray(T_base_cam, dtype=np.float64)
+    return [T_base_cam @ np.asarray(pose, dtype=np.float64) for pose in poses_cam]
+
+
+def euclidean_cost(a, b):
+    """Straight-line distance between two positions or 4x4 poses."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    if a.shape == (4, 4):
+        a, b = a[:3, 3], b[:3, 3]
+    return float(np.linalg.norm(a - b))
+
+
+def joint_cost(a, b):
+    """
+    Joint-space travel between two configurations (deg).
+    The largest joint move sets the duration of a synchronized MoveJ.
+    """
+    return float(np.max(np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64))))
+
+
+def tour_cost(order, nodes, start, cost):
+    """Cost of visiting nodes in the given order, starting at start (open path)."""
+    total = 0.0
+    prev = start
+    for i in order:
+        total += cost(prev, nodes[i])
+        prev = nodes[i]
+    return total
+
+
+def nearest_neighbour(nodes, start, cost):
+    """Greedy tour: always go to the cheapest unvisited node."""
+    remaining = list(range(len(nodes)))
+    order = []
+    prev = start
+    while remaining:
+        nxt = min(remaining, key=lambda i: cost(prev, nodes[i]))
+        remaining.remove(nxt)
+        order.append(nxt)
+        prev = nodes[nxt]
+    return order
+
+
+def two_opt(order, nodes, start, cost, max_passes=50):
+    """Reverse segments of the open path while that makes it cheaper."""
+    order = list(order)
+    best = tour_cost(order, nodes, start, cost)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 1, len(order)):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                c = tour_cost(candidate, nodes, start, cost)
+                if c < best - 1e-9:
+                    order, best = candidate, c
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def plan_tour(nodes, start, cost=euclidean_cost):
+    """Nearest-neighbour tour refined with 2-opt. Returns the visiting order (indices)."""
+    if not nodes:
+        return []
+    return two_opt(nearest_neighbour(nodes, start, cost), nodes, start, cost)
+
+
+def plan_harvest(poses_cam, T_base_cam, start=None, ik=None):
+    """
+    Order every target of one inspection shot.
+    poses_cam: camera-frame 4x4 poses (mm). ik: optional function base-frame pose -> joints
+    (None if unreachable); with it the tour minimizes joint-space travel, otherwise Cartesian
+    travel. start is where the robot is before the first pick (joints with ik, a base-frame
+    pose without); by default the tour starts at the first target.
+    Returns (order, skipped): indices into poses_cam to pick, and unreachable indices.
+    """
+    poses_base = to_base_frame(poses_cam, T_base_cam)
+
+    if ik is None:
+        nodes, reachable, skipped, cost = poses_base, list(range(len(poses_base))), [], euclidean_cost
+    else:
+        nodes, reachable, skipped, cost = [], [], [], joint_cost
+        for i, pose in enumerate(poses_base):
+            sol = ik(pose)
+            if sol is None:
+                skipped.append(i)
+            else:
+                nodes.append(np.asarray(sol, dtype=np.float64))
+                reachable.append(i)
+
+    if start is None and nodes:
+        start = nodes[0]
+    order = plan_tour(nodes, start, cost=cost)
+    return [reachable[i] for i in order], skipped
+
+
+if __name__ == "__main__":
+    # Demo on synthetic poses: 15 strawberries on a 40x30 cm plant, 35 cm from the camera
+    rng = np.random.default_rng(1)
+    poses = []
+    for _ in range(15):
+        T = np.eye(4)
+        T[:3, 3] = [rng.uniform(-200, 200), rng.uniform(-150, 150), rng.uniform(330, 380)]
+        poses.append(T)
+
+    T_base_cam = np.eye(4)
+    T_base_cam[:3, 3] = [300, 0, 400]
+    poses_base = to_base_frame(poses, T_base_cam)
+
+    start = poses_base[0]
+    detection = list(range(len(poses)))
+    greedy = nearest_neighbour(poses_base, start, euclidean_cost)
+    order, _ = plan_harvest(poses, T_base_cam)
+    for name, o in [("detection order", detection), ("nearest neighbour", greedy), ("NN + 2-opt", order)]:
+        print(f"{name:<18}: {tour_cost(o, poses_base, start, euclidean_cost):7.1f} mm")
+    print("order:", order)
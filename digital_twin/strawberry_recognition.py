@@ -4,170 +4,187 @@
 # performs object detection using a YOLOv8 model, and estimates the 3D pose of detected strawberries
 # using the PnP algorithm. 
 
+import os
+import sys
+import time
 import cv2 as cv
-from ultralytics import YOLO
 import numpy as np
-import pyrealsense2 as rs
-
-def robust_median_depth(depth_scale, depth_image, x1, y1, x2, y2):
-    """Compute the robust median depth in the specified ROI in meters."""
-    x1, y1 = max(0, x1), max(0, y1)
-    x2, y2 = min(depth_image.shape[1] - 1, x2), min(depth_image.shape[0] - 1, y2)
-    roi = depth_image[y1:y2+1, x1:x2+1]
-    roi = roi[roi > 0]  # Remove zero values
-    if len(roi) == 0:
-        return None
-    # Filter out outliers
-    lo, hi = np.percentile(roi, [5, 95])
-    roi = roi[(roi >= lo) & (roi <= hi)]
-    if roi.size == 0:
-        return None
-    return np.median(roi) * depth_scale # Convert to meters
-
-def main(second_iteration = False):
-    T_4x4 = None
-    # Initialize RealSense pipeline
-    pipeline = rs.pipeline()
-    config = rs.config()
-
-    # Enable color and depth streams
-    config.enable_stream(rs.stream.color, 1280, 720, rs.format.bgr8, 30)
-    config.enable_stream(rs.stream.depth, 1280, 720, rs.format.z16, 30)
-    profile = pipeline.start(config)
-    align = rs.align(rs.stream.color)
-
-    # Get stream intrinsics
-    depth_stream = profile.get_stream(rs.stream.depth).as_video_stream_profile()
-    color_stream = profile.get_stream(rs.stream.color).as_video_stream_profile()
-    depth_intr = depth_stream.get_intrinsics()
-    color_intr = color_stream.get_intrinsics()
-
-    depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
-
-    # Load YOLOv8 model
-    model = YOLO("vision/best.pt")
-    min_area = 500
-    max_area = 50000
-
-    width_strawberry = 0.0326 #m
-    height_strawberry = 0.0342 #m
-
-    # Construct camera matrix from RealSense intrinsics
-    camera_matrix = np.array([[color_intr.fx,     0.0,     color_intr.ppx],
-                [0.0,         color_intr.fy, color_intr.ppy],
-                [0.0,         0.0,     1.0      ]], dtype=np.float64)
-
-    #dist_coeffs = np.zeros(5, dtype=np.float32)
-    dist_coeffs = np.array(color_intr.coeffs[:5], dtype=np.float64)
-
-    for _ in range(20):
-        frames = pipeline.wait_for_frames()
-        frames = align.process(frames)
-
-    # Wait for a coherent pair of frames: depth and color
-    frames = pipeline.wait_for_frames()
-    frames = align.process(frames)
-    color_frame = frames.get_color_frame()
-    depth_frame = frames.get_depth_frame()
-
-    if not color_frame or not depth_frame:
-        print("No frame")
-        exit(1)
-
-    # Convert images to numpy arrays
-    frame = np.asanyarray(color_frame.get_data())
-    depth = np.asanyarray(depth_frame.get_data())
-
-    # Perform inference
-    results = model(frame, verbose=False)[0]
-
-    # Prepare candidate list (distance to image center) if second_iteration requested
-    img_h, img_w = frame.shape[:2]
-    img_cx, img_cy = img_w / 2.0, img_h / 2.0
-
-    candidates = []
-    for box in results.boxes:
-        cls_id = int(box.cls[0])
-        conf = float(box.conf[0])
-        label = model.names[cls_id]
-        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-        area = (x2 - x1) * (y2 - y1)
-
-        if conf > 0.60 and min_area < area < max_area and label in ["ripe"]:
-            bx_cx = (x1 + x2) / 2.0
-            bx_cy = (y1 + y2) / 2.0
-            dist_center = np.hypot(bx_cx - img_cx, bx_cy - img_cy)
-            candidates.append({
-                "box": box,
-                "x1": x1, "y1": y1, "x2": x2, "y2": y2,
-                "conf": conf, "label": label, "area": area,
-                "dist_center": dist_center
-            })
-
-    # If second_iteration requested, select the candidate closest to image center
-    if second_iteration and len(candidates) > 0:
-        candidates = [min(candidates, key=lambda c: c["dist_center"])]
-
-    # Process the selected candidates (if any)
-    for cand in candidates:
-        x1, y1, x2, y2 = cand["x1"], cand["y1"], cand["x2"], cand["y2"]
-        label = cand["label"]
-        conf = cand["conf"]
-        area = cand["area"]
-
-        Z = robust_median_depth(depth_scale, depth, x1, y1, x2, y2) # Meters
-        print("Depth (m):", Z)
-        if Z is None:
-            print(conf, "area:", area)
-            cv.rectangle(frame, (x1, y1), (x2, y2), (255,0,0), 2)
-            cv.putText(frame, f"{label} no depth", (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-            continue
-
-        image_points = np.array([
-            (x1, y1),         # Top-left
-            (x2, y1),         # Top-right
-            (x2, y2),         # Bottom-right
-            (x1, y2)          # Bottom-left
-        ], dtype="double")
-
-        object_points = np.array([
-            (-width_strawberry/2, -height_strawberry/2, 0.0),  # Top-left
-            ( width_strawberry/2, -height_strawberry/2, 0.0),  # Top-right
-            ( width_strawberry/2,  height_strawberry/2, 0.0),  # Bottom-right
-            (-width_strawberry/2,  height_strawberry/2, 0.0)   # Bottom-left
-        ])
-
-        # PnP with Z guess
-        rvec = np.zeros((3,1), dtype=np.float64)   # neutral initial orientation
-        tvec = np.array([[0],[0],[Z]], dtype=np.float64)
-        success, rvec, tvec = cv.solvePnP(
-            objectPoints=object_points,
-            imagePoints=image_points,
-            cameraMatrix=camera_matrix,
-            distCoeffs=dist_coeffs,
-            rvec=rvec,
-            tvec=tvec,
-            useExtrinsicGuess=True,              
-            flags=cv.SOLVEPNP_ITERATIVE
-        )
-
-        color = (0,255,255) if success else (0,0,255)
-        cv.rectangle(frame, (x1,y1), (x2,y2), color, 2)
-        cv.putText(frame, f"{label}", (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-
-        if success:
-            tvec[2,0] = Z # Adjust depth to box center
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vision"))
+from frame_source import RealSenseSource, ReplaySource, camera_matrix
+from batch_pose import batch_poses
+from onnx_detector import load_detector
+
+
+class PerceptionSession:
+    """
+    Long-lived camera + model session.
+    Opens the frame source and loads YOLO once, keeps the streams running
+    and answers detect() calls from the latest frames.
+    source is any frame_source source (live RealSense by default, or a
+    ReplaySource of a recording); model_path may be the .pt checkpoint or an
+    ONNX export (onnx_detector.py); threads sets the CPU inference threads.
+    detector replaces the model with an already loaded one (same call/results).
+    After each detect_all(), timings holds the seconds spent in each stage.
+    """
+
+    def __init__(self, model_path="vision/best.pt", warmup_frames=20, show=False, refine_pnp=False,
+                 threads=None, source=None, detector=None):
+        self.show = show
+        self.refine_pnp = refine_pnp
+        self.last_frame = None
+        self.timings = {}
+
+        # Live RealSense color + aligned depth unless a source is given
+        if source is None:
+            source = RealSenseSource(warmup_frames=warmup_frames)
+        self.source = source
+        self.depth_scale = source.depth_scale
+
+        # Load YOLOv8 model (PyTorch or ONNX Runtime)
+        self.model = detector if detector is not None else load_detector(model_path, threads=threads)
+        self.min_area = 500
+        self.max_area = 50000
+
+        # Camera matrix and distortion from the source intrinsics
+        self.camera_matrix, self.dist_coeffs = camera_matrix(source.intrinsics)
+        self.image_size = (source.intrinsics["width"], source.intrinsics["height"])
+
+        # Capture runs on its own thread from now on (replay: playback clock starts)
+        self.source.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Stop the frame source."""
+        if self.source is not None:
+            print("Capture stats:", self.source.stats())
+            self.source.stop()
+            self.source = None
+
+    def snapshot(self):
+        """Newest aligned pair captured after this call (i.e. after the robot stopped), or None."""
+        return self.source.latest(after=time.monotonic())
+
+    def detect_all(self, second_iteration=False, pair=None):
+        """
+        Detect ripe strawberries in the newest frame (or in a pair from snapshot()).
+        Returns one dict per candidate with a valid depth (box corners, conf, label,
+        Z in meters and "pose" as a 4x4 in mm), in detection order.
+        If second_iteration is True only the candidate closest to the image center is used.
+        """
+        timings = {}
+        t0 = time.perf_counter()
+        if pair is None:
+            pair = self.snapshot()
+            timings["wait"] = time.perf_counter() - t0
+
+        if pair is None:
+            print("No frame")
+            self.timings = timings
+            return []
+
+        # Capture-side stages (camera/align/copy, or decode on replay)
+        timings.update(pair.get("timings", {}))
+        frame = pair["color"]
+        depth = pair["depth"]
+        self.last_frame = frame
+
+        # Perform inference
+        t0 = time.perf_counter()
+        results = self.model(frame, verbose=False)[0]
+        timings["inference"] = time.perf_counter() - t0
+
+        # Prepare candidate list (distance to image center) if second_iteration requested
+        img_h, img_w = frame.shape[:2]
+        img_cx, img_cy = img_w / 2.0, img_h / 2.0
+
+        candidates = []
+        for box in results.boxes:
+            cls_id = int(box.cls[0])
+            conf = float(box.conf[0])
+            label = self.model.names[cls_id]
+            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+            area = (x2 - x1) * (y2 - y1)
+
+            if conf > 0.60 and self.min_area < area < self.max_area and label in ["ripe"]:
+                bx_cx = (x1 + x2) / 2.0
+                bx_cy = (y1 + y2) / 2.0
+                dist_center = np.hypot(bx_cx - img_cx, bx_cy - img_cy)
+                candidates.append({
+                    "box": box,
+                    "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                    "conf": conf, "label": label, "area": area,
+                    "dist_center": dist_center
+                })
+
+        # If second_iteration requested, select the candidate closest to image center
+        if second_iteration and len(candidates) > 0:
+            candidates = [min(candidates, key=lambda c: c["dist_center"])]
+        timings["filter"] = time.perf_counter() - t0 - timings["inference"]
+
+        # Depth and pose of every selected candidate in one batched pass
+        boxes = [(c["x1"], c["y1"], c["x2"], c["y2"]) for c in candidates]
+        depths, poses = batch_poses(depth, boxes, self.depth_scale, self.camera_matrix,
+                                    self.dist_coeffs, refine=self.refine_pnp, timings=timings)
+
+        t0 = time.perf_counter()
+
+        targets = []
+        for cand, Z, pose in zip(candidates, depths, poses):
+            x1, y1, x2, y2 = cand["x1"], cand["y1"], cand["x2"], cand["y2"]
+            label = cand["label"]
+            conf = cand["conf"]
+            area = cand["area"]
+
+            print("Depth (m):", None if np.isnan(Z) else Z)
+            if np.isnan(Z):
+                print(conf, "area:", area)
+                cv.rectangle(frame, (x1, y1), (x2, y2), (255,0,0), 2)
+                cv.putText(frame, f"{label} no depth", (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
+                continue
+
+            cv.rectangle(frame, (x1,y1), (x2,y2), (0,255,255), 2)
+            cv.putText(frame, f"{label}", (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
+
             T_4x4 = np.eye(4)
-            #T_4x4[:3, :3], _ = cv.Rodrigues(rvec)
-            T_4x4[:3, 3] = tvec.reshape(3)*1000  # Convert to mm
-            print("Pose (mm):")
-            print(T_4x4)
+            #T_4x4[:3, :3] = pose[:3, :3]
+            T_4x4[:3, 3] = pose[:3, 3]*1000  # Convert to mm
+            cand["Z"] = Z
+            cand["pose"] = T_4x4
+            targets.append(cand)
+
+        if self.show:
             cv.imshow("Strawberry Detection", frame)
+            cv.waitKey(1)
+        timings["draw"] = time.perf_counter() - t0
+        self.timings = timings
+
+        return targets
+
+    def detect(self, second_iteration=False):
+        """Pose (4x4, mm) of the first ripe strawberry with a valid depth, or None."""
+        targets = self.detect_all(second_iteration=second_iteration)
+        if not targets:
+            return None
+        T_4x4 = targets[0]["pose"]
+        print("Pose (mm):")
+        print(T_4x4)
+        return T_4x4
+
+def main(second_iteration = False, source=None):
+    """One-shot detection: opens a session (on source, live camera by default), detects once and shows the result."""
+    with PerceptionSession(source=source) as session:
+        T_4x4 = session.detect(second_iteration=second_iteration)
+        if T_4x4 is not None:
+            cv.imshow("Strawberry Detection", session.last_frame)
             cv.waitKey(0)
-            break
-                
-    pipeline.stop()
     return T_4x4
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python digital_twin/strawberry_recognition.py [recording_dir]  (replays a frame_source recording)
+    main(source=ReplaySource(sys.argv[1], realtime=False) if len(sys.argv) > 1 else None)
@@ -0,0 +1,164 @@
+# Author: Joaquin Cisneros & Rodrigo Manriquez
+# Date: November 2025
+# Description: ArduinoLink (arduino_comm.py) driven against the simulated firmware
+# (arduino_sim.py): boot/Ready, the FresaSi and Listo waits of the pick cycle in collector.py
+# with their deadlines, the timeout paths and reconnecting after the port drops.
+# The simulator runs ~10x faster than the real sketch to keep the tests short.
+# Usage: python -m pytest digital_twin/tests
+
+import os
+import sys
+import time
+
+import pytest
+import serial
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import arduino_comm
+import arduino_sim
+
+FAST = {"boot_time": 0.02, "fresa_period": 0.03, "vacuum_delay": 0.03}
+DEADLINE = 0.7  # collector.py FRESA_TIMEOUT / VACUUM_TIMEOUT, scaled like the simulator
+
+
+def make_link(**firmware_kwargs):
+    kwargs = dict(FAST, **firmware_kwargs)
+    link = arduino_comm.ArduinoLink(port="sim", serial_factory=lambda: arduino_sim.SimSerial(timeout=0.05, **kwargs))
+    link.open()
+    return link
+
+
+@pytest.fixture
+def link():
+    link = make_link()
+    yield link
+    link.close()
+
+
+def pick_cycle(link):
+    """The Arduino side of collector.pick_strawberry: FresaSi, open the valve, 3x Listo, close."""
+    if not link.wait_for_fresa_si(timeout=DEADLINE):
+        link.send_zero()
+        return "no_fresa"
+    link.send_one()
+    if not link.wait_for_ready(timeout=DEADLINE):
+        link.send_zero()
+        return "no_vacuum"
+    link.send_zero()
+    return "ok"
+
+
+def test_open_returns_once_ready():
+    t0 = time.monotonic()
+    link = make_link()
+    try:
+        # open() continues on the first message instead of sleeping BOOT_TIMEOUT
+        assert time.monotonic() - t0 < arduino_comm.BOOT_TIMEOUT / 2
+        assert link.framed  # READY arrived as a frame, commands are framed from now on
+        assert link.reconnects == 0
+    finally:
+        link.close()
+
+
+def test_pick_cycle_within_deadlines(link):
+    t0 = time.monotonic()
+    assert pick_cycle(link) == "ok"
+    assert time.monotonic() - t0 < 2 * DEADLINE
+    assert "VALVE=1" in link.latency_stats() and "VALVE=0" in link.latency_stats()
+
+
+def test_valve_follows_commands(link):
+    assert link.send_one()
+    assert link.wait_for_ready(timeout=DEADLINE)
+    assert link.ser.firmware.valve_open
+    assert link.send_zero()
+    deadline = time.monotonic() + DEADLINE
+    while link.ser.firmware.valve_open and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not link.ser.firmware.valve_open
+
+
+def test_listo_only_counts_after_the_valve_opened(link):
+    # Listo from an earlier cycle must not satisfy the next wait_for_ready
+    link.send_one()
+    assert link.wait_for_ready(timeout=DEADLINE)
+    link.send_zero()
+    link._notify("Listo")  # stale message
+    link.send_one()
+    assert link.wait_for_ready(timeout=DEADLINE, count=3)
+    link.send_zero()
+
+
+def test_fresa_si_timeout():
+    link = make_link(fail_fresa=True)
+    try:
+        t0 = time.monotonic()
+        assert pick_cycle(link) == "no_fresa"
+        assert DEADLINE <= time.monotonic() - t0 < DEADLINE + 0.5
+        assert not link.ser.firmware.valve_open
+    finally:
+        link.close()
+
+
+def test_vacuum_timeout_closes_the_valve():
+    link = make_link(fail_vacuum=True)
+    try:
+        t0 = time.monotonic()
+        assert pick_cycle(link) == "no_vacuum"
+        assert time.monotonic() - t0 >= DEADLINE
+        assert not link.ser.firmware.valve_open  # VALVE=0 was acked before send_zero returned
+    finally:
+        link.close()
+
+
+def test_legacy_text_firmware():
+    link = make_link(framed=False)
+    try:
+        assert not link.framed
+        assert pick_cycle(link) == "ok"
+    finally:
+        link.close()
+
+
+class DroppingSerial(arduino_sim.SimSerial):
+    """SimSerial whose port disappears after `drop_after` reads (USB cable pulled)."""
+
+    def __init__(self, drop_after, **kwargs):
+        super().__init__(**kwargs)
+        self.reads = 0
+        self.drop_after = drop_after
+
+    def readline(self):
+        self.reads += 1
+        if self.drop_after is not None and self.reads > self.drop_after:
+            self.close()
+            raise serial.SerialException("device disconnected")
+        return super().readline()
+
+
+def test_reconnects_after_the_port_drops(monkeypatch):
+    monkeypatch.setattr(arduino_comm, "BACKOFF_MIN", 0.02)
+    opened = []
+
+    def factory():
+        # First port drops after a few reads, the second open fails, the third stays up
+        if len(opened) == 1:
+            opened.append(None)
+            raise serial.SerialException("port busy")
+        port = DroppingSerial(drop_after=3 if not opened else None, timeout=0.05, **FAST)
+        opened.append(port)
+        return port
+
+    link = arduino_comm.ArduinoLink(port="sim", serial_factory=factory)
+    link.open()
+    try:
+        deadline = time.monotonic() + 2
+        while link.reconnects == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert link.reconnects == 1
+        assert len(opened) == 3 and opened[1] is None
+        assert link.ser is opened[2]
+        # The link works again after the reconnect
+        assert pick_cycle(link) == "ok"
+    finally:
+        link.close()
@@ -0,0 +1,172 @@
+# Author: Joaquin Cisneros & Rodrigo Manriquez
+# Date: November 2025
+# Description: Loopback tests of the framed gripper protocol (gripper_protocol.py) between
+# ArduinoLink.request and the simulated firmware: CRC rejection on both ends, NACK and
+# lost-ACK retries (a retried command runs once), late ACKs and seq correlation.
+# Usage: python -m pytest digital_twin/tests
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import arduino_comm
+import arduino_sim
+import gripper_protocol as proto
+
+FAST = {"boot_time": 0.02, "fresa_period": 0.05, "vacuum_delay": 0.03}
+TIMEOUT = 0.1
+
+
+class FaultySerial(arduino_sim.SimSerial):
+    """
+    SimSerial with faults on the first framed commands: `corrupt` frames get a payload
+    byte flipped on the way to the firmware, `drop_acks` ACKs are lost and `delay_acks`
+    ACKs reach the PC `ack_delay` seconds late.
+    """
+
+    def __init__(self, corrupt=0, drop_acks=0, delay_acks=0, ack_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.corrupt, self.drop_acks, self.delay_acks, self.ack_delay = corrupt, drop_acks, delay_acks, ack_delay
+        firmware_send = self.firmware._send_text
+
+        def send_text(text):
+            if text.startswith("$" + proto.MSG_ACK):
+                if self.drop_acks:
+                    self.drop_acks -= 1
+                    return
+                if self.delay_acks:
+                    self.delay_acks -= 1
+                    threading.Timer(self.ack_delay, firmware_send, (text,)).start()
+                    return
+            firmware_send(text)
+
+        self.firmware._send_text = send_text
+
+    def write(self, data):
+        if self.corrupt and data.startswith(b"$" + proto.MSG_COMMAND.encode()):
+            self.corrupt -= 1
+            star = data.index(b"*")
+            data = data[:star - 1] + bytes([data[star - 1] ^ 0x01]) + data[star:]
+        return super().write(data)
+
+
+@pytest.fixture
+def make_link():
+    links = []
+
+    def make(**faults):
+        link = arduino_comm.ArduinoLink(
+            port="sim", serial_factory=lambda: FaultySerial(timeout=0.05, **FAST, **faults))
+        link.open()
+        assert link.framed
+        links.append(link)
+        return link
+
+    yield make
+    for link in links:
+        link.close()
+
+
+def test_frame_round_trip_and_crc_reject():
+    frame = proto.encode_frame(proto.MSG_COMMAND, 70000, "VALVE=1")
+    assert proto.decode_frame(frame) == (proto.MSG_COMMAND, 70000 % proto.SEQ_MOD, "VALVE=1")
+    tampered = frame.replace(b"VALVE=1", b"VALVE=0")
+    with pytest.raises(proto.ProtocolError):
+        proto.decode_frame(tampered)
+    with pytest.raises(proto.ProtocolError):
+        proto.encode_frame(proto.MSG_COMMAND, 1, "A,B")
+
+
+def test_firmware_nacks_bad_crc_and_does_not_execute():
+    sent = []
+    firmware = arduino_sim.ArduinoFirmware(sent.append, boot_time=60)
+    try:
+        frame = proto.encode_frame(proto.MSG_COMMAND, 7, "VALVE=1").decode()
+        firmware.on_line(frame.replace("VALVE=1", "VALVE=0"))
+        assert proto.decode_frame(sent[-1]) == (proto.MSG_NACK, 7, "CRC")
+        assert firmware.executed == [] and not firmware.valve_open
+    finally:
+        firmware.stop()
+
+
+def test_firmware_runs_a_repeated_seq_once():
+    sent = []
+    firmware = arduino_sim.ArduinoFirmware(sent.append, boot_time=60, vacuum_delay=60)
+    try:
+        frame = proto.encode_frame(proto.MSG_COMMAND, 8, "VALVE=1").decode()
+        firmware.on_line(frame)
+        firmware.on_line(frame)  # retry: same seq
+        assert [proto.decode_frame(line) for line in sent] == [(proto.MSG_ACK, 8, "OK")] * 2
+        assert firmware.executed == ["VALVE=1"]
+        # A new seq is a new command again
+        firmware.on_line(proto.encode_frame(proto.MSG_COMMAND, 9, "VALVE=1").decode())
+        assert firmware.executed == ["VALVE=1", "VALVE=1"]
+    finally:
+        firmware.stop()
+
+
+def test_link_drops_corrupt_frames(make_link):
+    link = make_link()
+    link.ser._rx.put(b"$A,1,OK*00\r\n")
+    deadline = time.monotonic() + 1
+    while link.crc_errors == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert link.crc_errors == 1
+    assert link.request("PING", timeout=TIMEOUT) is not None
+
+
+def test_nack_then_retry(make_link):
+    link = make_link(corrupt=1)
+    assert link.request("VALVE=1", timeout=TIMEOUT, retries=1) is not None
+    assert link.ser.firmware.executed == ["VALVE=1"]
+    # Acked on the second attempt: not a clean RTT sample
+    assert "VALVE=1" not in link.latency_stats()
+
+
+def test_gives_up_after_the_retries(make_link):
+    link = make_link(corrupt=3)
+    assert link.request("VALVE=1", timeout=TIMEOUT, retries=2) is None
+    assert link.ser.firmware.executed == []
+
+
+def test_lost_ack_is_retried_without_running_the_command_twice(make_link):
+    link = make_link(drop_acks=1)
+    rtt = link.request("VALVE=1", timeout=TIMEOUT, retries=1)
+    assert rtt is not None and rtt >= TIMEOUT * 1000  # measured from the first send
+    assert link.ser.firmware.executed == ["VALVE=1"]
+
+
+def test_late_ack_of_the_first_attempt(make_link):
+    link = make_link(delay_acks=2, ack_delay=1.5 * TIMEOUT)
+    rtt = link.request("VALVE=1", timeout=TIMEOUT, retries=1)
+    # The late ACK of attempt 1 answers the request; the retry was not executed
+    assert rtt is not None and TIMEOUT * 1000 <= rtt < 3 * TIMEOUT * 1000
+    assert link.ser.firmware.executed == ["VALVE=1"]
+    assert "VALVE=1" not in link.latency_stats()
+
+
+def test_seq_correlation(make_link):
+    link = make_link(drop_acks=1)
+    # An ACK for another sequence number does not answer the pending request
+    seq = link._seq + 1
+    link.ser._rx.put(proto.encode_frame(proto.MSG_ACK, seq + 5, "OK").replace(b"\n", b"\r\n"))
+    assert link.request("PING", timeout=TIMEOUT, retries=0) is None
+    # Consecutive requests use consecutive seqs, each acked with its own
+    assert link.request("PING", timeout=TIMEOUT) is not None
+    assert link._seq == seq + 1
+    assert link.latency_stats()["PING"]["n"] == 1
+
+
+def test_stale_nack_does_not_end_a_later_attempt():
+    link = arduino_comm.ArduinoLink(port="sim")
+    t0 = time.monotonic()
+    entry = {"event": threading.Event(), "replies": [(proto.MSG_NACK, "CRC", t0 + 0.01)], "sent": [t0, t0 + 0.02]}
+    # Attempt 2 was written after the NACK arrived: that NACK belongs to attempt 1
+    assert link._wait_reply(entry, 1, 0.05) is None
+    assert link._wait_reply(entry, 0, 0.05) == (proto.MSG_NACK, "CRC", t0 + 0.01)
+    entry["replies"].append((proto.MSG_ACK, "OK", t0 + 0.03))
+    assert link._wait_reply(entry, 1, 0.05)[0] == proto.MSG_ACK
@@ -0,0 +1,96 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: HarvestExecutor (harvest_executor.py) with stub pick/place/verify, and
+# still_valid on a synthetic camera.
+# Usage: python -m pytest digital_twin/tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harvest_executor import HarvestExecutor, still_valid
+
+CAMERA_MATRIX = np.array([[600.0, 0.0, 320.0], [0.0, 600.0, 240.0], [0.0, 0.0, 1.0]])
+IMAGE_SIZE = (640, 480)
+# Three strawberries 500 mm in front of a camera at the base origin looking along +z
+TARGETS = [np.array([x, 0.0, 500.0]) for x in (-100.0, 0.0, 100.0)]
+
+
+def rot_x(degrees):
+    T = np.eye(4)
+    c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    T[1:3, 1:3] = [[c, -s], [s, c]]
+    return T
+
+
+def rot_z(degrees):
+    T = np.eye(4)
+    c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    T[:2, :2] = [[c, -s], [s, c]]
+    return T
+
+
+def make_executor(verify):
+    placed = []
+    executor = HarvestExecutor(place=lambda: placed.append(True), snapshot=lambda: "frame", verify=verify)
+    return executor, placed
+
+
+def test_cancels_targets_no_longer_seen():
+    executor, placed = make_executor(lambda frame, remaining: [t != "b" for t in remaining])
+    try:
+        result = executor.run(["a", "b", "c"], pick=lambda t: True)
+    finally:
+        executor.close()
+    assert result == {"picked": ["a", "c"], "cancelled": ["b"], "aborted": False}
+    assert len(placed) == 2
+
+
+def test_pick_is_per_tour():
+    executor, _ = make_executor(lambda frame, remaining: [True] * len(remaining))
+    try:
+        first = executor.run(["a", "b"], pick=lambda t: True)
+        second = executor.run(["c", "d"], pick=lambda t: t != "d")
+    finally:
+        executor.close()
+    assert first["picked"] == ["a", "b"] and not first["aborted"]
+    assert second["picked"] == ["c"] and second["aborted"]
+
+
+def test_verify_error_keeps_the_targets():
+    def verify(frame, remaining):
+        raise RuntimeError("camera timeout")
+
+    executor, placed = make_executor(verify)
+    try:
+        result = executor.run(["a", "b", "c"], pick=lambda t: True)
+    finally:
+        executor.close()
+    assert result == {"picked": ["a", "b", "c"], "cancelled": [], "aborted": False}
+    assert len(placed) == 3
+
+
+def test_disappeared_target_is_cancelled():
+    # The post-pick frame sees the first two strawberries but not the third one
+    def verify(T_base_cam, remaining):
+        detections = [t + [2.0, -3.0, 1.0] for t in TARGETS[:2]]
+        return still_valid(remaining, detections, T_base_cam, CAMERA_MATRIX, IMAGE_SIZE)
+
+    picked = []
+    executor = HarvestExecutor(place=lambda: None, snapshot=lambda: np.eye(4), verify=verify)
+    try:
+        result = executor.run(TARGETS, pick=lambda t: picked.append(t) or True)
+    finally:
+        executor.close()
+    assert [t[0] for t in result["cancelled"]] == [100.0]
+    assert [t[0] for t in picked] == [-100.0, 0.0]
+
+
+def test_targets_out_of_view_cannot_be_cancelled():
+    # From a camera swung away from the plant nothing can be checked, so nothing is cancelled:
+    # the snapshot has to be taken before the base rotates
+    swung = rot_z(100) @ rot_x(-90)  # optical axis turned away from the plant
+    assert still_valid(TARGETS, [], swung, CAMERA_MATRIX, IMAGE_SIZE) == [True, True, True]
+    assert still_valid(TARGETS, [], np.eye(4), CAMERA_MATRIX, IMAGE_SIZE) == [False, False, False]
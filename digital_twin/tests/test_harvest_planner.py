@@ -0,0 +1,102 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Unit tests of harvest_planner.py (nearest neighbour + 2-opt, IK skipping).
+# Usage: python -m pytest digital_twin/tests
+
+import itertools
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harvest_planner import (euclidean_cost, joint_cost, nearest_neighbour, plan_harvest, plan_tour,
+                             tour_cost, two_opt)
+
+
+def pose(x, y, z=0.0):
+    T = np.eye(4)
+    T[:3, 3] = [x, y, z]
+    return T
+
+
+def brute_force(nodes, start, cost):
+    return min(tour_cost(p, nodes, start, cost) for p in itertools.permutations(range(len(nodes))))
+
+
+def stub_ik(pose_base):
+    """Joints = the position itself; anything with x < 0 is out of reach."""
+    x, y, z = pose_base[:3, 3]
+    return None if x < 0 else [x, y, z]
+
+
+def test_nearest_neighbour_on_a_line():
+    nodes = [np.array([x, 0.0, 0.0]) for x in (30, 10, 20, 40)]
+    assert nearest_neighbour(nodes, np.zeros(3), euclidean_cost) == [1, 2, 0, 3]
+
+
+def test_two_opt_untangles_a_crossing():
+    # Corners of a square visited in a crossing order: 2-opt must reach the perimeter walk
+    nodes = [np.array(p, dtype=float) for p in [(0, 0), (10, 10), (10, 0), (0, 10)]]
+    start = np.array([0.0, 0.0])
+    crossing = [0, 1, 2, 3]
+    order = two_opt(crossing, nodes, start, euclidean_cost)
+    assert tour_cost(order, nodes, start, euclidean_cost) < tour_cost(crossing, nodes, start, euclidean_cost)
+    assert np.isclose(tour_cost(order, nodes, start, euclidean_cost), 30.0)
+
+
+def test_plan_tour_close_to_optimal_on_small_instances():
+    rng = np.random.default_rng(0)
+    optimal = 0
+    for _ in range(20):
+        nodes = [rng.uniform(0, 100, 2) for _ in range(6)]
+        start = rng.uniform(0, 100, 2)
+        order = plan_tour(nodes, start)
+        assert sorted(order) == list(range(6))
+        cost = tour_cost(order, nodes, start, euclidean_cost)
+        best = brute_force(nodes, start, euclidean_cost)
+        # 2-opt only ever improves the greedy tour, and stays near the optimum
+        assert cost <= tour_cost(nearest_neighbour(nodes, start, euclidean_cost), nodes, start, euclidean_cost) + 1e-9
+        assert cost <= best * 1.2
+        optimal += np.isclose(cost, best)
+    assert optimal >= 15
+
+
+def test_plan_tour_empty():
+    assert plan_tour([], np.zeros(3)) == []
+
+
+def test_plan_harvest_cartesian_visits_every_target():
+    poses = [pose(x, 0) for x in (50, 0, 100, 25)]
+    order, skipped = plan_harvest(poses, np.eye(4), start=pose(0, 0))
+    assert order == [1, 3, 0, 2]
+    assert skipped == []
+
+
+def test_plan_harvest_skips_unreachable_ik():
+    T_base_cam = np.eye(4)
+    T_base_cam[:3, 3] = [-50, 0, 0]          # targets with camera x < 50 end up at base x < 0
+    poses = [pose(x, 0) for x in (100, 10, 200, 40, 150)]
+    order, skipped = plan_harvest(poses, T_base_cam, start=np.zeros(3), ik=stub_ik)
+    assert skipped == [1, 3]
+    assert order == [0, 4, 2]
+
+
+def test_plan_harvest_uses_joint_cost_with_ik():
+    # Cartesian-close targets that are far apart in joint space: the tour follows the joints
+    joints = {0: [0, 0, 0], 1: [170, 0, 0], 2: [10, 0, 0]}
+
+    def ik(pose_base):
+        return joints[int(pose_base[0, 3])]
+
+    poses = [pose(i, 0) for i in range(3)]
+    order, skipped = plan_harvest(poses, np.eye(4), start=np.zeros(3), ik=ik)
+    assert order == [0, 2, 1]
+    assert skipped == []
+    assert joint_cost(joints[0], joints[1]) == 170
+
+
+def test_plan_harvest_nothing_reachable():
+    order, skipped = plan_harvest([pose(10, 0), pose(20, 0)], np.eye(4), ik=lambda p: None)
+    assert order == []
+    assert skipped == [0, 1]
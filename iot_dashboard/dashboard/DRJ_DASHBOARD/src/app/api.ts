@@ -0,0 +1,86 @@
+// Flask backend on the Raspberry Pi (iot_dashboard/raspberry/api.py)
+export const API_URL = 'http://10.25.15.228:5000';
+
+// 'YYYY-MM-DD HH:MM:SS' in local time, the format the API filters on
+export function toApiTime(d: Date): string {
+  const pad = (n: number) => String(n).padStart(2, '0');
+  return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ` +
+         `${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+}
+
+// One page of a listing endpoint (/sensors, /images, /errors)
+export async function fetchPage(path: string, params: Record<string, string | number> = {}) {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([k, v]) => query.set(k, String(v)));
+  const res = await fetch(`${API_URL}${path}?${query}`);
+  return res.json() as Promise<{ data: any[], next_cursor: string | null, error?: string }>;
+}
+
+// Every row of a listing endpoint, following next_cursor page by page
+export async function fetchAllPages(path: string, params: Record<string, string | number> = {}) {
+  const rows: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const page = await fetchPage(path, cursor ? { ...params, cursor } : params);
+    if (page.error) throw new Error(page.error);
+    rows.push(...page.data);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return rows;
+}
+
+export interface Updates {
+  sensors: any[];
+  images: any[];
+  leaf_area: any[];
+  errors: any[];
+  cursor: string;
+  more: boolean;
+}
+
+// Live updates: Server-Sent Events from /stream, falling back to polling /updates when the
+// server refuses the stream (503) or the browser has no EventSource. Returns a stop function.
+export function subscribeUpdates(onUpdate: (u: Updates) => void, pollMs = 30000): () => void {
+  let cursor: string | null = null;
+  let timer: any = null;
+  let source: EventSource | null = null;
+  let stopped = false;
+
+  const poll = async () => {
+    try {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const u = (await (await fetch(`${API_URL}/updates${query}`)).json()) as Updates;
+      if (u.cursor) {
+        cursor = u.cursor;
+        onUpdate(u);
+      }
+    } catch (error) {
+      console.error('Error polling updates:', error);
+    }
+    if (!stopped) timer = setTimeout(poll, pollMs);
+  };
+
+  if (typeof EventSource === 'undefined') {
+    poll();
+  } else {
+    source = new EventSource(`${API_URL}/stream`);
+    source.addEventListener('update', (e: MessageEvent) => {
+      const u = JSON.parse(e.data) as Updates;
+      cursor = u.cursor;
+      onUpdate(u);
+    });
+    source.onerror = () => {
+      // EventSource retries by itself; a closed source (e.g. 503) switches to polling
+      if (source && source.readyState === EventSource.CLOSED && !stopped) {
+        source = null;
+        poll();
+      }
+    };
+  }
+
+  return () => {
+    stopped = true;
+    if (source) source.close();
+    if (timer) clearTimeout(timer);
+  };
+}
@@ -5,6 +5,7 @@ import {
   IonCard, IonCardSubtitle, IonCardHeader, IonCardTitle, IonCardContent
 } from '@ionic/angular/standalone';
 import { ExploreContainerComponent } from '../explore-container/explore-container.component';
+import { API_URL, Updates, fetchAllPages, fetchPage, subscribeUpdates, toApiTime } from '../api';
 
 import {
   Chart, LineController, CategoryScale, LinearScale, PointElement,
@@ -38,6 +39,7 @@ Chart.register(LineController, CategoryScale, LinearScale, PointElement, LineEle
 })
 export class Tab1Page {
   imageUrl: string | null = null;
+  fullImageUrl: string | null = null;
 
   temperature: number | null = null;
   humidity: number | null = null;
@@ -48,14 +50,21 @@ export class Tab1Page {
 
 
   chart: Chart | null = null;
+  // date_time of each chart point, to place rows that arrive late at their time
+  chartTimes: string[] = [];
+
+  // Stops the live updates (SSE, or polling as a fallback)
+  unsubscribe: (() => void) | null = null;
 
   constructor() {}
 
-  ionViewWillEnter() {
-    this.loadData();
+  async ionViewWillEnter() {
+    await this.loadData();
+    this.unsubscribe = subscribeUpdates(u => this.applyUpdates(u));
   }
 
   ngOnDestroy() {
+    this.stopUpdates();
     if (this.chart) {
       this.chart.destroy();
       this.chart = null;
@@ -63,15 +72,55 @@ export class Tab1Page {
   }
 
   ionViewWillLeave() {
+    this.stopUpdates();
     if (this.chart) {
       this.chart.destroy();
       this.chart = null;
     }
   }
 
-  // Convert base64 → image
-  base64ToImage(base64: string) {
-    this.imageUrl = `data:image/png;base64,${base64}`;
+  stopUpdates() {
+    if (this.unsubscribe) {
+      this.unsubscribe();
+      this.unsubscribe = null;
+    }
+  }
+
+  // New rows pushed by the API: latest values, image and the chart, without reloading.
+  // Rows come in the order they were stored; one stored late can be older than what is shown.
+  applyUpdates(u: Updates) {
+    const lastSensor = u.sensors.length > 0 ? u.sensors[u.sensors.length - 1] : null;
+    if (lastSensor && (!this.date || lastSensor.date_time >= this.date)) {
+      this.date = lastSensor.date_time;
+      this.temperature = lastSensor.temp_air;
+      this.humidity = lastSensor.hum_air;
+      this.soilMoisture = lastSensor.hum_soil;
+      this.lightIntensity = lastSensor.light;
+    }
+    const lastImage = u.images.length > 0 ? u.images[u.images.length - 1] : null;
+    if (lastImage && (!this.date_img || lastImage.date_time >= this.date_img)) {
+      this.date_img = lastImage.date_time;
+      this.imageUrl = `${API_URL}${lastImage.medium_url}`;
+      this.fullImageUrl = `${API_URL}${lastImage.url}`;
+    }
+    if (this.chart && u.sensors.length > 0) {
+      const data = this.chart.data;
+      for (const row of u.sensors) {
+        // Insert at its time ('YYYY-MM-DD HH:MM:SS' sorts as text)
+        let at = this.chartTimes.length;
+        while (at > 0 && this.chartTimes[at - 1] > row.date_time) at--;
+        this.chartTimes.splice(at, 0, row.date_time);
+        data.labels!.splice(at, 0, new Date(row.date_time).toLocaleTimeString());
+        [row.temp_air, row.hum_air, row.hum_soil, row.light].forEach((v, i) => data.datasets[i].data.splice(at, 0, v));
+      }
+      // Keep a 24 h window (one reading every 10 minutes)
+      while (data.labels!.length > 144) {
+        this.chartTimes.shift();
+        data.labels!.shift();
+        data.datasets.forEach(d => d.data.shift());
+      }
+      this.chart.update();
+    }
   }
 
   // Fetch data from Flask backend
@@ -79,22 +128,14 @@ export class Tab1Page {
 // Fetch data from Flask backend
 async loadData() {
   try {
-    const res = await fetch('http://10.25.15.228:5000/alldata');
-    const data = await res.json();
-
-    // Extract sensorData and images
-    const sensorData = data.sensorData || [];
-    const images = data.images || [];
-
-    // Convert strings to Date and filter last 24h
+    // Only the last 24h of sensors, plus the newest sensor row and image metadata
     const now = new Date();
-    const last24h = sensorData.filter((entry: any) => {
-      const entryTime = new Date(entry.date_time);
-      return entryTime >= new Date(now.getTime() - 24 * 60 * 60 * 1000);
-    });
+    const last24h = await fetchAllPages('/sensors', { from: toApiTime(new Date(now.getTime() - 24 * 60 * 60 * 1000)) });
+    const latest = (await fetchPage('/sensors', { limit: 1, order: 'desc' })).data;
+    const images = (await fetchPage('/images', { limit: 1, order: 'desc' })).data;
 
     // Last sensor values (latest entry)
-    const lastSensor = sensorData.length > 0 ? sensorData[sensorData.length - 1] : null;
+    const lastSensor = latest.length > 0 ? latest[0] : null;
     if (lastSensor) {
       console.log('Last Sensor Data:', lastSensor);
       this.date = lastSensor.date_time;
@@ -105,15 +146,17 @@ async loadData() {
       console.log('data:', lastSensor);
     }
 
-    // Last image (latest entry)
-    const lastImage = images.length > 0 ? images[images.length - 1] : null;
+    // Last image (latest entry): medium thumbnail shown, full size opened on click
+    const lastImage = images.length > 0 ? images[0] : null;
     if (lastImage) {
       console.log('Last Image Data:', lastImage);
       this.date_img = lastImage.date_time;
-      this.base64ToImage(lastImage.image_base64);
+      this.imageUrl = `${API_URL}${lastImage.medium_url}`;
+      this.fullImageUrl = `${API_URL}${lastImage.url}`;
     }
 
     // Prepare chart data
+    this.chartTimes = last24h.map((e: any) => e.date_time);
     const labels = last24h.map((e: any) => new Date(e.date_time).toLocaleTimeString());
     const temperatureData = last24h.map((e: any) => e.temp_air);
     const humidityData = last24h.map((e: any) => e.hum_air);
@@ -7,6 +7,7 @@ import { IonContent, IonHeader, IonToolbar, IonGrid, IonIcon, IonRow, IonButton,
 import { Chart, registerables } from 'chart.js';
 import { addIcons } from 'ionicons';
 import { chevronBackOutline, chevronForwardOutline } from 'ionicons/icons';
+import { API_URL, fetchAllPages, toApiTime } from '../api';
 
 Chart.register(...registerables);
 
@@ -38,17 +39,21 @@ Chart.register(...registerables);
 })
 export class Tab2Page implements OnInit, OnDestroy {
   chart: Chart | null = null;
+  growthChart: Chart | null = null;
 
   startDate: string | null = null;
   endDate: string | null = null;
 
-  images: { timestamp: string, url: string }[] = [];
-  displayedImages: { timestamp: string, url: string }[] = [];
+  images: { timestamp: string, url: string, full: string }[] = [];
+  displayedImages: { timestamp: string, url: string, full: string }[] = [];
   currentPage = 0;
   pageSize = 10;
 
   sensorData: { timestamp: string, temperatureData: number, humidityData: number, soilData: number, lightData: number }[] = [];
 
+  // Leaf area computed on the Raspberry Pi at capture time (one point per photo)
+  leafData: { timestamp: string, leafFraction: number }[] = [];
+
   constructor(private http: HttpClient) {
     addIcons({
       'chevron-back-outline': chevronBackOutline,
@@ -73,6 +78,10 @@ export class Tab2Page implements OnInit, OnDestroy {
       this.chart.destroy();
       this.chart = null;
     }
+    if (this.growthChart) {
+      this.growthChart.destroy();
+      this.growthChart = null;
+    }
   }
 
   formatTimestamp(ts: string): string {
@@ -87,46 +96,66 @@ export class Tab2Page implements OnInit, OnDestroy {
 // ---------------------------
 // Fetch all data from Flask
 // ---------------------------
-loadAllData() {
-  this.http.get<any>('http://10.25.15.228:5000/alldata').subscribe(res => {
-    // Sensor data
-    this.sensorData = res.sensorData.map((row: any) => ({
-      timestamp: row.date_time,
-      temperatureData: row.temp_air,
-      humidityData: row.hum_air,
-      soilData: row.hum_soil,
-      lightData: row.light
+async loadAllData() {
+  try {
+    // Sensor data; the API returns hourly/daily means when the window is long
+    this.sensorData = await this.fetchSensors();
+
+    // Image metadata only; the grid loads small thumbnails, full size on click
+    const imageRows = await fetchAllPages('/images', { limit: 5000 });
+    this.images = imageRows.map((img: any) => ({
+      timestamp: img.date_time,
+      url: `${API_URL}${img.thumb_url}`,
+      full: `${API_URL}${img.url}`
     }));
 
-    // Images
-    this.images = res.images.map((img: any) => ({
-      timestamp: img.date_time,
-      url: `data:image/png;base64,${img.image_base64}`
+    const leafRows = await fetchAllPages('/leaf_area', { limit: 5000 });
+    this.leafData = leafRows.map((row: any) => ({
+      timestamp: row.date_time,
+      leafFraction: row.leaf_fraction
     }));
 
     // Initially display first page of images
     this.updateDisplayedImages();
 
-    // Initially draw chart with all sensor data
+    // Initially draw charts with all data
     this.updateChart();
-  });
+    this.updateGrowthChart(this.leafData);
+  } catch (error) {
+    console.error('Error loading data:', error);
+  }
+}
+
+// Sensor rows at the resolution the API picks for the window (raw, hourly or daily)
+async fetchSensors(params: Record<string, string> = {}) {
+  const rows = await fetchAllPages('/sensors', { ...params, resolution: 'auto', limit: 5000 });
+  return rows.map((row: any) => ({
+    timestamp: row.date_time,
+    temperatureData: row.temp_air,
+    humidityData: row.hum_air,
+    soilData: row.hum_soil,
+    lightData: row.light
+  }));
 }
 
 // ---------------------------
 // Apply filter based on selected dates
 // ---------------------------
-applyDateFilter() {
+async applyDateFilter() {
   if (!this.startDate || !this.endDate) return;
 
   const start = new Date(this.startDate);
+  start.setHours(0, 0, 0, 0);
   const end = new Date(this.endDate);
   end.setHours(23, 59, 59, 999); // include full end day
 
-  // Filter sensor data
-  const filteredSensor = this.sensorData.filter(d => {
-    const ts = new Date(d.timestamp);
-    return ts >= start && ts <= end;
-  });
+  // Sensor data of the window, at a finer resolution when the window is short
+  let filteredSensor: Tab2Page['sensorData'] = [];
+  try {
+    filteredSensor = await this.fetchSensors({ from: toApiTime(start), to: toApiTime(end) });
+  } catch (error) {
+    console.error('Error loading data:', error);
+  }
 
   const labels = filteredSensor.map(d => new Date(d.timestamp).toLocaleString());
   const tempData = filteredSensor.map(d => d.temperatureData);
@@ -134,8 +163,12 @@ applyDateFilter() {
   const soilData = filteredSensor.map(d => d.soilData);
   const lightData = filteredSensor.map(d => d.lightData);
 
-  // Update chart
+  // Update charts
   this.updateChart(labels, tempData, humData, soilData, lightData);
+  this.updateGrowthChart(this.leafData.filter(d => {
+    const ts = new Date(d.timestamp);
+    return ts >= start && ts <= end;
+  }));
 
   // Filter images
   const filteredImages = this.images.filter(img => {
@@ -171,6 +204,27 @@ applyDateFilter() {
     });
   }
 
+  // ---------------------------
+  // Growth curve (leaf area)
+  // ---------------------------
+  updateGrowthChart(points: { timestamp: string, leafFraction: number }[]) {
+    const ctx = document.getElementById('growthChart') as HTMLCanvasElement;
+    if (!ctx) return;
+
+    if (this.growthChart) this.growthChart.destroy();
+
+    this.growthChart = new Chart(ctx, {
+      type: 'line',
+      data: {
+        labels: points.map(d => new Date(d.timestamp).toLocaleString()),
+        datasets: [
+          { label: 'Leaf area (% of frame)', data: points.map(d => 100 * d.leafFraction), borderColor: 'green', fill: false }
+        ]
+      },
+      options: { responsive: true, maintainAspectRatio: false }
+    });
+  }
+
   // ---------------------------
   // Pagination for images
   // ---------------------------
@@ -7,6 +7,7 @@ import {
   IonCard, IonCardHeader, IonCardTitle, IonCardSubtitle, IonCardContent,
   IonButton, IonDatetime, IonItem, IonLabel, IonText
 } from '@ionic/angular/standalone';
+import { fetchAllPages } from '../api';
 
 @Component({
   selector: 'app-tab3',
@@ -60,22 +61,21 @@ export class Tab3Page {
   }
 
   // ---- Fetch all data ----
-  loadAllData() {
-    this.http.get<any>('http://10.25.15.228:5000/alldata').subscribe(res => {
-      this.errorData = (res.errors || []).map((e: any) => ({
+  async loadAllData() {
+    try {
+      // Newest first, page by page
+      const rows = await fetchAllPages('/errors', { limit: 5000, order: 'desc' });
+      this.errorData = rows.map((e: any) => ({
         date_time: e.date_time,
         error: e.error
       }));
 
-      // Sort descending
-      this.errorData.sort(
-        (a, b) => this.parseMySQLDate(b.date_time).getTime() - this.parseMySQLDate(a.date_time).getTime()
-      );
-
       // Show all initially
       this.filteredErrors = [...this.errorData];
       console.log('Loaded error data:', this.errorData);
-    });
+    } catch (error) {
+      console.error('Error loading error logs:', error);
+    }
   }
 
   // ---- Filtering ----
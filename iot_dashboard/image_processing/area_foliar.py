@@ -4,14 +4,24 @@ from datetime import datetime
 
 import cv2
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
-IMAGE_DIR = "C:\\Users\\dregg\\Downloads\\drj\\captures\\all_images"
+# Carpeta de capturas: variable de entorno AREA_FOLIAR_DIR o all_images del repositorio
+IMAGE_DIR = os.environ.get("AREA_FOLIAR_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "all_images"))
 IMAGE_PATTERN = "img_*.jpg"
 OUTPUT_CSV = "area_foliar_timeseries.csv"
 OUTPUT_FIG = "area_foliar_timeseries.png"
-SHOW_DEBUG = True
+SHOW_DEBUG = False  # True: muestra algunas máscaras y la gráfica en ventanas
+
+# Modo de análisis (ver leaf_area). Por defecto: imagen completa a resolución completa.
+#   roi   (x, y, w, h) fija de la planta, en píxeles de la imagen completa; None = todo el cuadro
+#   scale escala de procesamiento (0.5 = mitad de resolución); los conteos se reescalan
+#   gain  corrección de sesgo del modo rápido, calibrada con benchmarks/bench_leaf_fast.py
+ANALYSIS = {"roi": None, "scale": 1.0, "gain": 1.0}
+
+# Escalas que el decodificador JPEG entrega directamente (mucho más barato que decodificar y reducir)
+_REDUCED_READ = {0.5: cv2.IMREAD_REDUCED_COLOR_2, 0.25: cv2.IMREAD_REDUCED_COLOR_4,
+                 0.125: cv2.IMREAD_REDUCED_COLOR_8}
 
 def parse_timestamp_from_name(filename: str) -> datetime:
     """
@@ -30,7 +40,7 @@ def parse_timestamp_from_name(filename: str) -> datetime:
     return dt
 
 
-def compute_leaf_area_mask(image_bgr: np.ndarray) -> np.ndarray:
+def compute_leaf_area_mask(image_bgr: np.ndarray, kernel_size: int = 5) -> np.ndarray:
     """
     Crea una máscara binaria aproximando el área de planta.
     Estrategia simple:
@@ -48,13 +58,68 @@ def compute_leaf_area_mask(image_bgr: np.ndarray) -> np.ndarray:
     )
 
     # Morfología: abrir para quitar ruido pequeño, cerrar para rellenar huecos
-    kernel = np.ones((5, 5), np.uint8)
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
 
     return mask
 
+
+def read_image(path, scale=1.0):
+    """
+    Lee la imagen ya reducida por el decodificador cuando la escala lo permite.
+    Devuelve (imagen, escala a la que quedó decodificada) o (None, 1.0) si no se pudo leer.
+    """
+    decoded = min((s for s in _REDUCED_READ if s >= scale), default=1.0)
+    img = cv2.imread(path, _REDUCED_READ[decoded]) if decoded < 1.0 else cv2.imread(path)
+    return img, decoded
+
+
+def leaf_area(image_bgr, roi=None, scale=1.0, image_scale=1.0, gain=1.0, full_size=None):
+    """
+    Píxeles de hoja estimados a resolución completa: (leaf_pixels, total_pixels).
+    image_bgr puede venir ya reducida (image_scale, p. ej. de read_image); roi en píxeles
+    de la imagen completa. Solo se procesa la ROI, a `scale`, con el kernel morfológico
+    escalado igual, y el conteo se reescala por la razón de áreas (sin temporales de
+    tamaño completo). full_size=(w, h) si la reducida no es múltiplo exacto.
+    Una ROI que sale del cuadro se recorta a él; una ROI sin área dentro da ValueError.
+    """
+    h, w = image_bgr.shape[:2]
+    full_w, full_h = full_size or (round(w / image_scale), round(h / image_scale))
+
+    if roi is not None:
+        x, y, rw, rh = roi
+        # Recortar la ROI al cuadro completo antes de cortar (y de calcular su área)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + rw, full_w), min(y + rh, full_h)
+        crop = image_bgr[round(y0 * image_scale):round(y1 * image_scale),
+                         round(x0 * image_scale):round(x1 * image_scale)]
+        if x1 <= x0 or y1 <= y0 or crop.size == 0:
+            raise ValueError(f"ROI {tuple(roi)} sin área dentro de la imagen de {full_w}x{full_h}")
+        roi_area = (x1 - x0) * (y1 - y0)
+    else:
+        crop = image_bgr
+        roi_area = full_w * full_h
+
+    factor = scale / image_scale
+    if factor < 1.0:
+        crop = cv2.resize(crop, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+
+    # Mismo tamaño físico de kernel: 5 px a resolución completa, impar y mínimo 3
+    kernel_size = max(3, int(round(5 * scale)) | 1)
+    mask = compute_leaf_area_mask(crop, kernel_size)
+    leaf = cv2.countNonZero(mask) * roi_area / mask.size
+    return int(round(leaf * gain)), full_w * full_h
+
 def main():
+    # pandas/matplotlib solo para el reporte: los procesos del pool no los importan
+    import pandas as pd
+    import matplotlib
+    if not SHOW_DEBUG:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from leaf_batch import run
+
     pattern = os.path.join(IMAGE_DIR, IMAGE_PATTERN)
     files = sorted(glob.glob(pattern))
 
@@ -62,51 +127,23 @@ def main():
         print(f"No se encontraron imágenes con patrón: {pattern}")
         return
 
-    records = []
-
-    for i, f in enumerate(files, start=1):
-        print(f"[{i}/{len(files)}] Procesando {f} ...")
-        img = cv2.imread(f)
-        if img is None:
-            print(f"  ¡Advertencia! No se pudo leer {f}")
-            continue
-
-        mask = compute_leaf_area_mask(img)
-
-        total_pixels = mask.size
-        leaf_pixels = np.count_nonzero(mask == 255)
-        leaf_fraction = leaf_pixels / total_pixels
+    # Pool de procesos + caché: solo se procesan imágenes nuevas, el CSV se actualiza solo
+    records, processed = run(files, OUTPUT_CSV)
+    print(f"{processed} imágenes procesadas, {len(records)} en la serie")
 
-        timestamp = parse_timestamp_from_name(f)
-
-        records.append(
-            {
-                "file": os.path.basename(f),
-                "timestamp": timestamp,
-                "leaf_pixels": leaf_pixels,
-                "total_pixels": total_pixels,
-                "leaf_fraction": leaf_fraction,
-            }
-        )
-
-        # Muestra de depuración opcional
-        if SHOW_DEBUG and i % 20 == 0:  # por ejemplo, cada 20 imágenes
+    # Muestra de depuración opcional
+    if SHOW_DEBUG:
+        for f in files[19::20]:  # por ejemplo, cada 20 imágenes
+            img = cv2.imread(f)
             cv2.imshow("Imagen", img)
-            cv2.imshow("Mascara", mask)
+            cv2.imshow("Mascara", compute_leaf_area_mask(img))
             cv2.waitKey(0)
-            cv2.destroyAllWindows()
+        cv2.destroyAllWindows()
 
-    # Crear DataFrame
+    # Crear DataFrame (ya viene ordenado por timestamp / nombre)
     df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"].replace("", None))
 
-    # Ordenar por timestamp si existe (si no, por nombre)
-    if df["timestamp"].notna().all():
-        df = df.sort_values("timestamp")
-    else:
-        df = df.sort_values("file")
-
-    # Guardar CSV
-    df.to_csv(OUTPUT_CSV, index=False)
     print(f"\nCSV guardado en: {OUTPUT_CSV}")
 
     # Imprimir resumen simple
@@ -132,7 +169,8 @@ def main():
     plt.tight_layout()
     plt.savefig(OUTPUT_FIG, dpi=150)
     print(f"Gráfica guardada en: {OUTPUT_FIG}")
-    plt.show()
+    if SHOW_DEBUG:
+        plt.show()
 
 
 if __name__ == "__main__":
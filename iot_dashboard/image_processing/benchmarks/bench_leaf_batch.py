@@ -0,0 +1,65 @@
+"""
+Throughput (imágenes/s) del área foliar: el loop secuencial original contra el motor
+por lotes (pool de procesos, corrida en frío) y una corrida incremental con una sola
+imagen nueva, que es el caso de cada hora.
+
+Uso: python benchmarks/bench_leaf_batch.py [--limit N] [--workers N]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from area_foliar import IMAGE_DIR, IMAGE_PATTERN, compute_leaf_area_mask
+from leaf_batch import run
+
+
+def sequential(files):
+    """El loop de area_foliar.main antes del motor por lotes (sin ventanas)."""
+    for f in files:
+        img = cv2.imread(f)
+        if img is None:
+            continue
+        mask = compute_leaf_area_mask(img)
+        np.count_nonzero(mask == 255)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del área foliar por lotes")
+    parser.add_argument("--limit", type=int, default=None, help="usar solo las primeras N imágenes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(IMAGE_DIR, IMAGE_PATTERN)))[:args.limit]
+    print(f"{len(files)} imágenes, {args.workers} procesos ({os.cpu_count()} CPUs)")
+
+    t0 = time.perf_counter()
+    sequential(files)
+    t_seq = time.perf_counter() - t0
+    print(f"{'loop secuencial':<32}{len(files) / t_seq:8.1f} img/s  ({t_seq:.2f} s)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, cache_path = os.path.join(tmp, "serie.csv"), os.path.join(tmp, "cache.json")
+
+        t0 = time.perf_counter()
+        run(files[:-1], csv_path, cache_path, workers=args.workers)
+        t_cold = time.perf_counter() - t0
+        print(f"{'pool, caché vacío':<32}{(len(files) - 1) / t_cold:8.1f} img/s  ({t_cold:.2f} s)")
+
+        # Llega la foto de la hora siguiente: solo esa se procesa
+        t0 = time.perf_counter()
+        _, processed = run(files, csv_path, cache_path, workers=args.workers)
+        t_inc = time.perf_counter() - t0
+        print(f"{'incremental, 1 imagen nueva':<32}{len(files) / t_inc:8.1f} img/s  "
+              f"({t_inc:.2f} s, {processed} procesada)")
+
+
+if __name__ == "__main__":
+    main()
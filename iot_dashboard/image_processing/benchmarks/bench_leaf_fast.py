@@ -0,0 +1,89 @@
+"""
+Reporte exactitud vs. velocidad de los modos rápidos de area_foliar.leaf_area contra
+el resultado a resolución completa, sobre las imágenes de all_images.
+
+- Para cada modo (ROI sí/no, escala 1, 1/2, 1/4) mide imágenes/s (lectura + análisis) y
+  el error en fracción de área foliar. La ganancia de calibración se ajusta con las
+  imágenes pares y el error se reporta sobre las impares.
+- La referencia de los modos con ROI es la máscara a resolución completa de todo el
+  cuadro contada dentro de la ROI, así el error medido es solo el de la vía rápida
+  (Otsu sobre la ROI + reducción), no el de excluir el fondo.
+
+Nota: con la ROI el umbral de Otsu se calcula sin la pared del fondo y separa otra cosa
+(hoja contra sustrato en vez de claro contra oscuro), así que la serie no es comparable
+con la histórica; para continuar la serie usar solo la escala reducida.
+
+Uso: python benchmarks/bench_leaf_fast.py [--limit N] [--roi x,y,w,h]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from area_foliar import IMAGE_DIR, IMAGE_PATTERN, compute_leaf_area_mask, leaf_area, read_image
+
+# Cámara fija: la pared del fondo ocupa las primeras ~200 filas y Otsu la cuenta como
+# planta (es la zona más brillante). La ROI deja solo las macetas.
+PLANT_ROI = (0, 208, 1280, 512)
+
+
+def reference(files, roi):
+    """Fracción de hoja a resolución completa (máscara de todo el cuadro, contada en la ROI)."""
+    fractions = []
+    for f in files:
+        mask = compute_leaf_area_mask(cv2.imread(f))
+        if roi is not None:
+            x, y, w, h = roi
+            mask = mask[y:y + h, x:x + w]
+        fractions.append(cv2.countNonZero(mask) / (1280 * 720))
+    return np.array(fractions)
+
+
+def run_mode(files, roi, scale):
+    """Fracción de hoja por imagen y tiempo total (lectura + análisis)."""
+    fractions = []
+    t0 = time.perf_counter()
+    for f in files:
+        img, decoded = read_image(f, scale)
+        leaf, total = leaf_area(img, roi, scale, decoded)
+        fractions.append(leaf / total)
+    return np.array(fractions), time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exactitud vs. velocidad del área foliar")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--roi", default=",".join(map(str, PLANT_ROI)), help="x,y,w,h")
+    args = parser.parse_args()
+    roi = tuple(int(v) for v in args.roi.split(","))
+
+    files = [f for f in sorted(glob.glob(os.path.join(IMAGE_DIR, IMAGE_PATTERN)))[:args.limit]
+             if cv2.imread(f, cv2.IMREAD_REDUCED_GRAYSCALE_8) is not None]
+    cv2.setNumThreads(1)  # comparación justa, un núcleo como en la Raspberry Pi
+
+    print(f"{len(files)} imágenes; ROI (x, y, w, h) = {roi}, {100 * roi[2] * roi[3] / (1280 * 720):.0f} % del cuadro")
+    refs = {None: reference(files, None), roi: reference(files, roi)}
+    _, t_base = run_mode(files, None, 1.0)
+    print(f"referencia (completo x1): {len(files) / t_base:.1f} img/s\n")
+
+    print(f"{'modo':<22}{'img/s':>8}{'x':>6}{'gain':>8}{'MAE pp':>9}{'max pp':>9}{'err rel p95':>13}")
+    for roi_mode, scale in [(None, 0.5), (None, 0.25), (roi, 1.0), (roi, 0.5), (roi, 0.25)]:
+        base = refs[roi_mode]
+        frac, t = run_mode(files, roi_mode, scale)
+        # Calibración: ganancia ajustada en pares, evaluada en impares
+        gain = base[0::2].sum() / max(frac[0::2].sum(), 1e-12)
+        err = gain * frac[1::2] - base[1::2]
+        rel = np.abs(err) / np.maximum(base[1::2], 1e-6)
+        name = f"{'ROI' if roi_mode else 'completo'} x{scale:g}"
+        print(f"{name:<22}{len(files) / t:8.1f}{t_base / t:6.1f}{gain:8.3f}"
+              f"{100 * np.abs(err).mean():9.2f}{100 * np.abs(err).max():9.2f}{100 * np.percentile(rel, 95):12.1f}%")
+
+
+if __name__ == "__main__":
+    main()
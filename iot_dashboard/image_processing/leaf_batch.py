@@ -0,0 +1,170 @@
+"""
+Motor por lotes (sin ventanas) para el área foliar.
+
+- Reparte las imágenes en un pool de procesos.
+- Guarda un caché de resultados por archivo (ruta + mtime/tamaño, o hash del contenido),
+  así una nueva corrida solo procesa imágenes nuevas o modificadas.
+- Agrega las filas nuevas al CSV de la serie de tiempo en vez de reescribirlo
+  (solo lo reescribe si cambió una imagen ya procesada).
+- Modo de análisis configurable (ROI fija, escala reducida; ver area_foliar.ANALYSIS).
+  Cambiar el modo invalida el caché.
+
+Uso: python leaf_batch.py [carpeta] [--workers N] [--hash] [--roi x,y,w,h] [--scale 0.5] [--gain g]
+"""
+
+import os
+import csv
+import glob
+import json
+import hashlib
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from area_foliar import (ANALYSIS, IMAGE_DIR, IMAGE_PATTERN, OUTPUT_CSV,
+                         leaf_area, parse_timestamp_from_name, read_image)
+
+CSV_COLUMNS = ["file", "timestamp", "leaf_pixels", "total_pixels", "leaf_fraction"]
+CACHE_FILE = "area_foliar_cache.json"
+CACHE_VERSION = 1  # subir si cambia compute_leaf_area_mask: invalida todo el caché
+
+
+def file_key(path, use_hash=False):
+    """Identidad de una imagen para el caché: (mtime, tamaño) o el SHA-1 del contenido."""
+    st = os.stat(path)
+    if use_hash:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def analyze_file(path, config=None):
+    """Área foliar de una imagen. Devuelve la fila del CSV o None si no se pudo leer."""
+    config = config or ANALYSIS
+    img, decoded = read_image(path, config["scale"])
+    if img is None:
+        return None
+    leaf_pixels, total_pixels = leaf_area(img, config["roi"], config["scale"], decoded, config["gain"])
+    timestamp = parse_timestamp_from_name(path)
+    return {
+        "file": os.path.basename(path),
+        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S") if timestamp else "",
+        "leaf_pixels": leaf_pixels,
+        "total_pixels": total_pixels,
+        "leaf_fraction": leaf_pixels / total_pixels,
+    }
+
+
+def _init_worker():
+    # Un hilo de OpenCV por proceso: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+
+
+def _config_id(config):
+    return json.dumps({"roi": config["roi"] and list(config["roi"]), "scale": config["scale"],
+                       "gain": config["gain"]}, sort_keys=True)
+
+
+def load_cache(path, config):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != CACHE_VERSION or data.get("config") != _config_id(config):
+        return {}
+    return data["entries"]
+
+
+def save_cache(path, entries, config):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "config": _config_id(config), "entries": entries}, f)
+    os.replace(tmp, path)
+
+
+def sort_key(row):
+    return (row["timestamp"] or "", row["file"])
+
+
+def write_csv(path, rows, append=False):
+    exists = os.path.exists(path) and os.path.getsize(path) > 0
+    mode = "a" if append and exists else "w"
+    with open(path, mode, newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, lineterminator="\n")
+        if mode == "w":
+            writer.writeheader()
+        writer.writerows(sorted(rows, key=sort_key))
+
+
+def run(files, output_csv, cache_path=CACHE_FILE, workers=None, use_hash=False, config=None):
+    """
+    Procesa solo las imágenes nuevas o modificadas y actualiza el CSV.
+    Devuelve (todas las filas ordenadas, número de imágenes procesadas en esta corrida).
+    """
+    config = config or ANALYSIS
+    analyze = partial(analyze_file, config=config)
+    cache = load_cache(cache_path, config)
+    fresh = not cache  # sin caché el CSV existente no se puede confiar: se reescribe
+    current = {os.path.abspath(f): file_key(f, use_hash) for f in files}
+
+    todo = [p for p, key in current.items() if cache.get(p, {}).get("key") != key]
+    changed = any(p in cache for p in todo)
+    removed = [p for p in cache if p not in current]
+
+    new_rows = []
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            results = map(analyze, todo)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            results = pool.map(analyze, todo, chunksize=max(1, len(todo) // (4 * workers)))
+        for path, row in zip(todo, results):
+            # Las ilegibles también se guardan, para no reintentarlas hasta que cambien
+            cache[path] = {"key": current[path], "row": row}
+            if row is None:
+                print(f"  ¡Advertencia! No se pudo leer {path}")
+                continue
+            new_rows.append(row)
+        if workers > 1:
+            pool.shutdown()
+
+    for p in removed:
+        del cache[p]
+
+    rows = sorted((cache[p]["row"] for p in current if p in cache and cache[p]["row"]), key=sort_key)
+    if fresh or changed or removed or not os.path.exists(output_csv):
+        write_csv(output_csv, rows)
+    elif new_rows:
+        # Caso normal: solo hay fotos nuevas, se agregan al final
+        write_csv(output_csv, new_rows, append=True)
+    save_cache(cache_path, cache, config)
+    return rows, len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Área foliar por lotes, incremental")
+    parser.add_argument("image_dir", nargs="?", default=IMAGE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--hash", action="store_true", help="identificar imágenes por contenido, no por mtime")
+    parser.add_argument("--csv", default=OUTPUT_CSV)
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--roi", default=None, help="x,y,w,h de la planta en píxeles de la imagen completa")
+    parser.add_argument("--scale", type=float, default=ANALYSIS["scale"])
+    parser.add_argument("--gain", type=float, default=ANALYSIS["gain"])
+    args = parser.parse_args()
+    roi = tuple(int(v) for v in args.roi.split(",")) if args.roi else ANALYSIS["roi"]
+    config = {"roi": roi, "scale": args.scale, "gain": args.gain}
+
+    files = sorted(glob.glob(os.path.join(args.image_dir, IMAGE_PATTERN)))
+    if not files:
+        print(f"No se encontraron imágenes en: {args.image_dir}")
+        return
+    rows, processed = run(files, args.csv, args.cache, args.workers, args.hash, config)
+    print(f"{len(rows)} imágenes en la serie, {processed} procesadas en esta corrida. CSV: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
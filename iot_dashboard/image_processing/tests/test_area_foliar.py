@@ -0,0 +1,42 @@
+# Pruebas de area_foliar.leaf_area: ROI recortada al cuadro y ROI vacía.
+# Uso: python -m pytest iot_dashboard/image_processing/tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from area_foliar import leaf_area
+
+
+def frame(width=200, height=100):
+    """Mitad izquierda clara (hoja), mitad derecha oscura (fondo)."""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :width // 2] = 200
+    return image
+
+
+def test_roi_inside():
+    assert leaf_area(frame(), roi=(0, 0, 100, 100)) == (10000, 20000)
+
+
+def test_roi_past_the_frame_is_clipped():
+    # Solo la parte dentro del cuadro cuenta: la misma hoja que la ROI recortada a mano
+    inside = leaf_area(frame(), roi=(50, 0, 150, 100))
+    assert leaf_area(frame(), roi=(50, -40, 400, 300)) == inside
+    assert inside[0] == 5000
+
+
+def test_roi_past_the_frame_on_a_reduced_image():
+    reduced = frame()[::2, ::2]
+    leaf, total = leaf_area(reduced, roi=(-20, 0, 120, 100), image_scale=0.5)
+    assert total == 20000
+    assert leaf == pytest.approx(10000, rel=0.05)
+
+
+@pytest.mark.parametrize("roi", [(300, 0, 50, 50), (0, -60, 50, 50), (10, 10, 0, 20)])
+def test_roi_without_area(roi):
+    with pytest.raises(ValueError):
+        leaf_area(frame(), roi=roi)
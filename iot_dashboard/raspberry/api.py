@@ -1,63 +1,486 @@
-from flask import Flask, jsonify
+# Dashboard API. Production: gunicorn -c gunicorn.conf.py api:app  (from this folder)
+from flask import Flask, jsonify, redirect, request, Response, stream_with_context
 from flask_cors import CORS
-import mysql.connector
-from mysql.connector import Error
+import base64
+import decimal
+import json
+import os
+import time
+
+import db
+import live
+import rollup
+from response_cache import ResponseCache
 
 app = Flask(__name__)
 
 # Allow all devices in the network to access
-CORS(app, resources={r"/*": {"origins": "*"}})
-
-# Database connection parameters
-host = "10.25.15.228"
-port = 3306
-user = "strawberry"
-password = "1234567890"
-database = "strawberries"
-
-def get_connection():
-    return mysql.connector.connect(
-        host=host,
-        port=port,
-        user=user,
-        password=password,
-        database=database
-    )
-
-@app.route("/alldata", methods=["GET"])
-def get_all_data():
-    connection = None
-    try:
-        connection = get_connection()
-        cursor = connection.cursor(dictionary=True)
-
-        # Get all sensor data
-        cursor.execute("SELECT date_time, temp_air, hum_air, hum_soil, light FROM sensor_data ORDER BY date_time ASC")
-        all_sensor = cursor.fetchall()
-        print(f"Fetched {len(all_sensor)} sensor records.")
-
-        # Get all images
-        cursor.execute("SELECT date_time, image_base64 FROM plant_images ORDER BY date_time ASC")
-        all_images = cursor.fetchall()
-        print(f"Fetched {len(all_images)} image records.")
-
-        cursor.execute("SELECT date_time, error FROM error_logs ORDER BY date_time ASC")
-        all_errors = cursor.fetchall()
-        print(f"Fetched {len(all_errors)} error records.")
-
-        return jsonify({
-            "sensorData": all_sensor,
-            "images": all_images,
-            "errors": all_errors
-        })
-
-    except Error as e:
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Resolution"])
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# Columns returned by each listing endpoint (image payloads are served one by one)
+SENSOR_COLUMNS = "date_time, temp_air, hum_air, hum_soil, light"
+IMAGE_COLUMNS = "date_time, image_sha, bytes, width, height"
+ERROR_COLUMNS = "date_time, error"
+LEAF_COLUMNS = "date_time, leaf_pixels, total_pixels, leaf_fraction, mode"
+ROLLUP_COLUMNS = rollup.listing_columns()
+
+# Tables where several rows can share a date_time: their pages continue from
+# (date_time, row id) so rows tied at a page boundary are not skipped
+KEYED_TABLES = ("sensor_data", "plant_images", "error_logs")
+
+# resolution parameter of /sensors -> table
+RESOLUTION_TABLES = {"raw": "sensor_data", "hour": "sensor_hourly", "day": "sensor_daily"}
+AUTO_POINTS = 1000  # resolution=auto: finest table with at most this many rows in the window
+
+# One pool per worker process, connections opened on first use (after the fork)
+pool = db.ConnectionPool()
+# Listing responses, revalidated against the tables they read (response_cache.py)
+cache = ResponseCache(pool)
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return db.format_time(value) if hasattr(value, "strftime") else str(value)
+
+
+def _page_params():
+    """
+    Query parameters shared by the listing endpoints:
+    from / to    inclusive date_time bounds ('YYYY-MM-DD HH:MM:SS', or just a date)
+    limit        rows per page (default 1000, max 10000)
+    cursor       next_cursor of the previous page ('date_time|row id', or a date_time)
+    order        asc (default) or desc
+    """
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    order = request.args.get("order", "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+    return {
+        "from": request.args.get("from"),
+        "to": request.args.get("to"),
+        "cursor": _parse_cursor(request.args.get("cursor")),
+        "limit": limit,
+        "order": order,
+    }
+
+
+def _parse_cursor(cursor):
+    """next_cursor -> (date_time, row id or None)."""
+    if not cursor:
+        return None
+    date_time, _, key = cursor.partition("|")
+    if key and not key.isdigit():
+        raise ValueError("invalid cursor")
+    return date_time, int(key) if key else None
+
+
+def _row_key(table):
+    return db.row_id() if table in KEYED_TABLES else None
+
+
+def _page_query(table, columns, page):
+    conds, params = [], []
+    if page["from"]:
+        conds.append("date_time >= %s")
+        params.append(page["from"])
+    if page["to"]:
+        conds.append("date_time <= %s")
+        params.append(page["to"])
+    key = _row_key(table)
+    op = ">" if page["order"] == "asc" else "<"
+    if page["cursor"]:
+        # Keyset pagination: continue after the last row already sent
+        last_time, last_key = page["cursor"]
+        if key and last_key is not None:
+            # (date_time, key) > (last_time, last_key), written so the date_time index bounds the scan
+            conds.append(f"date_time {op}= %s AND (date_time {op} %s OR {key} {op} %s)")
+            params += [last_time, last_time, last_key]
+        else:
+            conds.append(f"date_time {op} %s")
+            params.append(last_time)
+
+    sql = f"SELECT {columns} FROM {table}"
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    # One extra row tells whether there is a next page
+    direction = page["order"].upper()
+    sql += f" ORDER BY date_time {direction}" + (f", {key} {direction}" if key else "") + " LIMIT %s"
+    params.append(page["limit"] + 1)
+    return sql, tuple(params)
+
+
+def _stream_page(pooled, cursor, limit, decorate=None):
+    """Stream {"data": [...], "next_cursor": ...} row by row, then give the connection back."""
+    finished = False
+    try:
+        yield '{"data":['
+        last, sent = None, 0
+        for row in db.iter_rows(cursor):
+            if sent == limit:
+                break
+            row["date_time"] = db.format_time(row["date_time"])
+            key = row.pop("row_key", None)
+            if decorate:
+                decorate(row)
+            yield ("," if sent else "") + json.dumps(row, default=_json_default)
+            last, sent = row["date_time"] if key is None else f"{row['date_time']}|{key}", sent + 1
+        else:
+            last = None  # result exhausted: this was the last page
+        cursor.fetchall()  # at most the look-ahead row, so the prepared statement can be reused
+        yield '],"next_cursor":' + json.dumps(last) + "}"
+        finished = True
+    finally:
+        # A client that hung up mid-stream leaves unread rows: drop that connection
+        pool.release(pooled, broken=not finished)
+
+
+def list_table(table, columns, decorate=None, page=None):
+    if page is None:
+        try:
+            page = _page_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    try:
+        pooled = pool.acquire()
+    except db.DB_ERRORS as e:
         return jsonify({"error": str(e)})
+    key = _row_key(table)
+    try:
+        cursor = pooled.query(*_page_query(table, f"{columns}, {key} AS row_key" if key else columns, page))
+    except db.DB_ERRORS as e:
+        pool.release(pooled, broken=True)
+        return jsonify({"error": str(e)})
+
+    body = _stream_page(pooled, cursor, page["limit"], decorate)
+    return Response(stream_with_context(body), mimetype="application/json")
+
+
+def _sensor_span(page):
+    """(first, last) date_time of the raw rows in the requested window, or None if empty."""
+    ends = []
+    with pool.connection() as pooled:
+        # Two index lookups; MIN() and MAX() in one query scan the whole window on SQLite
+        for order in ("asc", "desc"):
+            rows = pooled.query(*_page_query("sensor_data", "date_time", dict(page, cursor=None, limit=1, order=order))).fetchall()
+            if not rows:
+                return None
+            ends.append(rollup.parse_time(rows[0]["date_time"]))
+    return tuple(ends)
+
+
+@app.route("/sensors", methods=["GET"])
+@cache.cached("sensor_data")
+def get_sensors():
+    """
+    Extra parameters on top of the listing ones:
+    resolution   raw (default), hour, day (means plus min/max per bucket, from rollup.py)
+                 or auto: the finest one with at most `points` (default 1000) rows in the window
+    points       without resolution: the raw rows of the window downsampled with LTTB
+                 to this many (one response, no next_cursor)
+    The resolution used is in the X-Resolution header.
+    """
+    try:
+        page = _page_params()
+        resolution = request.args.get("resolution")
+        points = request.args.get("points")
+        points = int(points) if points is not None else None
+        if points is not None and points < 3:
+            raise ValueError("points must be at least 3")
+        if resolution not in (None, "auto", *RESOLUTION_TABLES):
+            raise ValueError("resolution must be raw, hour, day or auto")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if resolution is None and points is not None:
+        return _downsampled_sensors(page, points)
+
+    table = RESOLUTION_TABLES.get(resolution or "raw")
+    if resolution == "auto":
+        try:
+            span = _sensor_span(page)
+        except db.DB_ERRORS as e:
+            return jsonify({"error": str(e)})
+        table = rollup.pick_resolution(*span, points or AUTO_POINTS) if span else "sensor_data"
+
+    response = list_table(table, SENSOR_COLUMNS if table == "sensor_data" else ROLLUP_COLUMNS, page=page)
+    if isinstance(response, Response):
+        response.headers["X-Resolution"] = {v: k for k, v in RESOLUTION_TABLES.items()}[table]
+    return response
+
+
+def _downsampled_sensors(page, points):
+    sql, params = _page_query("sensor_data", SENSOR_COLUMNS, dict(page, cursor=None))
+    # Whole window, not a page: LTTB needs every row to choose the ones that keep the shape
+    sql = sql[:sql.index(" LIMIT")]
+    try:
+        with pool.connection() as pooled:
+            rows = list(db.iter_rows(pooled.query(sql, params[:-1])))
+    except db.DB_ERRORS as e:
+        return jsonify({"error": str(e)})
+    if page["order"] == "desc":
+        rows.reverse()
+    rows = rollup.lttb(rows, points)
+    if page["order"] == "desc":
+        rows.reverse()
+    for row in rows:
+        row["date_time"] = db.format_time(row["date_time"])
+    response = Response(json.dumps({"data": rows, "next_cursor": None}, default=_json_default),
+                        mimetype="application/json")
+    response.headers["X-Resolution"] = f"lttb:{points}"
+    return response
+
+
+def _image_urls(row):
+    sha = row.pop("image_sha")
+    if sha:
+        row["url"] = f"/blobs/{sha}"
+        row["thumb_url"] = f"/blobs/{sha}?variant=small"
+        row["medium_url"] = f"/blobs/{sha}?variant=medium"
+    else:
+        # Not migrated yet (migrate_images.py): only the base64 original exists
+        row["url"] = row["thumb_url"] = row["medium_url"] = f"/images/{row['date_time']}"
+
+
+@app.route("/images", methods=["GET"])
+@cache.cached("plant_images")
+def get_images():
+    # Metadata only; the dashboard loads the thumbnail first and the full image on demand
+    return list_table("plant_images", IMAGE_COLUMNS, decorate=_image_urls)
+
+
+@app.route("/blobs/<sha>", methods=["GET"])
+def get_blob(sha):
+    """Raw JPEG bytes of one stored variant, immutable: ETag is the content key."""
+    variant = request.args.get("variant", "full")
+    etag = f"{sha}-{variant}"
+    complete_length = None
+    if etag in request.if_none_match:
+        # Content-addressed, so a cached copy is always current: no database round trip
+        response = Response(status=304)
+    else:
+        try:
+            with pool.connection() as pooled:
+                rows = pooled.query("SELECT data FROM image_blobs WHERE sha = %s AND variant = %s",
+                                    (sha, variant)).fetchall()
+        except db.DB_ERRORS as e:
+            return jsonify({"error": str(e)})
+        if not rows:
+            return jsonify({"error": "image not found"}), 404
+        data = bytes(rows[0]["data"])
+        complete_length = len(data)
+        response = Response(data, mimetype="image/jpeg")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    # Answers If-None-Match with 304 and Range requests with 206
+    return response.make_conditional(request, accept_ranges=True, complete_length=complete_length)
+
+
+@app.route("/images/<path:date_time>", methods=["GET"])
+def get_image(date_time):
+    try:
+        with pool.connection() as pooled:
+            rows = pooled.query("SELECT image_sha, image_base64 FROM plant_images WHERE date_time = %s LIMIT 1",
+                                (date_time,)).fetchall()
+    except db.DB_ERRORS as e:
+        return jsonify({"error": str(e)})
+
+    row = rows[0] if rows else None
+
+    if row is None:
+        return jsonify({"error": "image not found"}), 404
+    if row["image_sha"]:
+        return redirect(f"/blobs/{row['image_sha']}", code=301)
+    # Browsers cache the decoded JPEG, which is 3/4 the size of the base64 text
+    response = Response(base64.b64decode(row["image_base64"]), mimetype="image/jpeg")
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
+@app.route("/leaf_area", methods=["GET"])
+@cache.cached("leaf_area")
+def get_leaf_area():
+    # Growth curve, computed on the Raspberry Pi at capture time (leaf_stage.py)
+    return list_table("leaf_area", LEAF_COLUMNS)
+
+
+@app.route("/errors", methods=["GET"])
+@cache.cached("error_logs")
+def get_errors():
+    return list_table("error_logs", ERROR_COLUMNS)
+
+
+# ---- Live updates: only what is newer than the client's cursor ----
+
+# feed name -> (table, columns, decorate)
+LIVE_FEEDS = {
+    "sensors": ("sensor_data", SENSOR_COLUMNS, None),
+    "images": ("plant_images", IMAGE_COLUMNS, _image_urls),
+    "leaf_area": ("leaf_area", LEAF_COLUMNS, None),
+    "errors": ("error_logs", ERROR_COLUMNS, None),
+}
+notifier = live.Notifier(cache, [table for table, _, _ in LIVE_FEEDS.values()])
+
+
+def _start_position(pooled, table, key, since):
+    """
+    Row id a feed continues from. since=None: the newest row (nothing sent, only the
+    cursor); a date_time (?since=, or a cursor from before row ids): every row inserted
+    since the first one with a later date_time.
+    """
+    if since is None:
+        rows = pooled.query(f"SELECT MAX({key}) AS last FROM {table}").fetchall()
+    else:
+        rows = pooled.query(f"SELECT MIN({key}) - 1 AS last FROM {table} WHERE date_time > %s", (since,)).fetchall()
+        if rows[0]["last"] is None:
+            rows = pooled.query(f"SELECT MAX({key}) AS last FROM {table}").fetchall()
+    return int(rows[0]["last"] or 0)
+
+
+def _updates(positions, limit):
+    """
+    Rows inserted after positions[feed] (a row id) for every feed, at most limit per feed,
+    each batch sorted by date_time. Positions follow insertion order, not capture time, so
+    rows that arrive late with an older date_time (spool uploads after an outage,
+    leaf_batch backfills) are still delivered, and rows sharing a date_time are not skipped.
+    A feed with no position starts at its newest row. Returns (payload, new positions, more).
+    """
+    payload, positions, more = {}, dict(positions), False
+    # Caveat on MySQL: ids are handed out at insert time, so a row of a transaction that
+    # commits after a later one's is skipped. Each table has one writer per device, which
+    # commits its batches in order.
+    key = db.row_id()
+    with pool.connection() as pooled:
+        for feed, (table, columns, decorate) in LIVE_FEEDS.items():
+            since = positions.get(feed)
+            if not isinstance(since, int):
+                positions[feed] = _start_position(pooled, table, key, since)
+                if since is None:
+                    payload[feed] = []
+                    continue
+            rows = pooled.query(f"SELECT {columns}, {key} AS row_key FROM {table} WHERE {key} > %s "
+                                f"ORDER BY {key} LIMIT %s", (positions[feed], limit + 1)).fetchall()
+            more = more or len(rows) > limit
+            rows = rows[:limit]
+            if rows:
+                positions[feed] = int(rows[-1]["row_key"])
+            for row in rows:
+                del row["row_key"]
+                row["date_time"] = db.format_time(row["date_time"])
+                if decorate:
+                    decorate(row)
+            payload[feed] = sorted(rows, key=lambda row: row["date_time"])
+    return payload, positions, more
+
+
+def _start_positions():
+    """Cursor from ?cursor= or Last-Event-ID (reconnecting EventSource), else ?since= for every feed."""
+    cursor = request.args.get("cursor") or request.headers.get("Last-Event-ID")
+    if cursor:
+        return live.decode_cursor(cursor)
+    since = request.args.get("since")
+    return {feed: since for feed in LIVE_FEEDS} if since else {}
+
+
+@app.route("/updates", methods=["GET"])
+def get_updates():
+    """
+    Sensor rows, images, leaf areas and errors stored since a cursor (or since=date_time).
+    {"sensors": [...], "images": [...], "leaf_area": [...], "errors": [...],
+     "cursor": "...", "more": true if a feed had more than limit new rows}
+    Without cursor or since the feeds start now: the first call only returns a cursor.
+    """
+    try:
+        positions = _start_positions()
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        payload, positions, more = _updates(positions, limit)
+    except db.DB_ERRORS as e:
+        return jsonify({"error": str(e)})
+    return Response(json.dumps(dict(payload, cursor=live.encode_cursor(positions), more=more),
+                               default=_json_default), mimetype="application/json")
+
+
+@app.route("/stream", methods=["GET"])
+def get_stream():
+    """
+    Server-Sent Events: an "update" event (same body as /updates, id = cursor) whenever
+    new rows arrive, starting with one that carries the initial cursor.
+    """
+    try:
+        positions = _start_positions()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not notifier.open_stream():
+        response = jsonify({"error": "too many live streams, poll /updates"})
+        response.status_code, response.headers["Retry-After"] = 503, "30"
+        return response
+
+    def events(positions):
+        try:
+            yield "retry: 5000\n\n"
+            version, deadline, first = notifier.version, time.monotonic() + live.STREAM_MAX_S, True
+            while time.monotonic() < deadline:
+                try:
+                    payload, positions, more = _updates(positions, DEFAULT_LIMIT)
+                except db.DB_ERRORS as e:
+                    yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+                    more = False
+                else:
+                    if first or any(payload.values()):
+                        cursor = live.encode_cursor(positions)
+                        body = json.dumps(dict(payload, cursor=cursor, more=more), default=_json_default)
+                        yield f"id: {cursor}\nevent: update\ndata: {body}\n\n"
+                        first = False
+                if more:
+                    continue
+                new = notifier.wait(version, min(live.HEARTBEAT_S, max(0.0, deadline - time.monotonic())))
+                if new == version:
+                    yield ": keep-alive\n\n"  # also detects a client that went away
+                version = new
+        finally:
+            notifier.close_stream()
+
+    response = Response(stream_with_context(events(positions)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # no proxy buffering of the event stream
+    return response
+
+
+@app.route("/status", methods=["GET"])
+def get_status():
+    # Pool and cache metrics of the worker that answered (each gunicorn worker has its own pool)
+    return jsonify({"pid": os.getpid(), "backend": db.BACKEND, "pool": pool.stats(), "cache": cache.stats(),
+                    "live_streams": notifier.streams})
+
+
+def upgrade_schema():
+    """Row ids of the keyed listing and live tables on MySQL (db.add_row_ids); run once before serving."""
+    try:
+        conn = db.get_connection()
+    except db.DB_ERRORS as e:
+        print(f"[WARN] schema not checked, database unavailable: {e}")
+        return
+    try:
+        db.add_row_ids(conn, sorted(set(KEYED_TABLES) | {table for table, _, _ in LIVE_FEEDS.values()}))
     finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+        conn.close()
+
 
 if __name__ == "__main__":
-    # Run on all network interfaces
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development only: single process, no debugger. Use gunicorn (see top) on the Raspberry Pi.
+    upgrade_schema()
+    app.run(host="0.0.0.0", port=5000, threaded=True)
@@ -0,0 +1,200 @@
+# Description: Response size and latency of the dashboard API against a local SQLite
+# stand-in seeded with months of greenhouse data (sensor row every 10 min, photo every
+# hour, a few errors a day). Compares the old /alldata handler, which returned every row
+# and every base64 photo in one JSON, with the paginated, streamed endpoints, and then
+# the dashboard polling pattern with the response cache: miss, hit and 304 revalidation.
+# Usage: python iot_dashboard/raspberry/benchmarks/bench_api.py [--months 2] [--image-kb 100]
+
+import argparse
+import base64
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "bench_strawberries.db"))
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flask import jsonify
+import api
+import db
+import response_cache
+
+
+def seed(path, months, image_kb):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = db.get_connection()
+    db.create_sqlite_schema(conn)
+
+    rng = random.Random(0)
+    end = datetime.datetime(2025, 11, 15)
+    start = end - datetime.timedelta(days=30 * months)
+    fmt = "%Y-%m-%d %H:%M:%S"
+
+    sensors, t = [], start
+    while t < end:
+        sensors.append((t.strftime(fmt), rng.uniform(15, 30), rng.uniform(40, 90), rng.uniform(20, 80), rng.uniform(0, 100)))
+        t += datetime.timedelta(minutes=10)
+    conn.executemany("INSERT INTO sensor_data VALUES (?, ?, ?, ?, ?)", sensors)
+
+    # Real photos are ~370 KB of JPEG; random bytes keep the database size manageable
+    payload = base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    n_images, t = 0, start
+    while t < end:
+        conn.execute("INSERT INTO plant_images (date_time, image_base64) VALUES (?, ?)", (t.strftime(fmt), payload))
+        n_images += 1
+        t += datetime.timedelta(hours=1)
+
+    errors = [((start + datetime.timedelta(minutes=rng.uniform(0, 60 * 24 * 30 * months))).strftime(fmt), "sensor timeout")
+              for _ in range(3 * 30 * months)]
+    conn.executemany("INSERT INTO error_logs VALUES (?, ?)", errors)
+    conn.commit()
+    conn.close()
+    print(f"Seeded {len(sensors)} sensor rows, {n_images} images, {len(errors)} errors "
+          f"({os.path.getsize(path) / 1e6:.0f} MB)")
+    return end
+
+
+@api.app.route("/alldata", methods=["GET"])
+def legacy_alldata():
+    """The handler the listing endpoints replaced: everything, fetchall(), one jsonify."""
+    connection = db.get_connection()
+    try:
+        cursor = db.dict_cursor(connection)
+        all_sensor = db.execute(cursor, "SELECT date_time, temp_air, hum_air, hum_soil, light FROM sensor_data ORDER BY date_time ASC").fetchall()
+        all_images = db.execute(cursor, "SELECT date_time, image_base64 FROM plant_images ORDER BY date_time ASC").fetchall()
+        all_errors = db.execute(cursor, "SELECT date_time, error FROM error_logs ORDER BY date_time ASC").fetchall()
+        return jsonify({"sensorData": all_sensor, "images": all_images, "errors": all_errors})
+    finally:
+        connection.close()
+
+
+def measure(client, url, repeats):
+    """Best-of-N wall time (ms) and body size (bytes) of one GET, body fully consumed."""
+    best, size = float("inf"), 0
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+        size = len(body)
+        assert response.status_code == 200, (url, response.status_code, body[:200])
+    return best, size
+
+
+def page_through(client, url):
+    """Follow next_cursor until the last page; returns total ms, bytes and pages."""
+    t0, size, pages, cursor = time.perf_counter(), 0, 0, None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        size += len(response.get_data())
+        pages += 1
+        cursor = response.get_json()["next_cursor"]
+        if cursor is None:
+            return (time.perf_counter() - t0) * 1000, size, pages
+
+
+def concurrent_load(client_factory, urls, threads, requests_per_thread):
+    """Several dashboards polling at once; returns per-request latencies (ms)."""
+    def worker(_):
+        client, times = client_factory(), []
+        for i in range(requests_per_thread):
+            t0 = time.perf_counter()
+            client.get(urls[i % len(urls)]).get_data()
+            times.append((time.perf_counter() - t0) * 1000)
+        return times
+    with ThreadPoolExecutor(threads) as ex:
+        return sorted(t for times in ex.map(worker, range(threads)) for t in times)
+
+
+def cache_polling(client, urls, repeats):
+    """Miss / hit / 304 latency per URL, then check that a new row invalidates the entry."""
+    api.cache.max_bytes = response_cache.MAX_BYTES
+    print(f"\n{'polled request':<28}{'miss ms':>10}{'hit ms':>10}{'304 ms':>10}{'KB':>10}")
+    for name, url in urls:
+        t0 = time.perf_counter()
+        first = client.get(url)
+        body = first.get_data()
+        miss = (time.perf_counter() - t0) * 1000
+        hit, _ = measure(client, url, repeats)
+        etag = first.headers["ETag"]
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            response = client.get(url, headers={"If-None-Match": etag})
+            response.get_data()
+            best = min(best, (time.perf_counter() - t0) * 1000)
+            assert response.status_code == 304, response.status_code
+        print(f"{name:<28}{miss:10.1f}{hit:10.1f}{best:10.1f}{len(body) / 1024:10.1f}")
+
+    # A new sensor row: after CHECK_EVERY the same conditional GET gets the new data
+    url = urls[0][1]
+    etag = client.get(url).headers["ETag"]
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    db.execute(cursor, "INSERT INTO sensor_data VALUES (%s, %s, %s, %s, %s)", ("2030-01-01 00:00:00", 20, 50, 50, 50))
+    db.touch(cursor, "sensor_data")
+    conn.commit()
+    conn.close()
+    time.sleep(api.cache.check_every)
+    status = client.get(url, headers={"If-None-Match": etag}).status_code
+    print(f"after a new sensor row: {status} (expected 200)")
+    stats = client.get("/status").get_json()["cache"]
+    print(f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['not_modified']} not modified, "
+          f"{stats['invalidations']} invalidations, {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard API size/latency benchmark")
+    parser.add_argument("--months", type=int, default=2)
+    parser.add_argument("--image-kb", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    end = seed(db.SQLITE_PATH, args.months, args.image_kb)
+    api.cache.max_bytes = 0  # first the uncached costs; cache_polling turns it on
+    last_day = (end - datetime.timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    client = api.app.test_client()
+
+    first_image = client.get("/images?limit=1&order=desc").get_json()["data"][0]["url"]
+    cases = [
+        ("legacy /alldata", "/alldata"),
+        ("sensors, last 24 h", f"/sensors?from={last_day}"),
+        ("latest sensor row", "/sensors?limit=1&order=desc"),
+        ("image list, 1 page", "/images?limit=10&order=desc"),
+        ("one image payload", first_image),
+        ("errors, 1 page", "/errors?limit=100&order=desc"),
+    ]
+
+    print(f"\n{'request':<28}{'ms':>10}{'KB':>12}")
+    for name, url in cases:
+        ms, size = measure(client, url, 1 if url == "/alldata" else args.repeats)
+        print(f"{name:<28}{ms:10.1f}{size / 1024:12.1f}")
+
+    ms, size, pages = page_through(client, "/sensors?limit=5000")
+    print(f"{f'all sensors, {pages} pages':<28}{ms:10.1f}{size / 1024:12.1f}")
+
+    # 16 dashboards refreshing at once against a pool of DB_POOL_SIZE connections
+    urls = [f"/sensors?from={last_day}", "/sensors?limit=1&order=desc", "/images?limit=10&order=desc", "/errors?limit=100"]
+    times = concurrent_load(api.app.test_client, urls, threads=16, requests_per_thread=20)
+    status = client.get("/status").get_json()["pool"]
+    print(f"\nconcurrent: {len(times)} requests, p50 {times[len(times) // 2]:.1f} ms, "
+          f"p95 {times[int(len(times) * 0.95)]:.1f} ms")
+    print(f"pool: size {status['size']}, opened {status['created']}, waits {status['waits']}, "
+          f"avg wait {status['avg_wait_ms']:.1f} ms, max wait {1000 * status['max_wait_s']:.1f} ms, "
+          f"timeouts {status['timeouts']}")
+
+    cache_polling(client, [("latest sensor row", "/sensors?limit=1&order=desc"),
+                           ("sensors, last 24 h", f"/sensors?from={last_day}"),
+                           ("sensors, 500 points (LTTB)", "/sensors?points=500"),
+                           ("image list, 1 page", "/images?limit=10&order=desc"),
+                           ("errors, 1 page", "/errors?limit=100&order=desc")], args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Description: Cost of the capture-time leaf-area stage (leaf_stage.py) on the sample
+# photos, per analysis scale: time per frame and peak memory of the numpy/OpenCV arrays it
+# allocates (tracemalloc), against the offline path that writes the JPEG and reads it back
+# before analysing it. One OpenCV thread, like the capture daemon on the Raspberry Pi.
+# Then runs FakeCamera -> spool -> uploader into a SQLite stand-in and checks that every
+# capture got its leaf_area row.
+# Usage: python iot_dashboard/raspberry/benchmarks/bench_leaf_stage.py [--limit 60]
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+os.environ["DB_BACKEND"] = "sqlite"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+from camera import CaptureService, FakeCamera, FAKE_IMAGE_DIR
+from leaf_stage import LeafStage
+from spool import Spool, Uploader
+
+
+def time_stage(frames, fn):
+    """Per-frame wall times (ms) and peak traced allocation (MB) of fn(frame)."""
+    times = []
+    for frame in frames:
+        t0 = time.perf_counter()
+        fn(frame)
+        times.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fn(frames[0])
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return np.array(times), peak
+
+
+def offline_path(tmp_path):
+    """What the batch job does with a capture: JPEG on disk, decoded again, full resolution."""
+    stage = LeafStage(scale=1.0)
+
+    def run(frame):
+        cv2.imwrite(tmp_path, frame)
+        return stage.measure(cv2.imread(tmp_path))
+    return run
+
+
+def end_to_end(n):
+    tmp = tempfile.mkdtemp()
+    db.SQLITE_PATH = os.path.join(tmp, "server.db")
+    conn = db.get_connection()
+    db.create_sqlite_schema(conn)
+    conn.close()
+
+    service = CaptureService(FakeCamera(), period=1.0)
+    stage = LeafStage(scale=0.5)
+    spool = Spool(os.path.join(tmp, "spool.db"))
+    for i in range(n):
+        ts = f"2025-11-01 {i // 60:02d}:{i % 60:02d}:00"
+        frame, _ = service.capture()
+        path = os.path.join(tmp, f"img_{i}.jpg")
+        cv2.imwrite(path, frame)
+        spool.put(f"img:{ts}", "image", {"date_time": ts, "path": path})
+        result, _ = stage.measure(frame)
+        spool.put(f"leaf:{ts}", "leaf", dict(result, date_time=ts))
+    service.close()
+
+    uploader = Uploader(spool, batch=8)
+    while spool.due():
+        uploader.upload_batch(spool.due())
+    spool.close()
+
+    cursor = db.get_connection().cursor()
+    images = db.execute(cursor, "SELECT COUNT(*) AS n FROM plant_images").fetchone()["n"]
+    leaves = db.execute(cursor, "SELECT COUNT(*) AS n FROM leaf_area").fetchone()["n"]
+    print(f"\nend to end: {n} captures -> {images} plant_images rows, {leaves} leaf_area rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture-time leaf-area stage benchmark")
+    parser.add_argument("--limit", type=int, default=60)
+    args = parser.parse_args()
+    cv2.setNumThreads(1)
+
+    paths = sorted(glob.glob(os.path.join(FAKE_IMAGE_DIR, "img_*.jpg")))[:args.limit]
+    frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {w}x{h}, frame itself {frames[0].nbytes / 1e6:.1f} MB\n")
+
+    tmp_jpeg = os.path.join(tempfile.mkdtemp(), "frame.jpg")
+    cases = [("write + read JPEG, x1", offline_path(tmp_jpeg))]
+    for scale in (1.0, 0.5, 0.25):
+        cases.append((f"in memory, x{scale:g}", LeafStage(scale=scale).measure))
+
+    print(f"{'stage':<24}{'median ms':>11}{'p95 ms':>9}{'peak MB':>9}")
+    for name, fn in cases:
+        times, peak = time_stage(frames, fn)
+        print(f"{name:<24}{np.median(times):11.1f}{np.percentile(times, 95):9.1f}{peak:9.1f}")
+
+    end_to_end(min(20, len(frames)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Description: Payload size and latency of the dashboard sensor charts with raw reads
+# against the hourly/daily rollups (rollup.py) and LTTB downsampling, on a SQLite
+# stand-in seeded with a season of 10-minute readings. Several greenhouses are simulated
+# by writing their readings into the same series (one row every 10/N minutes).
+# Also times the incremental rollup update that mqtt_ingest.py runs per batch.
+# Usage: python iot_dashboard/raspberry/benchmarks/bench_rollup.py [--months 6] [--greenhouses 4]
+
+import argparse
+import datetime
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "bench_rollup.db"))
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import api
+import db
+import rollup
+from bench_api import measure, page_through
+
+
+def seed(path, months, greenhouses):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = db.get_connection()
+    db.create_sqlite_schema(conn)
+
+    rng = random.Random(0)
+    end = datetime.datetime(2025, 11, 15)
+    start = end - datetime.timedelta(days=30 * months)
+    step = datetime.timedelta(minutes=10) / greenhouses
+    rows, t = [], start
+    while t < end:
+        # Daily cycle plus noise, so the downsampled charts have a shape to keep
+        day = math.sin(2 * math.pi * (t.hour + t.minute / 60) / 24)
+        rows.append((t.strftime(rollup.FMT), 22 + 6 * day + rng.gauss(0, 1), 65 - 15 * day + rng.gauss(0, 3),
+                     rng.uniform(20, 80), max(0.0, 100 * day + rng.gauss(0, 5))))
+        t += step
+    conn.executemany("INSERT INTO sensor_data VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+    t0 = time.perf_counter()
+    rollup.rebuild(conn)
+    rebuild_s = time.perf_counter() - t0
+    conn.close()
+    print(f"Seeded {len(rows)} sensor rows ({os.path.getsize(path) / 1e6:.0f} MB), "
+          f"full rollup rebuild {rebuild_s:.1f} s")
+    return end
+
+
+def incremental(repeats=20):
+    """One ingest batch: a new row, then the rollups of its day recomputed, in one transaction."""
+    conn = db.get_connection()
+    cursor = db.dict_cursor(conn)
+    last = rollup.parse_time(db.execute(cursor, "SELECT MAX(date_time) AS t FROM sensor_data").fetchone()["t"])
+    times = []
+    for i in range(repeats):
+        ts = (last + datetime.timedelta(minutes=10 * (i + 1))).strftime(rollup.FMT)
+        t0 = time.perf_counter()
+        db.execute(cursor, "INSERT INTO sensor_data VALUES (%s, %s, %s, %s, %s)", (ts, 20.0, 60.0, 50.0, 10.0))
+        rollup.refresh(cursor, ts, ts)
+        conn.commit()
+        times.append((time.perf_counter() - t0) * 1000)
+    conn.close()
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensor chart payload/latency: raw vs rollups vs LTTB")
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--greenhouses", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    end = seed(db.SQLITE_PATH, args.months, args.greenhouses)
+    week = (end - datetime.timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
+    client = api.app.test_client()
+
+    print(f"\n{'request':<34}{'ms':>10}{'KB':>10}{'points':>9}")
+    ms, size, pages = page_through(client, "/sensors?limit=5000")
+    print(f"{f'season, raw ({pages} pages)':<34}{ms:10.1f}{size / 1024:10.1f}{'all':>9}")
+    cases = [
+        ("season, resolution=auto", "/sensors?resolution=auto&limit=5000"),
+        ("season, resolution=day", "/sensors?resolution=day&limit=5000"),
+        ("season, points=1000 (LTTB)", "/sensors?points=1000"),
+        ("last week, raw", f"/sensors?from={week}&limit=10000"),
+        ("last week, resolution=auto", f"/sensors?from={week}&resolution=auto&limit=5000"),
+        ("last week, points=500 (LTTB)", f"/sensors?from={week}&points=500"),
+    ]
+    for name, url in cases:
+        ms, size = measure(client, url, args.repeats)
+        response = client.get(url)
+        n = len(response.get_json()["data"])
+        print(f"{name:<34}{ms:10.1f}{size / 1024:10.1f}{n:9d}  {response.headers.get('X-Resolution')}")
+
+    print(f"\nincremental rollup update per ingest batch: {incremental():.1f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
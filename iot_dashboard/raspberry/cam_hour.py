@@ -1,24 +1,15 @@
 import os
 import time
-import base64
+import argparse
 import datetime
 import pathlib
 import cv2
-import mysql.connector
-from mysql.connector import errorcode  # por si lo ocupas despu�s
 
-TIME_OFFSET = datetime.timedelta(hours=8)
-
-# MySQL
-DB_CFG = {
-    "host": "10.25.15.228",
-    "user": "strawberry",
-    "password": "1234567890",
-    "database": "strawberries",
-    "autocommit": True,
-}
+from camera import CaptureService, FakeCamera, UsbCamera, BURST
+from leaf_stage import LeafStage
+from spool import Spool, Uploader
 
-TABLE_NAME = "plant_images"
+TIME_OFFSET = datetime.timedelta(hours=8)
 
 SAVE_DIR = str(pathlib.Path.home() / "captures")
 
@@ -27,16 +18,8 @@ PARAMETROS = {
     "height": 720,
 }
 
-# ---- SQL m�nimas ----
-def get_db_connection():
-    return mysql.connector.connect(**DB_CFG)
-
-def insert_capture(conn, ts_str, img_b64):
-    ins = f"INSERT INTO `{TABLE_NAME}` (date_time, image_base64) VALUES (%s, %s)"
-    cur = conn.cursor()
-    cur.execute(ins, (ts_str, img_b64))
-    cur.close()
-# ---------------------
+# Captures land on multiples of this period since the epoch (every hour on the hour)
+CAPTURE_PERIOD = 3600
 
 def ensure_outdir(base_dir):
     day = datetime.date.today().strftime("%Y-%m-%d")
@@ -48,55 +31,90 @@ def timestamp_name(prefix="img"):
     now = datetime.datetime.now()
     return f"{prefix}_{now.strftime('%Y%m%d_%H%M%S')}.jpg"
 
-def take_photo_usb(width, height, out_path):
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise Exception("No se pudo abrir la c�mara")
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-    time.sleep(0.25)  # estabilizar
-    ok, frame = cap.read()
-    cap.release()
-    if not ok or frame is None:
-        raise Exception("No se pudo capturar la imagen")
+def save_photo(frame, out_path):
     if not cv2.imwrite(out_path, frame):
         raise Exception("No se pudo guardar la imagen")
 
-def main():
-    os.makedirs(SAVE_DIR, exist_ok=True)
+def next_boundary(now, period=CAPTURE_PERIOD):
+    """Next wall-clock instant that is a multiple of period, strictly after now."""
+    return (now // period + 1) * period
 
+def sleep_until(target):
+    # Re-check the clock while waiting so NTP corrections do not shift the schedule
     while True:
-        try:
-            t0 = time.time()
-
-            # 1) Tomar la foto
-            outdir = ensure_outdir(SAVE_DIR)
-            img_path = os.path.join(outdir, timestamp_name("img"))
-            take_photo_usb(PARAMETROS["width"], PARAMETROS["height"], img_path)
-
-            # 2) Convertir a base64 leyendo el .jpg
-            with open(img_path, "rb") as f:
-                img_bytes = f.read()
-            img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-
-            # 3) Guardar .txt con el base64
-            txt_path = img_path.rsplit(".", 1)[0] + ".txt"
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(img_b64)
-
-            # 4) Insertar en MySQL
-            ts_str = (datetime.datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
-            conn = get_db_connection()
-            try:
-                insert_capture(conn, ts_str, img_b64)
-            finally:
-                conn.close()
+        remaining = target - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 60))
 
-        except Exception as e:
-            print(f"[ERROR] {e}")
+def fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
 
-        # Dormir hasta la siguiente hora exacta
-        time.sleep(3600)
+def main(period=CAPTURE_PERIOD, burst=BURST, fake=False, leaf=None):
+    os.makedirs(SAVE_DIR, exist_ok=True)
+
+    # La cámara se reutiliza entre capturas; cada captura elige la mejor foto de una ráfaga
+    if fake:
+        camera = FakeCamera(width=PARAMETROS["width"], height=PARAMETROS["height"])
+    else:
+        camera = UsbCamera(0, PARAMETROS["width"], PARAMETROS["height"])
+    service = CaptureService(camera, period, burst=burst)
+
+    # Every record goes to the local spool first; the uploader sends it to the database
+    # in batches and keeps retrying while the server is unreachable
+    spool = Spool()
+    uploader = Uploader(spool).start()
+
+    try:
+        while True:
+            # Horario fijo al reloj: una captura lenta no retrasa las siguientes
+            sleep_until(next_boundary(time.time(), period))
+            ts_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                # 1) Tomar la foto
+                outdir = ensure_outdir(SAVE_DIR)
+                img_path = os.path.join(outdir, timestamp_name("img"))
+                frame, metrics = service.capture()
+                save_photo(frame, img_path)
+                fsync_file(img_path)
+                print(f"[cam] sharpness {metrics['sharpness']:.0f}, exposure {metrics['exposure']:.2f}")
+
+                # 2) Encolar; la subida (JPEG + miniaturas, image_store) la hace el uploader
+                spool.put(f"img:{ts_str}", "image", {"date_time": ts_str, "path": img_path})
+
+                # 3) Área foliar opcional sobre el frame en memoria (sin releer el JPEG)
+                if leaf is not None:
+                    result, elapsed = leaf.measure(frame)
+                    spool.put(f"leaf:{ts_str}", "leaf", dict(result, date_time=ts_str))
+                    print(f"[leaf] fraction {result['leaf_fraction']:.3f} in {1000 * elapsed:.0f} ms")
+
+            except Exception as e:
+                print(f"[ERROR] {e}")
+                spool.put(f"err:{ts_str}", "error", {"date_time": ts_str, "error": f"cam_hour: {e}"})
+
+            print(f"[spool] {spool.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        uploader.stop()
+        spool.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Captura periódica de fotos de las plantas")
+    parser.add_argument("--period", type=float, default=CAPTURE_PERIOD, help="segundos entre capturas")
+    parser.add_argument("--burst", type=int, default=BURST, help="fotos por ráfaga")
+    parser.add_argument("--fake", action="store_true", help="usar las fotos de all_images en lugar de la cámara")
+    parser.add_argument("--leaf-area", action="store_true", help="calcular el área foliar de cada captura")
+    parser.add_argument("--leaf-scale", type=float, default=None, help="escala del análisis (p. ej. 0.5)")
+    parser.add_argument("--leaf-roi", default=None, help="x,y,w,h de la planta en píxeles")
+    args = parser.parse_args()
+    if args.period < 1:
+        # date_time y las claves del spool tienen resolución de 1 s
+        parser.error("--period debe ser de al menos 1 s")
+    leaf = None
+    if args.leaf_area:
+        roi = tuple(int(v) for v in args.leaf_roi.split(",")) if args.leaf_roi else None
+        leaf = LeafStage(roi=roi, scale=args.leaf_scale)
+    main(args.period, args.burst, args.fake, leaf)
@@ -0,0 +1,375 @@
+# Database access shared by the dashboard API and the benchmarks.
+# MySQL on the greenhouse server by default; set DB_BACKEND=sqlite (and DB_PATH) to run
+# against a local SQLite file with the same tables, e.g. for benchmarks or offline tests.
+# Queries are written once with MySQL "%s" placeholders and converted for SQLite.
+# The API borrows connections from a bounded ConnectionPool (one per worker process)
+# and runs its hot queries as prepared statements cached on each pooled connection.
+
+import os
+import sqlite3
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+except ImportError:  # only needed for the MySQL backend
+    mysql = None
+    MySQLError = sqlite3.Error
+
+BACKEND = os.environ.get("DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("DB_PATH", "strawberries.db")
+
+# Database connection parameters
+host = "10.25.15.228"
+port = 3306
+user = "strawberry"
+password = "1234567890"
+database = "strawberries"
+
+# Pool sizing: one connection per request thread of a worker (see gunicorn.conf.py)
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+POOL_TIMEOUT = 5.0          # s a request waits for a free connection
+HEALTH_CHECK_IDLE = 30.0    # s idle after which a connection is pinged before reuse
+
+# Rows pulled from the server per round trip while streaming
+FETCH_BATCH = 500
+
+
+class PoolTimeout(Exception):
+    """No connection became free within POOL_TIMEOUT."""
+
+
+# Errors the API turns into a JSON error instead of a 500
+DB_ERRORS = (MySQLError, sqlite3.Error, PoolTimeout)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    date_time TEXT NOT NULL, temp_air REAL, hum_air REAL, hum_soil REAL, light REAL);
+CREATE INDEX IF NOT EXISTS idx_sensor_time ON sensor_data (date_time);
+-- Rollups of sensor_data, kept by rollup.py
+CREATE TABLE IF NOT EXISTS sensor_hourly (
+    date_time TEXT NOT NULL PRIMARY KEY, n INTEGER NOT NULL,
+    temp_air_n INTEGER, temp_air_min REAL, temp_air_max REAL, temp_air_sum REAL,
+    hum_air_n INTEGER, hum_air_min REAL, hum_air_max REAL, hum_air_sum REAL,
+    hum_soil_n INTEGER, hum_soil_min REAL, hum_soil_max REAL, hum_soil_sum REAL,
+    light_n INTEGER, light_min REAL, light_max REAL, light_sum REAL);
+CREATE TABLE IF NOT EXISTS sensor_daily (
+    date_time TEXT NOT NULL PRIMARY KEY, n INTEGER NOT NULL,
+    temp_air_n INTEGER, temp_air_min REAL, temp_air_max REAL, temp_air_sum REAL,
+    hum_air_n INTEGER, hum_air_min REAL, hum_air_max REAL, hum_air_sum REAL,
+    hum_soil_n INTEGER, hum_soil_min REAL, hum_soil_max REAL, hum_soil_sum REAL,
+    light_n INTEGER, light_min REAL, light_max REAL, light_sum REAL);
+CREATE TABLE IF NOT EXISTS plant_images (
+    date_time TEXT NOT NULL, image_base64 TEXT,
+    image_sha TEXT, bytes INTEGER, width INTEGER, height INTEGER);
+CREATE INDEX IF NOT EXISTS idx_images_time ON plant_images (date_time);
+CREATE TABLE IF NOT EXISTS image_blobs (
+    sha TEXT NOT NULL, variant TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (sha, variant));
+CREATE TABLE IF NOT EXISTS leaf_area (
+    date_time TEXT NOT NULL PRIMARY KEY, leaf_pixels INTEGER NOT NULL, total_pixels INTEGER NOT NULL,
+    leaf_fraction REAL NOT NULL, mode TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS error_logs (
+    date_time TEXT NOT NULL, error TEXT);
+CREATE INDEX IF NOT EXISTS idx_errors_time ON error_logs (date_time);
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT NOT NULL PRIMARY KEY, version INTEGER NOT NULL, changed TEXT NOT NULL);
+"""
+
+# Change counters bumped by touch(); created by every schema upgrade script on MySQL
+MYSQL_VERSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS data_versions (
+    name VARCHAR(64) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL,
+    changed DATETIME NOT NULL
+)"""
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def get_connection(autocommit=False):
+    """
+    New connection. Writers keep the default and commit their own transactions;
+    autocommit=True is for readers that are reused (the API pool): every query then
+    sees the latest committed rows instead of the snapshot of a transaction left open.
+    """
+    if BACKEND == "sqlite":
+        # Flask may hand the generator of a streamed response to another thread
+        conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False, isolation_level=None if autocommit else "")
+        conn.row_factory = _dict_row
+        return conn
+    return mysql.connector.connect(
+        host=host,
+        port=port,
+        user=user,
+        password=password,
+        database=database,
+        autocommit=autocommit
+    )
+
+
+def get_read_connection():
+    """Autocommit connection, the default factory of ConnectionPool."""
+    return get_connection(autocommit=True)
+
+
+def dict_cursor(conn):
+    """Cursor whose rows are dicts keyed by column name, on either backend."""
+    if BACKEND == "sqlite":
+        return conn.cursor()
+    return conn.cursor(dictionary=True)
+
+
+def execute(cursor, sql, params=()):
+    """Run a query written with %s placeholders."""
+    if BACKEND == "sqlite":
+        sql = sql.replace("%s", "?")
+    cursor.execute(sql, params)
+    return cursor
+
+
+def executemany(cursor, sql, rows):
+    """Run a query written with %s placeholders once per row of params, in one call."""
+    if BACKEND == "sqlite":
+        sql = sql.replace("%s", "?")
+    cursor.executemany(sql, rows)
+    return cursor
+
+
+def from_dual():
+    """FROM clause for a SELECT without a table (INSERT ... SELECT ... WHERE NOT EXISTS)."""
+    return "" if BACKEND == "sqlite" else "FROM DUAL"
+
+
+def row_id():
+    """
+    Unique, insertion-ordered key of the listing tables, for keyset cursors where
+    date_time alone repeats: rowid on SQLite, the id column added by add_row_ids on MySQL.
+    """
+    return "rowid" if BACKEND == "sqlite" else "id"
+
+
+def add_row_ids(conn, tables):
+    """Add the AUTO_INCREMENT id column (row_id()) and a (date_time, id) index on MySQL if missing."""
+    if BACKEND == "sqlite":
+        return  # every table already has its rowid
+    cursor = conn.cursor()
+    for table in tables:
+        execute(cursor, "SELECT COUNT(*) FROM information_schema.columns "
+                        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = 'id'", (table,))
+        if cursor.fetchone()[0]:
+            continue
+        # Existing rows are numbered in their stored order, new ones in insertion order
+        execute(cursor, f"ALTER TABLE {table} ADD COLUMN id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE, "
+                        f"ADD INDEX idx_{table}_time_id (date_time, id)")
+        print(f"Added id to {table}")
+    conn.commit()
+    cursor.close()
+
+
+def _is_missing_table(error):
+    # MySQL ER_NO_SUCH_TABLE, or SQLite's OperationalError
+    return getattr(error, "errno", None) == 1146 or "no such table" in str(error)
+
+
+_versions_missing_logged = False
+
+
+def touch(cursor, *tables):
+    """
+    Bump the data_versions counter of tables, in the writer's transaction, so the API
+    response cache (response_cache.py) sees changes that keep the newest date_time.
+    Skipped while data_versions does not exist (no upgrade script run yet on MySQL):
+    the writes go through and the cache falls back to the newest date_time.
+    """
+    global _versions_missing_logged
+    if BACKEND == "sqlite":
+        sql = ("INSERT INTO data_versions (name, version, changed) VALUES (%s, 1, %s) "
+               "ON CONFLICT(name) DO UPDATE SET version = version + 1, changed = excluded.changed")
+    else:
+        sql = ("INSERT INTO data_versions (name, version, changed) VALUES (%s, 1, %s) "
+               "ON DUPLICATE KEY UPDATE version = version + 1, changed = VALUES(changed)")
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for table in tables:
+        try:
+            execute(cursor, sql, (table, now))
+        except DB_ERRORS as e:
+            # Only the failed statement is rolled back, the writer's transaction goes on
+            if not _is_missing_table(e):
+                raise
+            if not _versions_missing_logged:
+                print(f"[db] data_versions missing, change counters not updated ({e}); "
+                      f"create it with python response_cache.py")
+                _versions_missing_logged = True
+            return
+
+
+def iter_rows(cursor, batch=FETCH_BATCH):
+    """Yield the result rows a batch at a time instead of fetchall()."""
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return
+        yield from rows
+
+
+def format_time(value):
+    """date_time as 'YYYY-MM-DD HH:MM:SS' (MySQL gives datetime, SQLite gives text)."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def _is_alive(conn):
+    try:
+        if BACKEND == "sqlite":
+            conn.execute("SELECT 1")
+            return True
+        conn.ping(reconnect=False)
+        return True
+    except DB_ERRORS:
+        return False
+
+
+class PooledConnection:
+    """A connection borrowed from the pool, with its prepared statements."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.statements = {}
+        self.last_used = time.monotonic()
+
+    def query(self, sql, params=()):
+        """
+        Execute sql (%s placeholders) as a prepared statement and return its dict cursor.
+        The statement is prepared on first use and reused by every later request that
+        borrows this connection. SQLite keeps its own statement cache, so a cursor is enough.
+        """
+        cursor = self.statements.get(sql)
+        if cursor is None:
+            if BACKEND == "sqlite":
+                cursor = self.raw.cursor()
+            else:
+                cursor = self.raw.cursor(prepared=True, dictionary=True)
+            self.statements[sql] = cursor
+        return execute(cursor, sql, params)
+
+    def close(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except DB_ERRORS:
+                pass
+        self.statements.clear()
+        try:
+            self.raw.close()
+        except DB_ERRORS:
+            pass
+
+
+class ConnectionPool:
+    """
+    Size-bounded pool of database connections, opened lazily.
+    acquire() blocks up to `timeout` s when every connection is in use; connections
+    idle longer than HEALTH_CHECK_IDLE are pinged and replaced if dead.
+    Connections are autocommit: on MySQL (REPEATABLE READ) a reused connection with an
+    open transaction would keep answering from the snapshot of its first query.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, factory=get_read_connection):
+        self.size = size
+        self.timeout = timeout
+        self.factory = factory
+        self._idle = []            # LIFO: the most recently used connection is the warmest
+        self._open = 0
+        self._cond = threading.Condition()
+        self.metrics = {"acquired": 0, "waits": 0, "wait_time_s": 0.0, "max_wait_s": 0.0,
+                        "timeouts": 0, "created": 0, "health_check_failures": 0}
+
+    def acquire(self):
+        t0 = time.monotonic()
+        waited = False
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - t0)
+                if remaining <= 0:
+                    self.metrics["timeouts"] += 1
+                    raise PoolTimeout(f"no free database connection after {self.timeout:.1f} s")
+                self._cond.wait(remaining)
+
+            wait = time.monotonic() - t0
+            self.metrics["acquired"] += 1
+            if waited:
+                self.metrics["waits"] += 1
+                self.metrics["wait_time_s"] += wait
+                self.metrics["max_wait_s"] = max(self.metrics["max_wait_s"], wait)
+
+            pooled = self._idle.pop() if self._idle else None
+            self._open += pooled is None  # reserve the slot before connecting outside the lock
+
+        if pooled is not None and time.monotonic() - pooled.last_used > HEALTH_CHECK_IDLE \
+                and not _is_alive(pooled.raw):
+            # The dead connection's slot goes to its replacement
+            with self._cond:
+                self.metrics["health_check_failures"] += 1
+            pooled.close()
+            pooled = None
+
+        if pooled is None:
+            try:
+                pooled = PooledConnection(self.factory())
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.metrics["created"] += 1
+        return pooled
+
+    def release(self, pooled, broken=False):
+        """Give a connection back; broken=True closes it instead (e.g. results left unread)."""
+        pooled.last_used = time.monotonic()
+        if not broken and pooled.raw.in_transaction:
+            # Not autocommit (custom factory): end the transaction so the next borrower gets a fresh snapshot
+            try:
+                pooled.raw.rollback()
+            except DB_ERRORS:
+                broken = True
+        with self._cond:
+            if broken:
+                self._open -= 1
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+        if broken:
+            pooled.close()
+
+    @contextmanager
+    def connection(self):
+        pooled = self.acquire()
+        broken = False
+        try:
+            yield pooled
+        except DB_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.metrics, size=self.size, open=self._open,
+                         idle=len(self._idle), in_use=self._open - len(self._idle))
+        stats["avg_wait_ms"] = 1000 * stats["wait_time_s"] / max(stats["waits"], 1)
+        return stats
+
+
+def create_sqlite_schema(conn):
+    conn.executescript(SQLITE_SCHEMA)
+    conn.commit()
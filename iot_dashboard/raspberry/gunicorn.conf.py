@@ -0,0 +1,22 @@
+# Gunicorn settings for the dashboard API: gunicorn -c gunicorn.conf.py api:app
+# A few worker processes, each with a small thread pool; every worker keeps its own
+# database connection pool with one connection per thread (DB_POOL_SIZE).
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("API_WORKERS", min(4, multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.environ.get("API_THREADS", 8))
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+
+# Streamed pages of large date ranges can take a while on the Raspberry Pi
+timeout = 120
+keepalive = 5
+accesslog = "-"
+
+
+def on_starting(server):
+    # Once in the master, before the workers fork: add the columns the listings page on
+    import api
+    api.upgrade_schema()
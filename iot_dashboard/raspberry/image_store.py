@@ -0,0 +1,71 @@
+# Content-addressed image store for the plant photos.
+# Each JPEG is stored once as binary in the image_blobs table, keyed by its SHA-256,
+# together with pre-generated thumbnails; plant_images only keeps the key and the size.
+# The blobs live in the database (not on the Raspberry Pi's disk) because the API runs
+# on the database server, and storing the same bytes twice is a no-op (idempotent).
+
+import hashlib
+
+import cv2
+import numpy as np
+
+import db
+
+# Thumbnail variants: longest side in pixels
+THUMB_SIZES = {"small": 320, "medium": 800}
+THUMB_QUALITY = 80
+VARIANTS = ("full",) + tuple(THUMB_SIZES)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_thumbnail(image, longest_side, quality=THUMB_QUALITY):
+    """Downscaled JPEG (bytes) of a decoded BGR image; never upscales."""
+    h, w = image.shape[:2]
+    scale = min(1.0, longest_side / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("could not encode thumbnail")
+    return buf.tobytes()
+
+
+def prepare(jpeg):
+    """
+    Everything to store for one photo: key, dimensions and the bytes of every variant.
+    The original JPEG is kept as is (no re-encoding).
+    """
+    image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("not a decodable image")
+    h, w = image.shape[:2]
+    variants = {"full": jpeg}
+    for name, side in THUMB_SIZES.items():
+        variants[name] = make_thumbnail(image, side)
+    return {"sha": sha256(jpeg), "width": w, "height": h, "bytes": len(jpeg), "variants": variants}
+
+
+def _insert_ignore():
+    return "INSERT OR IGNORE" if db.BACKEND == "sqlite" else "INSERT IGNORE"
+
+
+def save_blobs(cursor, photo):
+    """Insert the variants of a prepare()d photo; already stored variants are skipped."""
+    sql = f"{_insert_ignore()} INTO image_blobs (sha, variant, data) VALUES (%s, %s, %s)"
+    for variant, data in photo["variants"].items():
+        db.execute(cursor, sql, (photo["sha"], variant, data))
+
+
+def insert_capture(cursor, ts_str, photo):
+    """
+    Store a new photo taken at ts_str: blobs + one plant_images row pointing at them.
+    Idempotent: sending the same photo for the same time again adds nothing.
+    """
+    save_blobs(cursor, photo)
+    db.execute(cursor, "INSERT INTO plant_images (date_time, image_sha, bytes, width, height) "
+                       "SELECT %s, %s, %s, %s, %s " + db.from_dual() +
+                       " WHERE NOT EXISTS (SELECT 1 FROM plant_images WHERE date_time = %s AND image_sha = %s)",
+               (ts_str, photo["sha"], photo["bytes"], photo["width"], photo["height"], ts_str, photo["sha"]))
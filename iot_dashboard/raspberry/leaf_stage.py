@@ -0,0 +1,82 @@
+# Optional capture-time stage of cam_hour.py: leaf area of the frame still in memory.
+# Runs area_foliar.leaf_area (iot_dashboard/image_processing) on the captured BGR frame,
+# so the JPEG is neither re-read nor re-decoded, and queues the result in the spool
+# next to the photo. The uploader stores it in the leaf_area table (one row per capture,
+# keyed by date_time like plant_images), and the dashboard draws the growth curve from it.
+# Create the table on the server (MySQL or the SQLite stand-in):
+#   python leaf_stage.py
+
+import os
+import sys
+import time
+
+import db
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "image_processing"))
+from area_foliar import ANALYSIS, leaf_area
+
+MYSQL_LEAF_TABLE = """
+CREATE TABLE IF NOT EXISTS leaf_area (
+    date_time DATETIME NOT NULL,
+    leaf_pixels INT NOT NULL,
+    total_pixels INT NOT NULL,
+    leaf_fraction DOUBLE NOT NULL,
+    mode VARCHAR(64) NOT NULL,
+    PRIMARY KEY (date_time)
+)"""
+
+
+def mode_name(config):
+    """Analysis mode stored with each row, so points from different modes are not mixed up."""
+    roi = "full" if config["roi"] is None else "roi=" + ",".join(str(v) for v in config["roi"])
+    return f"{roi} scale={config['scale']:g} gain={config['gain']:g}"
+
+
+class LeafStage:
+    """Leaf area of in-memory frames with a fixed analysis mode (see area_foliar.ANALYSIS)."""
+
+    def __init__(self, roi=None, scale=None, gain=None):
+        self.config = {
+            "roi": roi if roi is not None else ANALYSIS["roi"],
+            "scale": scale if scale is not None else ANALYSIS["scale"],
+            "gain": gain if gain is not None else ANALYSIS["gain"],
+        }
+        self.mode = mode_name(self.config)
+
+    def measure(self, frame):
+        """Spool payload (without date_time) for one BGR frame, plus the time it took (s)."""
+        t0 = time.perf_counter()
+        leaf_pixels, total_pixels = leaf_area(frame, self.config["roi"], self.config["scale"],
+                                              gain=self.config["gain"])
+        elapsed = time.perf_counter() - t0
+        return {"leaf_pixels": leaf_pixels, "total_pixels": total_pixels,
+                "leaf_fraction": leaf_pixels / total_pixels, "mode": self.mode}, elapsed
+
+
+def upload_leaf(cursor, payload):
+    """Spool uploader for kind 'leaf'; a capture already stored is skipped (idempotent)."""
+    db.execute(cursor, "INSERT INTO leaf_area (date_time, leaf_pixels, total_pixels, leaf_fraction, mode) "
+                       "SELECT %s, %s, %s, %s, %s " + db.from_dual() +
+                       " WHERE NOT EXISTS (SELECT 1 FROM leaf_area WHERE date_time = %s)",
+               (payload["date_time"], payload["leaf_pixels"], payload["total_pixels"],
+                payload["leaf_fraction"], payload["mode"], payload["date_time"]))
+
+
+def upgrade_schema(conn):
+    cursor = conn.cursor()
+    if db.BACKEND == "sqlite":
+        db.create_sqlite_schema(conn)
+    else:
+        db.execute(cursor, MYSQL_LEAF_TABLE)
+        db.execute(cursor, db.MYSQL_VERSIONS_TABLE)
+    conn.commit()
+    cursor.close()
+
+
+if __name__ == "__main__":
+    conn = db.get_connection()
+    try:
+        upgrade_schema(conn)
+        print(f"leaf_area table ready ({db.BACKEND})")
+    finally:
+        conn.close()
@@ -0,0 +1,93 @@
+# Change notifications for the live dashboard (GET /updates and the /stream SSE channel).
+# One Notifier thread per worker watches the state of the live tables through the
+# response cache (newest date_time + data_versions counter, re-read at most every
+# response_cache.CHECK_EVERY s), so the number of open streams does not add queries
+# while nothing changes: streams sleep on a condition and only query their new rows when
+# a table they follow has moved (rows stored late with an older date_time move the counter).
+# Cursors hold the row id (db.row_id) of the last row sent per feed: insertion order.
+# Each stream holds one gunicorn thread, so a worker accepts at most MAX_STREAMS of them
+# (the rest get 503 and poll /updates) and closes each after STREAM_MAX_S; EventSource
+# reconnects by itself and resumes from its Last-Event-ID.
+
+import base64
+import json
+import threading
+import time
+
+CHECK_EVERY = 1.0     # s between state checks of the notifier thread
+MAX_STREAMS = 4       # open /stream connections per worker (gunicorn threads are 8)
+STREAM_MAX_S = 300.0  # s before a stream is closed and the client reconnects
+HEARTBEAT_S = 15.0    # s of silence before a keep-alive comment
+
+
+def encode_cursor(positions):
+    """Opaque cursor of {feed: row id of the last row sent}."""
+    return base64.urlsafe_b64encode(json.dumps(positions, sort_keys=True, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    # Row ids; date_time strings in cursors issued before row ids are accepted too
+    if not isinstance(positions, dict) or not all(
+            isinstance(v, str) or (isinstance(v, int) and not isinstance(v, bool) and v >= 0)
+            for v in positions.values()):
+        raise ValueError("invalid cursor")
+    return positions
+
+
+class Notifier:
+    """Background watcher of table states; wakes the waiting streams when one changes."""
+
+    def __init__(self, cache, tables, interval=CHECK_EVERY, max_streams=MAX_STREAMS):
+        self.cache = cache
+        self.tables = tables
+        self.interval = interval
+        self.max_streams = max_streams
+        self.version = 0
+        self.streams = 0
+        self._tokens = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _ensure_started(self):
+        # Started on first use, after gunicorn has forked the worker
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="live-notifier", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                tokens = [self.cache.state([table])[0] for table in self.tables]
+            except Exception as e:  # database down: keep the streams waiting, retry
+                print(f"[live] state check failed: {e}")
+                tokens = self._tokens
+            with self._cond:
+                if tokens != self._tokens:
+                    if self._tokens is not None:
+                        self.version += 1
+                        self._cond.notify_all()
+                    self._tokens = tokens
+            time.sleep(self.interval)
+
+    def wait(self, version, timeout):
+        """Block until the version moves past `version` or timeout; returns the current version."""
+        self._ensure_started()
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def open_stream(self):
+        with self._cond:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self._cond:
+            self.streams -= 1
@@ -0,0 +1,140 @@
+# Migrates plant_images from base64 TEXT rows to the content-addressed image store.
+# Adds the image_blobs table and the image_sha/bytes/width/height columns if missing,
+# then decodes every row that has no image_sha yet, stores the JPEG + thumbnails and
+# points the row at them. Resumable: rerunning it only touches rows not migrated yet.
+# Usage: python migrate_images.py [--batch 50] [--drop-base64]
+#   --drop-base64  also clear image_base64 of every migrated row, including rows migrated
+#                  by earlier runs (reclaim the space afterwards with OPTIMIZE TABLE
+#                  plant_images on MySQL, VACUUM on SQLite)
+
+import argparse
+import base64
+import binascii
+
+import db
+import image_store
+
+MYSQL_NEW_COLUMNS = {
+    "image_sha": "CHAR(64) NULL",
+    "bytes": "INT NULL",
+    "width": "SMALLINT NULL",
+    "height": "SMALLINT NULL",
+}
+DROP_BATCH = 500  # rows cleared per transaction by --drop-base64
+MYSQL_BLOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS image_blobs (
+    sha CHAR(64) NOT NULL,
+    variant VARCHAR(16) NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (sha, variant)
+)"""
+
+
+def existing_columns(cursor, table):
+    if db.BACKEND == "sqlite":
+        return {row["name"] for row in db.execute(cursor, f"PRAGMA table_info({table})").fetchall()}
+    db.execute(cursor, "SELECT column_name AS name FROM information_schema.columns "
+                       "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+    return {row["name"] for row in cursor.fetchall()}
+
+
+def upgrade_schema(conn):
+    cursor = db.dict_cursor(conn)
+    have = existing_columns(cursor, "plant_images")
+    if db.BACKEND == "sqlite":
+        for name in MYSQL_NEW_COLUMNS:
+            if name not in have:
+                db.execute(cursor, f"ALTER TABLE plant_images ADD COLUMN {name} {'TEXT' if name == 'image_sha' else 'INTEGER'}")
+        db.create_sqlite_schema(conn)
+    else:
+        db.execute(cursor, MYSQL_BLOBS_TABLE)
+        db.execute(cursor, db.MYSQL_VERSIONS_TABLE)
+        missing = [f"ADD COLUMN {name} {ddl}" for name, ddl in MYSQL_NEW_COLUMNS.items() if name not in have]
+        if missing:
+            db.execute(cursor, "ALTER TABLE plant_images " + ", ".join(missing))
+        # New captures no longer fill image_base64
+        db.execute(cursor, "ALTER TABLE plant_images MODIFY image_base64 LONGTEXT NULL")
+        if "image_sha" not in have:
+            db.execute(cursor, "CREATE INDEX idx_images_sha ON plant_images (image_sha)")
+    conn.commit()
+    cursor.close()
+    db.add_row_ids(conn, ["plant_images"])
+
+
+def migrate(conn, batch=50, drop_base64=False):
+    cursor = db.dict_cursor(conn)
+    key = db.row_id()
+    # Keyset on (date_time, row id): several images can share a date_time
+    last, last_key = "1970-01-01 00:00:00", 0
+    migrated = failed = saved = 0
+    while True:
+        rows = db.execute(cursor, f"SELECT date_time, {key} AS row_key, image_base64 FROM plant_images "
+                                  f"WHERE image_sha IS NULL AND image_base64 IS NOT NULL "
+                                  f"AND date_time >= %s AND (date_time > %s OR {key} > %s) "
+                                  f"ORDER BY date_time, {key} LIMIT %s", (last, last, last_key, batch)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            last, last_key = row["date_time"], row["row_key"]
+            try:
+                jpeg = base64.b64decode(row["image_base64"], validate=True)
+                photo = image_store.prepare(jpeg)
+            except (binascii.Error, ValueError) as e:
+                print(f"[WARN] {db.format_time(last)}: {e}, left as is")
+                failed += 1
+                continue
+            image_store.save_blobs(cursor, photo)
+            db.execute(cursor, f"UPDATE plant_images SET image_sha = %s, bytes = %s, width = %s, height = %s "
+                               f"WHERE {key} = %s AND image_sha IS NULL",
+                       (photo["sha"], photo["bytes"], photo["width"], photo["height"], last_key))
+            migrated += 1
+            saved += len(row["image_base64"]) - photo["bytes"]
+        db.touch(cursor, "plant_images")  # the listing now has blob URLs for these rows
+        conn.commit()  # one transaction per batch: an interrupted run loses at most a batch
+        print(f"{migrated} migrated, {failed} failed, up to {db.format_time(last)}")
+    cursor.close()
+    print(f"Done: {migrated} rows migrated, {failed} failed, "
+          f"{saved / 1e6:.1f} MB of base64 overhead {'freed' if drop_base64 else 'can be freed with --drop-base64'}")
+    if drop_base64:
+        drop_base64_copies(conn)
+
+
+def drop_base64_copies(conn, batch=DROP_BATCH):
+    """Clear image_base64 of every migrated row, this run's and earlier runs', a batch per transaction."""
+    cursor = db.dict_cursor(conn)
+    key = db.row_id()
+    last_key, cleared = 0, 0
+    while True:
+        # Only the keys are read; the UPDATE covers the batch's key range
+        rows = db.execute(cursor, f"SELECT {key} AS row_key FROM plant_images "
+                                  f"WHERE image_sha IS NOT NULL AND image_base64 IS NOT NULL AND {key} > %s "
+                                  f"ORDER BY {key} LIMIT %s", (last_key, batch)).fetchall()
+        if not rows:
+            break
+        first_key, last_key = rows[0]["row_key"], rows[-1]["row_key"]
+        db.execute(cursor, f"UPDATE plant_images SET image_base64 = NULL "
+                           f"WHERE image_sha IS NOT NULL AND image_base64 IS NOT NULL AND {key} BETWEEN %s AND %s",
+                   (first_key, last_key))
+        cleared += cursor.rowcount
+        conn.commit()
+    cursor.close()
+    print(f"image_base64 cleared on {cleared} migrated rows")
+    return cleared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move base64 plant images into the image store")
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--drop-base64", action="store_true")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    try:
+        upgrade_schema(conn)
+        migrate(conn, batch=args.batch, drop_base64=args.drop_base64)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
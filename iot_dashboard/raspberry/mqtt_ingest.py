@@ -0,0 +1,465 @@
+# MQTT ingest service: ESP32 readings -> sensor_data and error_logs.
+# The ESP32 (esp32/esp_reto.ino) publishes each reading as separate messages every
+# 10 minutes (sensors/temperature, sensors/humidity, sensors/soil, sensors/light) and
+# "errores" when the DHT11 read fails. The Correlator groups the messages of one reading
+# into one sensor_data row (missing sensors stay NULL); rows and errors are written in
+# batches, together with the hourly/daily rollups they touch (rollup.py), and a batch
+# that fails stays buffered and is retried with backoff.
+# Reconnects: the subscription uses a persistent session (fixed client id, no clean
+# session, QoS 1), so the broker keeps the messages that arrive while this service is
+# disconnected, and the windows and write buffers survive the reconnect. QoS 1 can
+# redeliver a message: a repeated topic with the same value in the same reading is dropped,
+# and the inserts skip rows already stored. The ESP32 publishes with QoS 0, which mosquitto
+# only queues for offline sessions with "queue_qos0_messages true" in mosquitto.conf.
+# Metrics (ingest rate, lag, buffers) are printed periodically and served as JSON on
+# METRICS_PORT.
+#   python mqtt_ingest.py [--broker 10.25.15.228] [--metrics-port 5001]
+# Demo with an in-process broker, a SQLite stand-in for MySQL, dropped connections and a
+# database outage:
+#   python mqtt_ingest.py --demo
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+import db
+import rollup
+
+try:
+    import aiomqtt
+except ImportError:  # only needed against a real broker
+    aiomqtt = None
+
+BROKER_HOST = "10.25.15.228"
+BROKER_PORT = 1883
+CLIENT_ID = "raspberry-ingest"
+
+# MQTT topic -> sensor_data column
+SENSOR_TOPICS = {
+    "sensors/temperature": "temp_air",
+    "sensors/humidity": "hum_air",
+    "sensors/soil": "hum_soil",
+    "sensors/light": "light",
+}
+ERROR_TOPIC = "errores"
+SUBSCRIPTIONS = ("sensors/#", ERROR_TOPIC)
+
+WINDOW = 60.0          # s, the messages of one reading arrive within this of the first one
+DUP_WINDOW = 300.0     # s, a redelivered message comes back within this (half the ESP32 period)
+BATCH_SIZE = 100       # rows per INSERT batch
+FLUSH_INTERVAL = 5.0   # s between writes of what is buffered
+BACKOFF_MIN = 2.0      # s, first retry after a failed write or connection
+BACKOFF_MAX = 300.0
+LOG_EVERY = 600.0      # s between metric log lines
+METRICS_PORT = 5001
+
+CONNECTION_ERRORS = (OSError,) + ((aiomqtt.MqttError,) if aiomqtt else ())
+
+INSERT_SENSOR = ("INSERT INTO sensor_data (date_time, temp_air, hum_air, hum_soil, light) "
+                 "SELECT %s, %s, %s, %s, %s " + "{from_dual}" +
+                 " WHERE NOT EXISTS (SELECT 1 FROM sensor_data WHERE date_time = %s)")
+INSERT_ERROR = ("INSERT INTO error_logs (date_time, error) SELECT %s, %s " + "{from_dual}" +
+                " WHERE NOT EXISTS (SELECT 1 FROM error_logs WHERE date_time = %s AND error = %s)")
+
+
+def format_ts(ts):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+class Correlator:
+    """Groups the per-topic messages of one ESP32 reading into one sensor_data row."""
+
+    def __init__(self):
+        self.open = None     # window being filled: {"started", "values"}
+        self.last = None     # last closed window, to recognise late redeliveries
+        self.duplicates = 0
+
+    def _close(self):
+        window, self.open, self.last = self.open, None, self.open
+        row = {column: window["values"].get(column) for column in SENSOR_TOPICS.values()}
+        row["date_time"] = format_ts(window["started"])
+        row["started"] = window["started"]
+        return row
+
+    def _is_duplicate(self, column, value, now):
+        # Same sensor, same value, in the reading being assembled or, if no newer one has
+        # started, in the one just closed (a redelivery after a reconnect comes back late)
+        window = self.open or self.last
+        return (window is not None and now - window["started"] <= DUP_WINDOW
+                and window["values"].get(column) == value)
+
+    def add(self, column, value, now):
+        """Add one sensor value; returns the rows closed by it (0 or 1)."""
+        if self._is_duplicate(column, value, now):
+            self.duplicates += 1
+            return []
+        closed = []
+        if self.open and (now - self.open["started"] > WINDOW or column in self.open["values"]):
+            # Window timed out, or the same sensor again with a new value: next reading
+            closed.append(self._close())
+        if self.open is None:
+            self.open = {"started": now, "values": {}}
+        self.open["values"][column] = value
+        if len(self.open["values"]) == len(SENSOR_TOPICS):
+            closed.append(self._close())
+        return closed
+
+    def expire(self, now, force=False):
+        """Close the open window if its time is up (or always, on shutdown)."""
+        if self.open and (force or now - self.open["started"] > WINDOW):
+            return [self._close()]
+        return []
+
+
+class Ingest:
+    """Subscriber + batch writer. Connections to the broker and the database are retried forever."""
+
+    def __init__(self, connect_db=db.get_connection, clock=time.time):
+        self.connect_db = connect_db
+        self.clock = clock
+        self.correlator = Correlator()
+        self.rows = []       # sensor rows waiting to be written
+        self.errors = []     # (date_time, error, received)
+        self._conn = None
+        self._wake = asyncio.Event()
+        self.connected = False
+        self.started = clock()
+        self.written_at = collections.deque()  # write times of the rows of the last hour
+        self.metrics = {"messages": 0, "bad_messages": 0, "rows_written": 0, "errors_written": 0,
+                        "batches": 0, "write_failures": 0, "reconnects": 0,
+                        "last_lag_s": None, "max_lag_s": 0.0, "last_message": None}
+
+    # ---- Messages ----
+
+    def handle(self, topic, payload):
+        now = self.clock()
+        self.metrics["messages"] += 1
+        self.metrics["last_message"] = now
+        text = payload.decode("utf-8", "replace").strip() if isinstance(payload, bytes) else str(payload).strip()
+        if topic == ERROR_TOPIC:
+            self.errors.append((format_ts(now), text, now))
+        elif topic in SENSOR_TOPICS:
+            try:
+                value = float(text)
+            except ValueError:
+                print(f"[mqtt] bad payload on {topic}: {text!r}")
+                self.metrics["bad_messages"] += 1
+                return
+            self.rows.extend(self.correlator.add(SENSOR_TOPICS[topic], value, now))
+        if len(self.rows) + len(self.errors) >= BATCH_SIZE:
+            self._wake.set()
+
+    async def consume(self, client_factory):
+        """Receive messages forever, reconnecting with backoff; buffers survive reconnects."""
+        backoff = BACKOFF_MIN
+        while True:
+            try:
+                async with client_factory() as client:
+                    for topic in SUBSCRIPTIONS:
+                        await client.subscribe(topic, qos=1)
+                    self.connected, backoff = True, BACKOFF_MIN
+                    print("[mqtt] connected")
+                    async for message in client.messages:
+                        self.handle(str(message.topic), message.payload)
+            except CONNECTION_ERRORS as e:
+                print(f"[mqtt] connection lost: {e}")
+            self.connected = False
+            self.metrics["reconnects"] += 1
+            await asyncio.sleep(backoff * random.uniform(1.0, 1.5))
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    # ---- Writes ----
+
+    def flush(self):
+        """Write up to BATCH_SIZE rows and errors in one transaction. Returns False to retry later."""
+        rows, errors = self.rows[:BATCH_SIZE], self.errors[:BATCH_SIZE]
+        try:
+            if self._conn is None:
+                self._conn = self.connect_db()
+            cursor = db.dict_cursor(self._conn)
+            if rows:
+                db.executemany(cursor, INSERT_SENSOR.format(from_dual=db.from_dual()),
+                               [(r["date_time"], r["temp_air"], r["hum_air"], r["hum_soil"], r["light"],
+                                 r["date_time"]) for r in rows])
+                # Hourly/daily rollups of the touched days, in the same transaction
+                rollup.refresh(cursor, min(r["date_time"] for r in rows), max(r["date_time"] for r in rows))
+                db.touch(cursor, "sensor_data")
+            if errors:
+                db.executemany(cursor, INSERT_ERROR.format(from_dual=db.from_dual()),
+                               [(ts, error, ts, error) for ts, error, _ in errors])
+                db.touch(cursor, "error_logs")
+            self._conn.commit()
+            cursor.close()
+        except db.DB_ERRORS as e:
+            print(f"[ingest] write of {len(rows)} row(s), {len(errors)} error(s) failed: {e}")
+            self.metrics["write_failures"] += 1
+            self._close_conn()
+            return False
+
+        # Only the loop thread appends, so the written prefix is still at the front
+        del self.rows[:len(rows)]
+        del self.errors[:len(errors)]
+        now = self.clock()
+        for received in [r["started"] for r in rows] + [e[2] for e in errors]:
+            lag = now - received
+            self.metrics["last_lag_s"] = lag
+            self.metrics["max_lag_s"] = max(self.metrics["max_lag_s"], lag)
+        self.written_at.extend([now] * len(rows))
+        self.metrics["rows_written"] += len(rows)
+        self.metrics["errors_written"] += len(errors)
+        self.metrics["batches"] += 1
+        return True
+
+    def _close_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except db.DB_ERRORS:
+                pass
+            self._conn = None
+
+    async def writer(self):
+        backoff = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), FLUSH_INTERVAL + backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self.rows.extend(self.correlator.expire(self.clock()))
+            while self.rows or self.errors:
+                # The database call blocks: run it off the event loop
+                if not await asyncio.to_thread(self.flush):
+                    backoff = min(max(backoff * 2, BACKOFF_MIN), BACKOFF_MAX)
+                    break
+                backoff = 0.0
+
+    # ---- Metrics ----
+
+    def stats(self):
+        now = self.clock()
+        while self.written_at and now - self.written_at[0] > 3600:
+            self.written_at.popleft()
+        pending = [r["started"] for r in self.rows] + [e[2] for e in self.errors]
+        uptime = max(now - self.started, 1e-9)
+        last = self.metrics["last_message"]
+        return dict(self.metrics,
+                    last_message=None if last is None else format_ts(last),
+                    last_message_age_s=None if last is None else now - last,
+                    connected=self.connected,
+                    duplicates=self.correlator.duplicates,
+                    messages_per_min=60 * self.metrics["messages"] / uptime,
+                    rows_last_hour=len(self.written_at),
+                    pending_rows=len(self.rows), pending_errors=len(self.errors),
+                    oldest_pending_s=now - min(pending) if pending else 0.0,
+                    window_open=self.correlator.open is not None)
+
+    async def log_metrics(self):
+        while True:
+            await asyncio.sleep(LOG_EVERY)
+            s = self.stats()
+            print(f"[ingest] {s['messages_per_min']:.2f} msg/min, {s['rows_last_hour']} rows last hour, "
+                  f"pending {s['pending_rows']}+{s['pending_errors']}, lag {s['last_lag_s']}, "
+                  f"reconnects {s['reconnects']}, write failures {s['write_failures']}")
+
+    async def _serve_metrics(self, reader, writer):
+        await reader.readline()  # request line; any path returns the metrics
+        body = json.dumps(self.stats()).encode()
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+    async def run(self, client_factory, metrics_port=None):
+        tasks = [self.consume(client_factory), self.writer(), self.log_metrics()]
+        server = None
+        if metrics_port:
+            server = await asyncio.start_server(self._serve_metrics, "0.0.0.0", metrics_port)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            if server:
+                server.close()
+            # Shutdown: write what is left, including the reading still being assembled
+            self.rows.extend(self.correlator.expire(self.clock(), force=True))
+            while (self.rows or self.errors) and self.flush():
+                pass
+            self._close_conn()
+
+
+def broker_client(host=BROKER_HOST, port=BROKER_PORT):
+    if aiomqtt is None:
+        raise RuntimeError("aiomqtt is not installed: pip install aiomqtt")
+    return aiomqtt.Client(host, port, identifier=CLIENT_ID, clean_session=False)
+
+
+# ---- In-process broker stand-in (demo) ----
+
+class _Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+_DROP = object()
+
+
+class LocalBroker:
+    """Minimal mosquitto stand-in: '#' filters, persistent sessions, QoS 1 redelivery on drop."""
+
+    def __init__(self):
+        self.sessions = {}  # client id -> {"filters", "queue", "inflight"}
+
+    def client(self, identifier):
+        return _LocalClient(self, identifier)
+
+    def publish(self, topic, payload):
+        for session in self.sessions.values():
+            if any(topic == f or (f.endswith("/#") and topic.startswith(f[:-1])) for f in session["filters"]):
+                session["queue"].put_nowait(_Message(topic, payload))
+
+    def drop(self, redeliver=True):
+        """Cut every connection; the last message in flight is sent again (lost PUBACK)."""
+        for session in self.sessions.values():
+            queued = []
+            while not session["queue"].empty():
+                queued.append(session["queue"].get_nowait())
+            for item in [_DROP] + ([session["inflight"]] if redeliver and session["inflight"] else []) + queued:
+                session["queue"].put_nowait(item)
+
+
+class _LocalClient:
+    def __init__(self, broker, identifier):
+        self.broker = broker
+        self.identifier = identifier
+
+    async def __aenter__(self):
+        self.session = self.broker.sessions.setdefault(
+            self.identifier, {"filters": set(), "queue": asyncio.Queue(), "inflight": None})
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def subscribe(self, topic, qos=0):
+        self.session["filters"].add(topic)
+
+    @property
+    async def messages(self):
+        while True:
+            item = await self.session["queue"].get()
+            if item is _DROP:
+                raise ConnectionResetError("connection lost (simulated)")
+            self.session["inflight"] = item
+            yield item
+
+
+async def _demo():
+    import os
+    import sqlite3
+    import tempfile
+
+    global WINDOW, FLUSH_INTERVAL, BACKOFF_MIN
+    # 10-minute readings replayed 2400x faster: the ingest runs on a simulated clock
+    speed, every, n = 2400.0, 0.25, 30
+    t0 = time.time()
+
+    def clock():
+        return t0 + (time.time() - t0) * speed
+    WINDOW, FLUSH_INTERVAL, BACKOFF_MIN = 60.0, 0.1, 0.005
+
+    db.BACKEND, db.SQLITE_PATH = "sqlite", os.path.join(tempfile.mkdtemp(), "server.db")
+    db.create_sqlite_schema(db.get_connection())
+    outage = (t0 + 2.0, t0 + 3.5)
+
+    class FlakyConnection:
+        """Server connection that fails during the outage, also when it was already open."""
+
+        def __init__(self):
+            self._check()
+            self.conn = db.get_connection()
+
+        def _check(self):
+            if outage[0] < time.time() < outage[1]:
+                raise sqlite3.OperationalError("server unreachable (simulated)")
+
+        def cursor(self):
+            self._check()
+            return self.conn.cursor()
+
+        def commit(self):
+            self.conn.commit()
+
+        def close(self):
+            self.conn.close()
+
+    broker = LocalBroker()
+    ingest = Ingest(connect_db=FlakyConnection, clock=clock)
+    task = asyncio.create_task(ingest.run(lambda: broker.client(CLIENT_ID)))
+    while CLIENT_ID not in broker.sessions or len(broker.sessions[CLIENT_ID]["filters"]) < 2:
+        await asyncio.sleep(0.01)
+
+    rng = random.Random(0)
+    dht_failures = 0
+    for i in range(n):
+        if i % 7 == 3:
+            broker.publish(ERROR_TOPIC, b"DHT11 read failed")
+            dht_failures += 1
+        else:
+            broker.publish("sensors/temperature", f"{rng.uniform(15, 30):5.2f}".encode())
+            broker.publish("sensors/humidity", f"{rng.uniform(40, 90):5.2f}".encode())
+        if i in (5, 20):
+            # Connection lost in the middle of a reading, before the last PUBACK
+            await asyncio.sleep(0.01)
+            broker.drop()
+        broker.publish("sensors/soil", f"{rng.randint(0, 100):5.2f}".encode())
+        broker.publish("sensors/light", f"{rng.randint(0, 100):5.2f}".encode())
+        if i == 12:
+            # ... and right after a complete one
+            await asyncio.sleep(0.01)
+            broker.drop()
+        await asyncio.sleep(every)
+
+    while ingest.rows or ingest.errors or ingest.correlator.open:
+        await asyncio.sleep(0.05)
+    stats = ingest.stats()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    cursor = db.get_connection().cursor()
+    rows = db.execute(cursor, "SELECT COUNT(*) AS n, COUNT(temp_air) AS full FROM sensor_data").fetchone()
+    errors = db.execute(cursor, "SELECT COUNT(*) AS n FROM error_logs").fetchone()["n"]
+    print(f"\n{n} readings published ({dht_failures} DHT11 failures), 3 dropped connections, "
+          f"{outage[1] - outage[0]:.1f} s database outage")
+    print(f"sensor_data: {rows['n']} rows ({rows['full']} complete), error_logs: {errors} rows")
+    print(f"duplicates dropped {stats['duplicates']}, reconnects {stats['reconnects']}, "
+          f"write failures {stats['write_failures']}, batches {stats['batches']}, "
+          f"max lag {stats['max_lag_s'] / 60:.0f} simulated min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESP32 MQTT readings -> sensor_data / error_logs")
+    parser.add_argument("--broker", default=BROKER_HOST)
+    parser.add_argument("--port", type=int, default=BROKER_PORT)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="0 to disable")
+    parser.add_argument("--demo", action="store_true", help="in-process broker and SQLite, no network")
+    args = parser.parse_args()
+
+    if args.demo:
+        asyncio.run(_demo())
+        return
+    ingest = Ingest()
+    try:
+        asyncio.run(ingest.run(lambda: broker_client(args.broker, args.port), args.metrics_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
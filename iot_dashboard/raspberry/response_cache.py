@@ -0,0 +1,219 @@
+# Response cache for the dashboard API listings (/sensors, /images, /errors, /leaf_area).
+# Entries are keyed by route + query string and tagged with the state of the tables the
+# route reads. A table's state is its newest date_time (an index lookup) plus its counter
+# in data_versions, which the writers bump in the same transaction as their inserts
+# (mqtt_ingest.py, the spool uploader, migrate_images.py, rollup.py) - that catches
+# changes that do not move the newest date_time. The state is re-read at most every
+# CHECK_EVERY seconds per worker, so a hit, or a 304 to a conditional GET (ETag /
+# Last-Modified), costs no query at all in between. If data_versions cannot be read
+# (not created yet, database hiccup) the newest date_time is used alone and the table is
+# tried again after VERSIONS_RETRY seconds.
+# Each gunicorn worker has its own cache (memory bounded by MAX_BYTES).
+# Create data_versions on MySQL (rollup.py, leaf_stage.py and migrate_images.py do too):
+#   python response_cache.py
+
+import collections
+import email.utils
+import functools
+import hashlib
+import math
+import threading
+import time
+import urllib.parse
+
+from flask import Response, request
+
+import db
+
+CHECK_EVERY = 2.0                  # s between table state checks (per table, per worker)
+MAX_BYTES = 64 * 1024 * 1024       # total body bytes kept per worker
+ENTRY_MAX_BYTES = 4 * 1024 * 1024  # larger responses are streamed and not kept
+VERSIONS_RETRY = 60.0              # s before data_versions is read again after an error
+
+# Response headers that are recomputed for every answer instead of being stored
+_NOT_STORED = {"content-length", "etag", "last-modified", "cache-control", "date"}
+
+
+class ResponseCache:
+    """LRU of JSON listing responses, invalidated by table state changes."""
+
+    def __init__(self, pool, max_bytes=MAX_BYTES, entry_max_bytes=ENTRY_MAX_BYTES, check_every=CHECK_EVERY,
+                 versions_retry=VERSIONS_RETRY):
+        self.pool = pool
+        self.max_bytes = max_bytes
+        self.entry_max_bytes = entry_max_bytes
+        self.check_every = check_every
+        self.versions_retry = versions_retry
+        self.versions = True  # False while data_versions cannot be read
+        self._versions_failed = 0.0  # time of the last data_versions error
+        self._entries = collections.OrderedDict()  # key -> {"etag", "tables", "body", "headers"}
+        self._states = {}                          # table -> {"token", "observed", "checked"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "not_modified": 0, "stored": 0, "not_stored": 0,
+                        "evictions": 0, "invalidations": 0, "state_checks": 0}
+
+    # ---- Table state ----
+
+    def _read_token(self, table):
+        with self.pool.connection() as pooled:
+            rows = pooled.query(f"SELECT date_time FROM {table} ORDER BY date_time DESC LIMIT 1").fetchall()
+        token = db.format_time(rows[0]["date_time"]) if rows else "-"
+        if self.versions or time.time() - self._versions_failed >= self.versions_retry:
+            try:
+                with self.pool.connection() as pooled:
+                    rows = pooled.query("SELECT version FROM data_versions WHERE name = %s", (table,)).fetchall()
+                token += f"/{rows[0]['version'] if rows else 0}"
+                if not self.versions:
+                    print("[cache] data_versions available again")
+                    self.versions = True
+            except db.DB_ERRORS as e:
+                if self.versions:
+                    print(f"[cache] data_versions unavailable, using max(date_time) only: {e}")
+                self.versions = False
+                self._versions_failed = time.time()
+        return token
+
+    def state(self, tables):
+        """(token, observed): the combined state of tables and when this worker first saw it."""
+        tokens, observed = [], 0.0
+        for table in tables:
+            now = time.time()
+            with self._lock:
+                known = self._states.get(table)
+            if known is None or now - known["checked"] >= self.check_every:
+                token = self._read_token(table)
+                with self._lock:
+                    self.metrics["state_checks"] += 1
+                    known = self._states.get(table)
+                    if known is None or known["token"] != token:
+                        if known is not None:
+                            self.metrics["invalidations"] += 1
+                            self._drop(table)
+                        # Whole seconds, rounded up: Last-Modified has 1 s resolution
+                        known = {"token": token, "observed": math.ceil(now)}
+                    known["checked"] = now
+                    self._states[table] = known
+            tokens.append(known["token"])
+            observed = max(observed, known["observed"])
+        return "|".join(tokens), observed
+
+    # ---- Entries ----
+
+    def _drop(self, table):
+        for key in [k for k, e in self._entries.items() if table in e["tables"]]:
+            self._bytes -= len(self._entries.pop(key)["body"])
+
+    def _store(self, key, etag, tables, body, headers):
+        if len(body) > self.entry_max_bytes:
+            with self._lock:
+                self.metrics["not_stored"] += 1
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old["body"])
+            self._entries[key] = {"etag": etag, "tables": tables, "body": body, "headers": headers}
+            self._bytes += len(body)
+            self.metrics["stored"] += 1
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["body"])
+                self.metrics["evictions"] += 1
+
+    def _tee(self, chunks, key, etag, tables, headers):
+        """Pass a streamed body through, keeping a copy if it completes and is small enough."""
+        kept, size, complete = [], 0, False
+        try:
+            for chunk in chunks:
+                if size <= self.entry_max_bytes:
+                    data = chunk.encode() if isinstance(chunk, str) else chunk
+                    kept.append(data)
+                    size += len(data)
+                yield chunk
+            complete = True
+        finally:
+            if complete:
+                self._store(key, etag, tables, b"".join(kept), headers)
+
+    # ---- Flask ----
+
+    def respond(self, tables, view, *args, **kwargs):
+        key = request.path + "?" + urllib.parse.urlencode(sorted(request.args.items(multi=True)))
+        try:
+            token, observed = self.state(tables)
+        except db.DB_ERRORS:
+            return view(*args, **kwargs)  # the view reports the database error
+        # Same key + same table state -> same body, in every worker
+        etag = hashlib.sha1(f"{key}#{token}".encode()).hexdigest()[:32]
+
+        def finish(response):
+            response.set_etag(etag)
+            response.headers["Last-Modified"] = email.utils.formatdate(observed, usegmt=True)
+            # Browsers revalidate every time; unchanged data costs a 304
+            response.headers["Cache-Control"] = "no-cache"
+            return response.make_conditional(request)
+
+        probe = finish(Response(status=200))
+        if probe.status_code == 304:
+            with self._lock:
+                self.metrics["not_modified"] += 1
+            return probe
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["etag"] == etag:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+            else:
+                entry = None
+                self.metrics["misses"] += 1
+        if entry is not None:
+            return finish(Response(entry["body"], headers=entry["headers"]))
+
+        response = view(*args, **kwargs)
+        if isinstance(response, tuple) or response.status_code != 200:
+            return response
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _NOT_STORED]
+        if response.is_streamed:
+            response.response = self._tee(response.response, key, etag, tables, headers)
+        else:
+            body = response.get_data()
+            if body.startswith(b'{"error"'):
+                return response  # database errors are answered with 200 + {"error": ...}
+            self._store(key, etag, tables, body, headers)
+        return finish(response)
+
+    def cached(self, *tables):
+        """Decorator for a listing route that only reads `tables`."""
+        def wrap(view):
+            @functools.wraps(view)
+            def handler(*args, **kwargs):
+                return self.respond(tables, view, *args, **kwargs)
+            return handler
+        return wrap
+
+    def stats(self):
+        with self._lock:
+            served = self.metrics["hits"] + self.metrics["misses"] + self.metrics["not_modified"]
+            return dict(self.metrics, entries=len(self._entries), bytes=self._bytes,
+                        hit_ratio=(self.metrics["hits"] + self.metrics["not_modified"]) / served if served else 0.0)
+
+
+def upgrade_schema(conn):
+    cursor = conn.cursor()
+    if db.BACKEND == "sqlite":
+        db.create_sqlite_schema(conn)
+    else:
+        db.execute(cursor, db.MYSQL_VERSIONS_TABLE)
+    conn.commit()
+    cursor.close()
+
+
+if __name__ == "__main__":
+    conn = db.get_connection()
+    try:
+        upgrade_schema(conn)
+        print(f"data_versions table ready ({db.BACKEND})")
+    finally:
+        conn.close()
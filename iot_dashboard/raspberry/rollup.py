@@ -0,0 +1,194 @@
+# Hourly and daily rollups of sensor_data for the dashboard charts.
+# sensor_hourly and sensor_daily hold, per bucket (date_time = start of the hour or day),
+# the count, min, max and sum of every sensor, so the mean of any range of buckets is
+# exact. They are kept up to date incrementally: every batch written by mqtt_ingest.py
+# recomputes only the buckets it touched, from sensor_data, in the same transaction, so
+# a resent batch or a late row never counts twice. The API picks the resolution from the
+# requested window (resolution=auto) or downsamples raw rows with LTTB (points=N).
+# Create the tables and fill them from the existing history:
+#   python rollup.py [--rebuild]
+
+import argparse
+import datetime
+
+import numpy as np
+
+import db
+
+SENSORS = ("temp_air", "hum_air", "hum_soil", "light")
+FMT = "%Y-%m-%d %H:%M:%S"
+
+# table -> bucket length
+RESOLUTIONS = {
+    "sensor_hourly": datetime.timedelta(hours=1),
+    "sensor_daily": datetime.timedelta(days=1),
+}
+RAW_PERIOD = datetime.timedelta(minutes=10)  # ESP32 reading period
+
+AGG_COLUMNS = [f"{s}_{agg}" for s in SENSORS for agg in ("n", "min", "max", "sum")]
+
+
+def _table_sql(table, time_type, real_type):
+    cols = ", ".join(f"{c} {'INTEGER' if c.endswith('_n') else real_type}" for c in AGG_COLUMNS)
+    return f"CREATE TABLE IF NOT EXISTS {table} (date_time {time_type} NOT NULL PRIMARY KEY, n INTEGER NOT NULL, {cols})"
+
+
+def listing_columns():
+    """Columns for the API listing: the mean under the sensor's own name, plus min/max."""
+    cols = ["date_time", "n"]
+    for s in SENSORS:
+        cols += [f"{s}_sum / {s}_n AS {s}", f"{s}_min", f"{s}_max"]
+    return ", ".join(cols)
+
+
+def parse_time(value):
+    """datetime of a date_time value: datetime (MySQL), 'YYYY-MM-DD HH:MM:SS' or just a date."""
+    if isinstance(value, datetime.datetime):
+        return value
+    if len(value) <= 10:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    return datetime.datetime.strptime(value[:19], FMT)
+
+
+def bucket_start(value, table):
+    t = parse_time(value)
+    if table == "sensor_daily":
+        return t.replace(hour=0, minute=0, second=0, microsecond=0)
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows, table):
+    """{bucket start: [n, per sensor n/min/max/sum...]} of raw sensor rows."""
+    buckets = {}
+    for row in rows:
+        start = bucket_start(row["date_time"], table)
+        agg = buckets.setdefault(start, {"n": 0, **{c: None for c in AGG_COLUMNS}})
+        agg["n"] += 1
+        for s in SENSORS:
+            v = row[s]
+            if v is None:
+                continue
+            v = float(v)
+            agg[f"{s}_n"] = (agg[f"{s}_n"] or 0) + 1
+            agg[f"{s}_sum"] = (agg[f"{s}_sum"] or 0.0) + v
+            agg[f"{s}_min"] = v if agg[f"{s}_min"] is None else min(agg[f"{s}_min"], v)
+            agg[f"{s}_max"] = v if agg[f"{s}_max"] is None else max(agg[f"{s}_max"], v)
+    return buckets
+
+
+def refresh(cursor, start, end):
+    """
+    Recompute every hourly and daily bucket of the days from start to end (inclusive)
+    from sensor_data. cursor must be a dict cursor. Returns the number of buckets written.
+    """
+    first = bucket_start(start, "sensor_daily")
+    last = bucket_start(end, "sensor_daily") + RESOLUTIONS["sensor_daily"]
+    rows = db.execute(cursor, "SELECT date_time, " + ", ".join(SENSORS) + " FROM sensor_data "
+                              "WHERE date_time >= %s AND date_time < %s",
+                      (first.strftime(FMT), last.strftime(FMT))).fetchall()
+    written = 0
+    for table in RESOLUTIONS:
+        # Whole days are recomputed, so buckets that lost their rows are deleted too
+        db.execute(cursor, f"DELETE FROM {table} WHERE date_time >= %s AND date_time < %s",
+                   (first.strftime(FMT), last.strftime(FMT)))
+        buckets = aggregate(rows, table)
+        if buckets:
+            columns = ["date_time", "n"] + AGG_COLUMNS
+            db.executemany(cursor, f"INSERT INTO {table} ({', '.join(columns)}) "
+                                   f"VALUES ({', '.join(['%s'] * len(columns))})",
+                           [[t.strftime(FMT)] + [agg[c] for c in columns[1:]] for t, agg in sorted(buckets.items())])
+        written += len(buckets)
+    return written
+
+
+def pick_resolution(start, end, max_points):
+    """Finest table ('sensor_data', 'sensor_hourly', 'sensor_daily') with at most max_points rows in the window."""
+    span = end - start
+    if span / RAW_PERIOD <= max_points:
+        return "sensor_data"
+    if span / RESOLUTIONS["sensor_hourly"] <= max_points:
+        return "sensor_hourly"
+    return "sensor_daily"
+
+
+def lttb(rows, threshold, keys=SENSORS):
+    """
+    Largest-Triangle-Three-Buckets downsampling of time-ordered rows to `threshold` rows.
+    The triangle area is summed over every sensor, each scaled by its range, so one set of
+    rows keeps the peaks of all the series (a missing value counts as the series minimum).
+    """
+    n = len(rows)
+    if threshold >= n or threshold < 3:
+        return rows
+
+    x = np.array([db.format_time(r["date_time"]) for r in rows], dtype="datetime64[s]").astype(np.float64)
+    y = np.array([[r[k] for k in keys] for r in rows], dtype=np.float64)  # None -> nan
+    y = y[:, ~np.isnan(y).all(axis=0)]  # a sensor with no value in the window adds nothing
+    lo, hi = np.nanmin(y, axis=0), np.nanmax(y, axis=0)
+    y = np.nan_to_num((y - lo) / np.where(hi > lo, hi - lo, 1.0))
+
+    # Bucket i (1 .. threshold-2) holds rows edges[i-1] .. edges[i]-1; first and last rows kept
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nxt_end = edges[i + 2] if i + 2 < len(edges) else n
+        # Third corner of the triangle: average of the next bucket (the last row for the last one)
+        avg_x, avg_y = x[end:nxt_end].mean(), y[end:nxt_end].mean(axis=0)
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end, None]) * (avg_y - y[a])).sum(axis=1)
+        a = start + int(area.argmax())
+        keep.append(a)
+    keep.append(n - 1)
+    return [rows[i] for i in keep]
+
+
+def upgrade_schema(conn):
+    cursor = conn.cursor()
+    if db.BACKEND == "sqlite":
+        db.create_sqlite_schema(conn)
+    else:
+        for table in RESOLUTIONS:
+            db.execute(cursor, _table_sql(table, "DATETIME", "DOUBLE"))
+        db.execute(cursor, db.MYSQL_VERSIONS_TABLE)
+    conn.commit()
+    cursor.close()
+
+
+def rebuild(conn, chunk_days=31):
+    """Recompute all the rollups from sensor_data, a month at a time."""
+    cursor = db.dict_cursor(conn)
+    bounds = db.execute(cursor, "SELECT MIN(date_time) AS first, MAX(date_time) AS last FROM sensor_data").fetchone()
+    if bounds["first"] is None:
+        print("sensor_data is empty")
+        return
+    start = bucket_start(db.format_time(bounds["first"]), "sensor_daily")
+    last = bucket_start(db.format_time(bounds["last"]), "sensor_daily")
+    buckets = 0
+    while start <= last:
+        end = min(start + datetime.timedelta(days=chunk_days - 1), last)
+        buckets += refresh(cursor, start, end)
+        db.touch(cursor, "sensor_data")  # cached /sensors responses include the rollups
+        conn.commit()
+        start = end + datetime.timedelta(days=1)
+    cursor.close()
+    print(f"{buckets} hourly + daily buckets written up to {last.date()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hourly/daily rollups of sensor_data")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every bucket from sensor_data")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    try:
+        upgrade_schema(conn)
+        if args.rebuild:
+            rebuild(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Local write-ahead spool for the capture daemon.
+# Every record (photo, leaf area, error) is first committed to a SQLite file on the Raspberry Pi;
+# a background Uploader drains it into the database in batches, retrying with
+# exponential backoff while the server is unreachable. Records carry an idempotent key
+# and the inserts skip rows that already exist, so a batch that committed remotely but
+# was not acknowledged locally (e.g. power cut) is not duplicated when it is resent.
+# Demo with a local SQLite stand-in for MySQL and a database that is down for a while:
+#   python spool.py
+
+import json
+import os
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+
+import db
+import image_store
+import leaf_stage
+
+SPOOL_PATH = str(pathlib.Path.home() / "captures" / "spool.db")
+
+BATCH_SIZE = 20
+BACKOFF_MIN = 2.0      # s, first retry after a failed upload
+BACKOFF_MAX = 300.0    # s, cap while the server stays down
+IDLE_POLL = 5.0        # s between checks when the spool is empty
+
+
+class Spool:
+    """Durable FIFO of pending records, safe to share between the capture and upload threads."""
+
+    def __init__(self, path=SPOOL_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL + FULL sync: a committed record survives a power cut
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS spool (
+            key TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,
+            created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            next_try REAL NOT NULL DEFAULT 0, dead INTEGER NOT NULL DEFAULT 0, last_error TEXT)""")
+        self._conn.commit()
+
+    def put(self, key, kind, payload):
+        """Queue one record; a key already in the spool is left as is."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO spool (key, kind, payload, created) VALUES (?, ?, ?, ?)",
+                               (key, kind, json.dumps(payload), time.time()))
+            self._conn.commit()
+
+    def due(self, limit=BATCH_SIZE):
+        """Oldest records ready to be (re)tried: [(key, kind, payload), ...]."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, kind, payload FROM spool WHERE dead = 0 AND next_try <= ? "
+                                      "ORDER BY created LIMIT ?", (time.time(), limit)).fetchall()
+        return [(key, kind, json.loads(payload)) for key, kind, payload in rows]
+
+    def done(self, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM spool WHERE key = ?", [(k,) for k in keys])
+            self._conn.commit()
+
+    def retry(self, keys, error, delay):
+        with self._lock:
+            self._conn.executemany("UPDATE spool SET attempts = attempts + 1, next_try = ?, last_error = ? "
+                                   "WHERE key = ?", [(time.time() + delay, error, k) for k in keys])
+            self._conn.commit()
+
+    def bury(self, key, error):
+        """Park a record that can never be uploaded (e.g. its photo file is gone)."""
+        with self._lock:
+            self._conn.execute("UPDATE spool SET dead = 1, last_error = ? WHERE key = ?", (error, key))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            pending, dead, oldest = self._conn.execute(
+                "SELECT SUM(dead = 0), SUM(dead = 1), MIN(created) FROM spool").fetchone()
+        return {"pending": pending or 0, "dead": dead or 0,
+                "oldest_age_s": time.time() - oldest if oldest else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---- Uploads, one function per record kind; each must be idempotent ----
+
+def upload_image(cursor, payload):
+    with open(payload["path"], "rb") as f:
+        photo = image_store.prepare(f.read())
+    image_store.insert_capture(cursor, payload["date_time"], photo)
+
+
+def upload_error(cursor, payload):
+    db.execute(cursor, "INSERT INTO error_logs (date_time, error) SELECT %s, %s " + db.from_dual() +
+                       " WHERE NOT EXISTS (SELECT 1 FROM error_logs WHERE date_time = %s AND error = %s)",
+               (payload["date_time"], payload["error"], payload["date_time"], payload["error"]))
+
+
+UPLOADERS = {"image": upload_image, "leaf": leaf_stage.upload_leaf, "error": upload_error}
+# Table each kind writes, for the API response cache (db.touch)
+TABLES = {"image": "plant_images", "leaf": "leaf_area", "error": "error_logs"}
+
+
+class Uploader:
+    """Background thread that drains a Spool into the database in batches."""
+
+    def __init__(self, spool, connect=db.get_connection, batch=BATCH_SIZE):
+        self.spool = spool
+        self.connect = connect
+        self.batch = batch
+        self.backoff = BACKOFF_MIN
+        self.uploaded = 0
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-uploader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        self._thread.join(timeout)
+        self._close_conn()
+
+    def _close_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except db.DB_ERRORS:
+                pass
+            self._conn = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            items = self.spool.due(self.batch)
+            if not items:
+                self._stop.wait(IDLE_POLL)
+                continue
+            if not self.upload_batch(items):
+                # Server unreachable or batch rejected: wait, doubling up to BACKOFF_MAX
+                self._stop.wait(self.backoff)
+                self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+            else:
+                self.backoff = BACKOFF_MIN
+
+    def upload_batch(self, items):
+        """Send items in one transaction. Returns False if the batch has to be retried."""
+        keys = [key for key, _, _ in items]
+        try:
+            if self._conn is None:
+                self._conn = self.connect()
+            cursor = self._conn.cursor()
+            sent = []
+            touched = set()
+            for key, kind, payload in items:
+                try:
+                    UPLOADERS[kind](cursor, payload)
+                    sent.append(key)
+                    touched.add(TABLES[kind])
+                except (OSError, ValueError, KeyError) as e:
+                    # Bad record, not a server problem: park it so it does not block the rest
+                    print(f"[spool] {key} cannot be uploaded: {e}")
+                    self.spool.bury(key, str(e))
+            db.touch(cursor, *sorted(touched))
+            self._conn.commit()
+            cursor.close()
+        except db.DB_ERRORS as e:
+            print(f"[spool] upload of {len(keys)} record(s) failed: {e}")
+            self._close_conn()
+            # Jitter so several devices do not retry in lockstep
+            self.spool.retry(keys, str(e), self.backoff * random.uniform(1.0, 1.5))
+            return False
+
+        self.spool.done(sent)
+        self.uploaded += len(sent)
+        return True
+
+
+if __name__ == "__main__":
+    # Loss-free upload through an outage, against a SQLite stand-in for MySQL
+    import glob
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    db.BACKEND, db.SQLITE_PATH = "sqlite", os.path.join(tmp, "server.db")
+    db.create_sqlite_schema(db.get_connection())
+    BACKOFF_MIN, IDLE_POLL = 0.2, 0.1
+
+    outage_until = time.time() + 2.0
+
+    def flaky_connect():
+        if time.time() < outage_until:
+            raise sqlite3.OperationalError("server unreachable (simulated)")
+        return db.get_connection()
+
+    photos = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "all_images", "*.jpg")))[:10]
+    spool = Spool(os.path.join(tmp, "spool.db"))
+    uploader = Uploader(spool, connect=flaky_connect, batch=4).start()
+
+    for i, path in enumerate(photos):
+        ts = f"2025-11-01 {i:02d}:00:00"
+        spool.put(f"img:{ts}", "image", {"date_time": ts, "path": path})
+        spool.put(f"img:{ts}", "image", {"date_time": ts, "path": path})  # same key twice: kept once
+    spool.put("err:2025-11-01 03:00:00", "error", {"date_time": "2025-11-01 03:00:00", "error": "camera busy"})
+    print("queued:", spool.stats())
+
+    while spool.stats()["pending"]:
+        time.sleep(0.2)
+    uploader.stop()
+
+    # Resending an already uploaded record must not duplicate it
+    cursor = db.get_connection().cursor()
+    upload_image(cursor, {"date_time": "2025-11-01 00:00:00", "path": photos[0]})
+    rows = db.execute(cursor, "SELECT COUNT(*) AS n FROM plant_images").fetchone()["n"]
+    errors = db.execute(cursor, "SELECT COUNT(*) AS n FROM error_logs").fetchone()["n"]
+    print(f"uploaded {uploader.uploaded} records; server has {rows} images (expected {len(photos)}) "
+          f"and {errors} error row(s)")
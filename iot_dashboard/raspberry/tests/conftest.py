@@ -0,0 +1,48 @@
+# Shared fixtures of the Raspberry Pi tests: everything runs against a temporary SQLite
+# file (db.py SQLite backend), no MySQL server or broker needed.
+# Usage: python -m pytest iot_dashboard/raspberry/tests
+
+import os
+import sys
+
+import pytest
+
+os.environ["DB_BACKEND"] = "sqlite"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Fresh database with the full schema; get_connection() opens it."""
+    monkeypatch.setattr(db, "SQLITE_PATH", str(tmp_path / "strawberries.db"))
+    conn = db.get_connection()
+    db.create_sqlite_schema(conn)
+    conn.close()
+    return db.SQLITE_PATH
+
+
+@pytest.fixture
+def api_client(sqlite_db, monkeypatch):
+    """Flask test client of api.py with its own pool and an empty response cache."""
+    import api
+    pool = db.ConnectionPool(size=4)
+    monkeypatch.setattr(api, "pool", pool)
+    monkeypatch.setattr(api.cache, "pool", pool)
+    api.cache._entries.clear()
+    api.cache._states.clear()
+    api.cache._bytes = 0
+    yield api.app.test_client()
+    for pooled in pool._idle:
+        pooled.close()
+
+
+def insert(table, rows):
+    """Insert dict rows into table, committed."""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    for row in rows:
+        db.execute(cursor, f"INSERT INTO {table} ({', '.join(row)}) VALUES ({', '.join(['%s'] * len(row))})",
+                   tuple(row.values()))
+    conn.commit()
+    conn.close()
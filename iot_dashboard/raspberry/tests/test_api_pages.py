@@ -0,0 +1,59 @@
+# Keyset pagination of the listing endpoints (api.py _page_query): rows sharing a
+# date_time at a page boundary must all be returned, once, in both orders.
+
+from conftest import insert
+
+
+def follow(client, path, **params):
+    """Every row of a listing, page by page like the dashboard; returns (rows, pages)."""
+    rows, pages, cursor = [], 0, None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        body = client.get(path, query_string=query).get_json()
+        assert "error" not in body, body
+        rows += body["data"]
+        pages += 1
+        cursor = body["next_cursor"]
+        if not cursor:
+            return rows, pages
+
+
+def test_rows_tied_at_the_page_boundary(api_client):
+    insert("error_logs", [{"date_time": "2025-11-03 10:00:00", "error": f"e{i}"} for i in range(1, 4)])
+    rows, pages = follow(api_client, "/errors", limit=2)
+    assert [r["error"] for r in rows] == ["e1", "e2", "e3"]
+    assert pages == 2
+    assert set(rows[0]) == {"date_time", "error"}  # the row key stays in the cursor
+
+
+def test_descending_with_ties(api_client):
+    insert("error_logs", [{"date_time": t, "error": f"{t[-2:]}-{i}"}
+                          for t in ("2025-11-03 10:00:00", "2025-11-03 10:00:01") for i in range(3)])
+    rows, _ = follow(api_client, "/errors", limit=2, order="desc")
+    assert [r["error"] for r in rows] == ["01-2", "01-1", "01-0", "00-2", "00-1", "00-0"]
+
+
+def test_every_page_size(api_client):
+    # Bursts of identical timestamps (one MQTT batch stamped with the same second)
+    insert("sensor_data", [{"date_time": f"2025-11-03 10:00:{s:02d}", "temp_air": s * 10 + i}
+                           for s in range(5) for i in range(s + 1)])
+    everything = [r["temp_air"] for r in api_client.get("/sensors", query_string={"limit": 100}).get_json()["data"]]
+    assert len(everything) == 15
+    for limit in range(1, 8):
+        rows, _ = follow(api_client, "/sensors", limit=limit)
+        assert [r["temp_air"] for r in rows] == everything
+
+
+def test_date_time_cursor_still_accepted(api_client):
+    insert("error_logs", [{"date_time": f"2025-11-03 10:00:0{i}", "error": f"e{i}"} for i in range(3)])
+    body = api_client.get("/errors", query_string={"cursor": "2025-11-03 10:00:00"}).get_json()
+    assert [r["error"] for r in body["data"]] == ["e1", "e2"]
+    assert api_client.get("/errors", query_string={"cursor": "2025-11-03 10:00:00|x"}).status_code == 400
+
+
+def test_unique_time_tables_page_on_date_time(api_client):
+    insert("leaf_area", [{"date_time": f"2025-11-0{d} 12:00:00", "leaf_pixels": d, "total_pixels": 10,
+                          "leaf_fraction": d / 10, "mode": "hsv"} for d in range(1, 6)])
+    rows, pages = follow(api_client, "/leaf_area", limit=2)
+    assert [r["leaf_pixels"] for r in rows] == [1, 2, 3, 4, 5]
+    assert pages == 3
@@ -0,0 +1,71 @@
+# Live sync (api.py /updates): the cursor follows insertion order, so rows tied on
+# date_time at the limit and rows stored late with an older date_time are delivered.
+
+import pytest
+
+import live
+from conftest import insert
+
+
+def updates(client, cursor=None, **params):
+    body = client.get("/updates", query_string=dict(params, **({"cursor": cursor} if cursor else {}))).get_json()
+    assert "error" not in body, body
+    return body
+
+
+def errors(body):
+    return [r["error"] for r in body["errors"]]
+
+
+def test_first_call_only_returns_a_cursor(api_client):
+    insert("error_logs", [{"date_time": "2025-11-03 10:00:00", "error": "old"}])
+    body = updates(api_client)
+    assert body["errors"] == [] and body["sensors"] == [] and not body["more"]
+    insert("error_logs", [{"date_time": "2025-11-03 11:00:00", "error": "new"}])
+    assert errors(updates(api_client, body["cursor"])) == ["new"]
+
+
+def test_ties_at_the_limit(api_client):
+    cursor = updates(api_client)["cursor"]
+    insert("error_logs", [{"date_time": "2025-11-03 10:00:00", "error": f"e{i}"} for i in range(1, 4)])
+    first = updates(api_client, cursor, limit=2)
+    assert errors(first) == ["e1", "e2"] and first["more"]
+    second = updates(api_client, first["cursor"], limit=2)
+    assert errors(second) == ["e3"] and not second["more"]
+
+
+def test_late_rows_are_delivered(api_client):
+    insert("sensor_data", [{"date_time": "2025-11-03 12:00:00", "temp_air": 20.0}])
+    cursor = updates(api_client)["cursor"]
+    insert("sensor_data", [{"date_time": "2025-11-03 12:10:00", "temp_air": 21.0}])
+    body = updates(api_client, cursor)
+    assert [r["temp_air"] for r in body["sensors"]] == [21.0]
+    # Spool upload after an outage / leaf_batch backfill: older capture times, stored now
+    insert("sensor_data", [{"date_time": "2025-11-03 11:50:00", "temp_air": 19.0},
+                           {"date_time": "2025-11-03 09:00:00", "temp_air": 15.0}])
+    insert("leaf_area", [{"date_time": "2025-11-01 12:00:00", "leaf_pixels": 1, "total_pixels": 10,
+                          "leaf_fraction": 0.1, "mode": "full"}])
+    body = updates(api_client, body["cursor"])
+    assert [r["temp_air"] for r in body["sensors"]] == [15.0, 19.0]  # sorted by date_time
+    assert [r["date_time"] for r in body["leaf_area"]] == ["2025-11-01 12:00:00"]
+    assert updates(api_client, body["cursor"])["sensors"] == []
+
+
+def test_since_and_date_time_cursors(api_client):
+    insert("error_logs", [{"date_time": f"2025-11-03 1{h}:00:00", "error": f"h{h}"} for h in range(4)])
+    assert errors(updates(api_client, since="2025-11-03 11:00:00")) == ["h2", "h3"]
+    old_cursor = live.encode_cursor({"errors": "2025-11-03 12:00:00"})
+    body = updates(api_client, old_cursor)
+    assert errors(body) == ["h3"]
+    assert isinstance(live.decode_cursor(body["cursor"])["errors"], int)
+    # Nothing after since: start from the newest row
+    assert errors(updates(api_client, since="2025-11-04")) == []
+
+
+def test_cursor_validation():
+    assert live.decode_cursor(live.encode_cursor({"errors": 7})) == {"errors": 7}
+    for bad in ({"errors": -1}, {"errors": True}, {"errors": 1.5}, {"errors": None}):
+        with pytest.raises(ValueError):
+            live.decode_cursor(live.encode_cursor(bad))
+    with pytest.raises(ValueError):
+        live.decode_cursor("not a cursor")
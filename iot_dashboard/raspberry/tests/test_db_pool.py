@@ -0,0 +1,51 @@
+# ConnectionPool (db.py): a reused connection must see rows committed by other
+# connections after it was first used (no snapshot carried over between borrowers).
+
+import db
+from conftest import insert
+
+
+def count(pool):
+    with pool.connection() as pooled:
+        return pooled.query("SELECT COUNT(*) AS n FROM error_logs").fetchall()[0]["n"]
+
+
+def wal(path):
+    conn = db.get_connection()
+    conn.execute("PRAGMA journal_mode=WAL")  # readers keep a snapshot while in a transaction, like InnoDB
+    conn.close()
+
+
+def test_reused_connection_sees_new_rows(sqlite_db):
+    wal(sqlite_db)
+    pool = db.ConnectionPool(size=1)
+    assert count(pool) == 0
+    first = pool._idle[0]
+    insert("error_logs", [{"date_time": "2025-11-03 10:00:00", "error": "late"}])
+    assert count(pool) == 1
+    assert pool._idle[0] is first  # same connection, reused
+    assert pool.stats()["created"] == 1
+
+
+def test_release_ends_a_transaction_left_open(sqlite_db):
+    wal(sqlite_db)
+    # Non-autocommit factory: a borrower that leaves a transaction open must not pin its snapshot
+    pool = db.ConnectionPool(size=1, factory=db.get_connection)
+    with pool.connection() as pooled:
+        pooled.raw.execute("BEGIN")
+        pooled.query("SELECT COUNT(*) AS n FROM error_logs").fetchall()
+        assert pooled.raw.in_transaction
+    insert("error_logs", [{"date_time": "2025-11-03 10:00:00", "error": "late"}])
+    with pool.connection() as pooled:
+        assert not pooled.raw.in_transaction
+        assert pooled.query("SELECT COUNT(*) AS n FROM error_logs").fetchall()[0]["n"] == 1
+
+
+def test_pool_connections_are_autocommit(sqlite_db):
+    pool = db.ConnectionPool(size=1)
+    with pool.connection() as pooled:
+        assert pooled.raw.isolation_level is None
+    # Writers still get transactions
+    conn = db.get_connection()
+    assert conn.isolation_level == ""
+    conn.close()
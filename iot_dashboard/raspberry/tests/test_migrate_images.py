@@ -0,0 +1,66 @@
+# migrate_images.py: rows sharing a date_time are all migrated, and --drop-base64 also
+# clears rows migrated by an earlier run.
+
+import base64
+
+import cv2
+import numpy as np
+
+import db
+import migrate_images
+from conftest import insert
+
+
+def jpeg_b64(value):
+    image = np.full((40, 60, 3), value, dtype=np.uint8)
+    return base64.b64encode(cv2.imencode(".jpg", image)[1].tobytes()).decode()
+
+
+def images():
+    conn = db.get_connection()
+    rows = conn.execute("SELECT rowid AS id, image_sha, image_base64 IS NOT NULL AS has_b64 "
+                        "FROM plant_images ORDER BY rowid").fetchall()
+    conn.close()
+    return rows
+
+
+def run(**kwargs):
+    conn = db.get_connection()
+    try:
+        migrate_images.migrate(conn, **kwargs)
+    finally:
+        conn.close()
+
+
+def test_rows_sharing_a_date_time(sqlite_db):
+    insert("plant_images", [{"date_time": "2025-11-03 10:00:00", "image_base64": jpeg_b64(v)} for v in (10, 120, 240)])
+    insert("plant_images", [{"date_time": "2025-11-03 11:00:00", "image_base64": jpeg_b64(60)}])
+    run(batch=2)
+    rows = images()
+    assert all(r["image_sha"] for r in rows)
+    assert len({r["image_sha"] for r in rows}) == 4  # each row got its own image, not its neighbour's
+
+
+def test_drop_base64_covers_earlier_runs(sqlite_db):
+    insert("plant_images", [{"date_time": f"2025-11-03 10:00:0{i}", "image_base64": jpeg_b64(i * 40)} for i in range(3)])
+    run(batch=2)  # first run keeps the base64 copies
+    assert all(r["has_b64"] for r in images())
+    insert("plant_images", [{"date_time": "2025-11-03 12:00:00", "image_base64": jpeg_b64(200)},
+                            {"date_time": "2025-11-03 12:00:01", "image_base64": "not base64!"}])
+    run(batch=2, drop_base64=True)
+    rows = images()
+    assert [bool(r["image_sha"]) for r in rows] == [True, True, True, True, False]
+    # Migrated rows lost their base64 copy, the row that failed to decode keeps it
+    assert [r["has_b64"] for r in rows] == [0, 0, 0, 0, 1]
+
+
+def test_drop_pass_in_batches(sqlite_db):
+    insert("plant_images", [{"date_time": "2025-11-03 10:00:00", "image_base64": "x", "image_sha": f"{i:064x}"}
+                            for i in range(7)])
+    conn = db.get_connection()
+    try:
+        assert migrate_images.drop_base64_copies(conn, batch=3) == 7
+        assert migrate_images.drop_base64_copies(conn, batch=3) == 0
+    finally:
+        conn.close()
+    assert not any(r["has_b64"] for r in images())
@@ -0,0 +1,261 @@
+# MQTT ingest (mqtt_ingest.py) with the in-process LocalBroker and a SQLite server:
+# reading windows, redelivered duplicates, database outages and the shutdown flush.
+
+import asyncio
+import sqlite3
+
+import pytest
+
+import db
+import mqtt_ingest
+from mqtt_ingest import Correlator, Ingest, LocalBroker, WINDOW, DUP_WINDOW
+
+T0 = 1_762_000_000.0  # a fixed epoch second, so date_time values are predictable
+
+
+def server_rows(table):
+    conn = db.get_connection()
+    rows = conn.execute(f"SELECT * FROM {table} ORDER BY date_time, rowid").fetchall()
+    conn.close()
+    return rows
+
+
+class Clock:
+    def __init__(self, now=T0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# ---- Correlator ----
+
+def test_window_closes_when_every_sensor_arrived():
+    c = Correlator()
+    assert c.add("temp_air", 20.0, T0) == []
+    assert c.add("hum_air", 50.0, T0 + 1) == []
+    assert c.add("hum_soil", 30.0, T0 + 2) == []
+    (row,) = c.add("light", 70.0, T0 + 3)
+    assert row == {"temp_air": 20.0, "hum_air": 50.0, "hum_soil": 30.0, "light": 70.0,
+                   "date_time": mqtt_ingest.format_ts(T0), "started": T0}
+    assert c.open is None
+
+
+def test_window_times_out_with_missing_sensors():
+    c = Correlator()
+    c.add("temp_air", 20.0, T0)
+    assert c.expire(T0 + WINDOW) == []
+    (row,) = c.expire(T0 + WINDOW + 1)
+    assert row["temp_air"] == 20.0 and row["hum_air"] is None and row["light"] is None
+    # A message after the window starts the next reading and closes nothing
+    c2 = Correlator()
+    c2.add("temp_air", 20.0, T0)
+    (row,) = c2.add("hum_air", 50.0, T0 + WINDOW + 1)
+    assert row["hum_air"] is None
+    assert c2.open["values"] == {"hum_air": 50.0} and c2.open["started"] == T0 + WINDOW + 1
+
+
+def test_same_sensor_with_a_new_value_is_the_next_reading():
+    c = Correlator()
+    c.add("temp_air", 20.0, T0)
+    (row,) = c.add("temp_air", 21.0, T0 + 5)
+    assert row["temp_air"] == 20.0
+    assert c.open["values"] == {"temp_air": 21.0}
+
+
+def test_redelivered_messages_are_dropped():
+    c = Correlator()
+    c.add("temp_air", 20.0, T0)
+    assert c.add("temp_air", 20.0, T0 + 1) == []  # in the open window
+    for column, value in (("hum_air", 50.0), ("hum_soil", 30.0), ("light", 70.0)):
+        c.add(column, value, T0 + 2)
+    assert c.add("light", 70.0, T0 + 120) == []  # late, after the window closed
+    assert c.duplicates == 2 and c.open is None
+    # Same value in a later reading is a real reading
+    assert c.add("light", 70.0, T0 + DUP_WINDOW + 1) == []
+    assert c.open["values"] == {"light": 70.0}
+
+
+# ---- Writes ----
+
+class FlakyServer:
+    """connect_db for Ingest: fails while `down`; fail='commit' commits nothing, 'ack' commits then raises."""
+
+    def __init__(self):
+        self.down = False
+        self.fail = None
+
+    def __call__(self):
+        if self.down:
+            raise sqlite3.OperationalError("server unreachable")
+        return _Connection(self)
+
+
+class _Connection:
+    def __init__(self, server):
+        self.server = server
+        self.conn = db.get_connection()
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def commit(self):
+        if self.server.fail == "commit":
+            raise sqlite3.OperationalError("connection lost before commit")
+        self.conn.commit()
+        if self.server.fail == "ack":
+            raise sqlite3.OperationalError("connection lost after commit")
+
+    def close(self):
+        self.conn.close()
+
+
+def feed(ingest, clock, readings, start=0):
+    """Publish complete readings 10 min apart, plus an error every third one."""
+    for i in range(start, start + readings):
+        clock.now = T0 + 600 * i
+        for topic in mqtt_ingest.SENSOR_TOPICS:
+            ingest.handle(topic, f"{i}.5".encode())
+        if i % 3 == 0:
+            ingest.handle(mqtt_ingest.ERROR_TOPIC, b"DHT11 read failed")
+
+
+def test_outage_keeps_the_buffers_and_writes_once(sqlite_db):
+    server, clock = FlakyServer(), Clock()
+    ingest = Ingest(connect_db=server, clock=clock)
+    feed(ingest, clock, 3)
+    server.down = True
+    assert not ingest.flush()
+    feed(ingest, clock, 3, start=3)
+    server.down, server.fail = False, "commit"
+    assert not ingest.flush()  # rolled back: nothing stored, everything still buffered
+    assert server_rows("sensor_data") == []
+    assert len(ingest.rows) == 6 and len(ingest.errors) == 2
+    server.fail = None
+    assert ingest.flush()
+    assert [r["temp_air"] for r in server_rows("sensor_data")] == [i + 0.5 for i in range(6)]
+    assert len(server_rows("error_logs")) == 2
+    assert ingest.metrics["write_failures"] == 2 and ingest.rows == [] and ingest.errors == []
+
+
+def test_lost_commit_ack_is_not_duplicated(sqlite_db):
+    server, clock = FlakyServer(), Clock()
+    ingest = Ingest(connect_db=server, clock=clock)
+    feed(ingest, clock, 4)
+    server.fail = "ack"
+    assert not ingest.flush()  # stored, but the ingest does not know
+    server.fail = None
+    assert ingest.flush()      # written again: the NOT EXISTS inserts skip every row
+    assert len(server_rows("sensor_data")) == 4
+    assert len(server_rows("error_logs")) == 2
+    hourly = server_rows("sensor_hourly")
+    assert sum(r["n"] for r in hourly) == 4  # rollups rebuilt from sensor_data, not added twice
+
+
+def test_batches_of_batch_size(sqlite_db, monkeypatch):
+    monkeypatch.setattr(mqtt_ingest, "BATCH_SIZE", 4)
+    clock = Clock()
+    ingest = Ingest(clock=clock)
+    feed(ingest, clock, 10)
+    while ingest.rows or ingest.errors:
+        assert ingest.flush()
+    ingest._close_conn()
+    assert ingest.metrics["batches"] == 3
+    assert len(server_rows("sensor_data")) == 10 and len(server_rows("error_logs")) == 4
+
+
+# ---- Through the broker ----
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(mqtt_ingest, "FLUSH_INTERVAL", 0.02)
+    monkeypatch.setattr(mqtt_ingest, "BACKOFF_MIN", 0.01)
+
+
+async def _start(broker, ingest):
+    task = asyncio.create_task(ingest.run(lambda: broker.client(mqtt_ingest.CLIENT_ID)))
+    while len(broker.sessions.get(mqtt_ingest.CLIENT_ID, {}).get("filters", ())) < 2:
+        await asyncio.sleep(0.005)
+    return task
+
+
+async def _until(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+async def _stop(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def test_redelivery_after_a_dropped_connection(sqlite_db, fast):
+    async def scenario():
+        broker, clock = LocalBroker(), Clock()
+        ingest = Ingest(clock=clock)
+        task = await _start(broker, ingest)
+        broker.publish("sensors/temperature", b"20.0")
+        broker.publish("sensors/humidity", b"50.0")
+        await _until(lambda: ingest.metrics["messages"] == 2)
+        broker.drop()  # the humidity message is delivered again after the reconnect
+        broker.publish("sensors/soil", b"30.0")
+        broker.publish("sensors/light", b"70.0")
+        await _until(lambda: ingest.metrics["rows_written"] == 1)
+        await _stop(task)
+        return ingest
+
+    ingest = asyncio.run(scenario())
+    rows = server_rows("sensor_data")
+    assert len(rows) == 1
+    assert (rows[0]["temp_air"], rows[0]["hum_air"], rows[0]["hum_soil"], rows[0]["light"]) == (20.0, 50.0, 30.0, 70.0)
+    assert ingest.metrics["messages"] == 5 and ingest.correlator.duplicates == 1
+    assert ingest.metrics["reconnects"] == 1
+
+
+def test_database_outage_while_receiving(sqlite_db, fast):
+    async def scenario():
+        broker, clock, server = LocalBroker(), Clock(), FlakyServer()
+        ingest = Ingest(connect_db=server, clock=clock)
+        task = await _start(broker, ingest)
+        server.down = True
+        for i in range(5):
+            clock.now = T0 + 600 * i
+            for topic in mqtt_ingest.SENSOR_TOPICS:
+                broker.publish(topic, f"{i}.5".encode())
+            await _until(lambda: ingest.metrics["messages"] == 4 * (i + 1))
+        await _until(lambda: ingest.metrics["write_failures"] >= 1)
+        assert len(ingest.rows) == 5
+        server.down = False
+        await _until(lambda: not ingest.rows)
+        await _stop(task)
+        return ingest
+
+    ingest = asyncio.run(scenario())
+    assert [r["temp_air"] for r in server_rows("sensor_data")] == [i + 0.5 for i in range(5)]
+
+
+def test_shutdown_writes_what_is_buffered(sqlite_db, fast, monkeypatch):
+    monkeypatch.setattr(mqtt_ingest, "FLUSH_INTERVAL", 60.0)  # nothing written before the stop
+
+    async def scenario():
+        broker, clock = LocalBroker(), Clock()
+        ingest = Ingest(clock=clock)
+        task = await _start(broker, ingest)
+        broker.publish("sensors/temperature", b"20.0")
+        broker.publish(mqtt_ingest.ERROR_TOPIC, b"DHT11 read failed")
+        await _until(lambda: ingest.metrics["messages"] == 2)
+        assert server_rows("sensor_data") == []
+        await _stop(task)
+        return ingest
+
+    ingest = asyncio.run(scenario())
+    rows = server_rows("sensor_data")
+    assert len(rows) == 1 and rows[0]["temp_air"] == 20.0 and rows[0]["light"] is None
+    assert [r["error"] for r in server_rows("error_logs")] == ["DHT11 read failed"]
+    assert ingest._conn is None
@@ -0,0 +1,31 @@
+# ResponseCache table state: data_versions is tried again after an error instead of
+# being given up for the life of the worker.
+
+import db
+from response_cache import ResponseCache, upgrade_schema
+from test_touch import drop_versions
+
+
+def test_versions_retried_after_error(sqlite_db):
+    drop_versions()
+    pool = db.ConnectionPool(size=1)
+    cache = ResponseCache(pool, versions_retry=3600)
+    try:
+        # Started before upgrade_schema(): newest date_time only
+        assert "/" not in cache._read_token("sensor_data")
+        assert not cache.versions
+
+        conn = db.get_connection()
+        upgrade_schema(conn)
+        db.touch(conn.cursor(), "sensor_data")
+        conn.commit()
+        conn.close()
+
+        # Not re-read inside the retry window
+        assert "/" not in cache._read_token("sensor_data")
+        cache.versions_retry = 0
+        assert cache._read_token("sensor_data").endswith("/1")
+        assert cache.versions
+    finally:
+        for pooled in pool._idle:
+            pooled.close()
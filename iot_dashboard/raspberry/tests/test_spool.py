@@ -0,0 +1,205 @@
+# Capture spool (spool.py) against a SQLite stand-in for the server: queueing, retries,
+# idempotent re-uploads and burying bad records; plus the capture schedule of cam_hour.py.
+
+import sqlite3
+
+import cv2
+import numpy as np
+import pytest
+
+import cam_hour
+import db
+import spool
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = spool.Spool(str(tmp_path / "spool.db"))
+    yield q
+    q.close()
+
+
+def server_rows(table):
+    conn = db.get_connection()
+    rows = conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+    conn.close()
+    return rows
+
+
+def photo_file(tmp_path, value):
+    path = str(tmp_path / f"img_{value}.jpg")
+    cv2.imwrite(path, np.full((48, 64, 3), value, dtype=np.uint8))
+    return path
+
+
+def dead(q):
+    return q._conn.execute("SELECT key, last_error FROM spool WHERE dead = 1").fetchall()
+
+
+# ---- Spool ----
+
+def test_put_and_due_in_order(queue):
+    for i in range(3):
+        queue.put(f"err:{i}", "error", {"date_time": f"2025-11-03 10:00:0{i}", "error": str(i)})
+    queue.put("err:0", "error", {"date_time": "other", "error": "other"})  # same key: kept once
+    due = queue.due()
+    assert [key for key, _, _ in due] == ["err:0", "err:1", "err:2"]
+    assert due[0][2] == {"date_time": "2025-11-03 10:00:00", "error": "0"}
+    assert queue.due(limit=2) == due[:2]
+    queue.done(["err:0"])
+    assert queue.stats()["pending"] == 2
+
+
+def test_retry_waits_and_counts_attempts(queue):
+    queue.put("err:0", "error", {"date_time": "2025-11-03 10:00:00", "error": "x"})
+    queue.retry(["err:0"], "server down", delay=60)
+    assert queue.due() == []
+    assert queue.stats()["pending"] == 1
+    queue.retry(["err:0"], "server down", delay=-1)
+    assert [key for key, _, _ in queue.due()] == ["err:0"]
+    attempts, error = queue._conn.execute("SELECT attempts, last_error FROM spool").fetchone()
+    assert (attempts, error) == (2, "server down")
+
+
+# ---- Uploads ----
+
+def test_re_upload_is_idempotent(sqlite_db, tmp_path):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    path = photo_file(tmp_path, 90)
+    for _ in range(2):
+        spool.upload_error(cursor, {"date_time": "2025-11-03 10:00:00", "error": "camera busy"})
+        spool.upload_image(cursor, {"date_time": "2025-11-03 10:00:00", "path": path})
+        spool.leaf_stage.upload_leaf(cursor, {"date_time": "2025-11-03 10:00:00", "leaf_pixels": 5,
+                                              "total_pixels": 10, "leaf_fraction": 0.5, "mode": "full"})
+    conn.commit()
+    conn.close()
+    assert len(server_rows("error_logs")) == 1
+    assert len(server_rows("plant_images")) == 1
+    assert len(server_rows("leaf_area")) == 1
+    assert len(server_rows("image_blobs")) == 3  # full, medium, small
+    # Same time, another error or photo: a different record, stored
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    spool.upload_error(cursor, {"date_time": "2025-11-03 10:00:00", "error": "disk full"})
+    spool.upload_image(cursor, {"date_time": "2025-11-03 10:00:00", "path": photo_file(tmp_path, 200)})
+    conn.commit()
+    conn.close()
+    assert len(server_rows("error_logs")) == 2
+    assert len(server_rows("plant_images")) == 2
+
+
+def test_batch_resent_after_a_lost_ack(sqlite_db, queue, tmp_path):
+    # The server committed the batch but the spool did not hear back (power cut): it is sent again
+    queue.put("img:a", "image", {"date_time": "2025-11-03 10:00:00", "path": photo_file(tmp_path, 30)})
+    queue.put("err:a", "error", {"date_time": "2025-11-03 10:00:00", "error": "x"})
+    uploader = spool.Uploader(queue)
+    items = queue.due()
+    assert uploader.upload_batch(items)
+    assert uploader.upload_batch(items)
+    uploader._close_conn()
+    assert len(server_rows("plant_images")) == 1
+    assert len(server_rows("error_logs")) == 1
+    assert queue.stats()["pending"] == 0
+    versions = {r["name"]: r["version"] for r in server_rows("data_versions")}
+    assert versions == {"plant_images": 2, "error_logs": 2}
+
+
+def test_bad_record_is_buried_and_the_rest_uploaded(sqlite_db, queue, tmp_path):
+    queue.put("img:gone", "image", {"date_time": "2025-11-03 10:00:00", "path": str(tmp_path / "missing.jpg")})
+    queue.put("leaf:bad", "leaf", {"date_time": "2025-11-03 10:00:00"})  # fields missing
+    queue.put("err:ok", "error", {"date_time": "2025-11-03 10:00:00", "error": "ok"})
+    uploader = spool.Uploader(queue)
+    assert uploader.upload_batch(queue.due())
+    uploader._close_conn()
+    assert sorted(key for key, _ in dead(queue)) == ["img:gone", "leaf:bad"]
+    stats = queue.stats()
+    assert (stats["pending"], stats["dead"]) == (0, 2)
+    assert queue.due() == []
+    assert [r["error"] for r in server_rows("error_logs")] == ["ok"]
+    assert uploader.uploaded == 1
+
+
+def test_server_down_keeps_the_batch(sqlite_db, queue):
+    queue.put("err:a", "error", {"date_time": "2025-11-03 10:00:00", "error": "x"})
+
+    def down():
+        raise sqlite3.OperationalError("server unreachable")
+
+    uploader = spool.Uploader(queue, connect=down)
+    assert not uploader.upload_batch(queue.due())
+    assert queue.stats()["pending"] == 1 and queue.due() == []  # retried after the backoff
+    attempts, error = queue._conn.execute("SELECT attempts, last_error FROM spool").fetchone()
+    assert (attempts, error) == (1, "server unreachable")
+    # Back up: the next attempt goes through
+    queue.retry(["err:a"], "", delay=-1)
+    uploader.connect = db.get_connection
+    assert uploader.upload_batch(queue.due())
+    uploader._close_conn()
+    assert len(server_rows("error_logs")) == 1
+
+
+def test_uploader_thread_drains_the_spool(sqlite_db, queue, monkeypatch):
+    monkeypatch.setattr(spool, "IDLE_POLL", 0.02)
+    for i in range(7):
+        queue.put(f"err:{i}", "error", {"date_time": f"2025-11-03 10:00:0{i}", "error": str(i)})
+    uploader = spool.Uploader(queue, batch=3).start()
+    try:
+        for _ in range(200):
+            if not queue.stats()["pending"]:
+                break
+            uploader._stop.wait(0.01)
+    finally:
+        uploader.stop()
+    assert [r["error"] for r in server_rows("error_logs")] == [str(i) for i in range(7)]
+
+
+# ---- cam_hour schedule ----
+
+def test_next_boundary():
+    assert cam_hour.next_boundary(7200.0, 3600) == 10800.0  # strictly after a boundary
+    assert cam_hour.next_boundary(7199.9, 3600) == 7200.0
+    assert cam_hour.next_boundary(1000.5, 60) == 1020.0
+
+
+class FakeClock:
+    """time.time/time.sleep stand-in; `jumps` maps an instant to a clock step (NTP)."""
+
+    def __init__(self, now, jumps=None):
+        self.now = now
+        self.jumps = dict(jumps or {})
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        for at in [t for t in self.jumps if self.now >= t]:
+            self.now += self.jumps.pop(at)
+
+
+def test_schedule_does_not_drift(monkeypatch):
+    # Each capture takes a variable while; the next one still lands on the hour
+    clock = FakeClock(3600 * 100 + 1234.0)
+    monkeypatch.setattr(cam_hour.time, "time", clock.time)
+    monkeypatch.setattr(cam_hour.time, "sleep", clock.sleep)
+    rng = np.random.default_rng(0)
+    shots = []
+    for _ in range(24):
+        cam_hour.sleep_until(cam_hour.next_boundary(clock.time(), 3600))
+        shots.append(clock.time())
+        clock.now += float(rng.uniform(5, 900))  # burst + save + leaf stage
+    assert all(t % 3600 == 0 for t in shots)
+    assert np.all(np.diff(shots) == 3600)
+    assert max(clock.sleeps) <= 60  # the clock is re-read at least every minute
+
+
+def test_schedule_follows_a_clock_step(monkeypatch):
+    # NTP steps the clock back 5 min during the wait: the capture still happens on the hour
+    clock = FakeClock(3600 * 100 + 10.0, jumps={3600 * 100 + 600: -300})
+    monkeypatch.setattr(cam_hour.time, "time", clock.time)
+    monkeypatch.setattr(cam_hour.time, "sleep", clock.sleep)
+    cam_hour.sleep_until(cam_hour.next_boundary(clock.time(), 3600))
+    assert clock.time() == 3600 * 101
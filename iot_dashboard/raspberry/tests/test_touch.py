@@ -0,0 +1,57 @@
+# db.touch: writers keep working on a server where data_versions was not created yet.
+
+import pytest
+
+import db
+import mqtt_ingest
+import spool
+from test_spool import server_rows
+
+
+def drop_versions():
+    conn = db.get_connection()
+    conn.execute("DROP TABLE data_versions")
+    conn.commit()
+    conn.close()
+
+
+def test_touch_counts_changes(sqlite_db):
+    conn = db.get_connection()
+    db.touch(conn.cursor(), "sensor_data", "error_logs")
+    db.touch(conn.cursor(), "sensor_data")
+    conn.commit()
+    conn.close()
+    assert {r["name"]: r["version"] for r in server_rows("data_versions")} == {"sensor_data": 2, "error_logs": 1}
+
+
+def test_writers_without_data_versions(sqlite_db, tmp_path):
+    drop_versions()
+    # Spool uploader
+    queue = spool.Spool(str(tmp_path / "spool.db"))
+    queue.put("err:a", "error", {"date_time": "2025-11-03 10:00:00", "error": "x"})
+    uploader = spool.Uploader(queue)
+    assert uploader.upload_batch(queue.due())
+    uploader._close_conn()
+    assert queue.stats()["pending"] == 0
+    queue.close()
+    # MQTT ingest: rows, rollups and errors in the same transaction as the skipped touch
+    ingest = mqtt_ingest.Ingest(clock=lambda: 1_762_000_000.0)
+    for topic in mqtt_ingest.SENSOR_TOPICS:
+        ingest.handle(topic, b"1.5")
+    ingest.handle(mqtt_ingest.ERROR_TOPIC, b"DHT11 read failed")
+    assert ingest.flush()
+    ingest._close_conn()
+    assert len(server_rows("sensor_data")) == 1
+    assert len(server_rows("sensor_hourly")) == 1
+    assert len(server_rows("error_logs")) == 2
+
+
+def test_other_errors_still_raise(sqlite_db):
+    conn = db.get_connection()
+    conn.execute("DROP TABLE data_versions")
+    conn.execute("CREATE TABLE data_versions (name TEXT)")  # wrong shape: a real error
+    try:
+        with pytest.raises(db.DB_ERRORS):
+            db.touch(conn.cursor(), "sensor_data")
+    finally:
+        conn.close()
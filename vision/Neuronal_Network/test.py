@@ -1,7 +1,12 @@
+import os
+import sys
 import cv2 as cv
-from ultralytics import YOLO
 
-model = YOLO("/home/danieldrg/Documents/CNN/best.pt")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from onnx_detector import load_detector
+
+# .pt checkpoint or its ONNX export (onnx_detector.py)
+model = load_detector("/home/danieldrg/Documents/CNN/best.pt")
 min_area = 200
 max_area = 10000
 
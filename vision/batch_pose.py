@@ -0,0 +1,181 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Batched depth and pose estimation for every detection in a frame.
+# Robust depths for all boxes are computed in one vectorized pass and box centers are
+# back-projected in closed form from the intrinsics; iterative PnP is an optional refinement.
+
+import time
+
+import cv2 as cv
+import numpy as np
+
+WIDTH_STRAWBERRY = 0.0326 #m
+HEIGHT_STRAWBERRY = 0.0342 #m
+
+# Larger than any z16 depth value, used to push invalid pixels to the end of each row
+_INVALID = np.iinfo(np.uint16).max + 1
+
+
+def robust_median_depth(depth_scale, depth_image, x1, y1, x2, y2):
+    """Compute the robust median depth in the specified ROI in meters."""
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(depth_image.shape[1] - 1, x2), min(depth_image.shape[0] - 1, y2)
+    roi = depth_image[y1:y2+1, x1:x2+1]
+    roi = roi[roi > 0]  # Remove zero values
+    if len(roi) == 0:
+        return None
+    # Filter out outliers
+    lo, hi = np.percentile(roi, [5, 95])
+    roi = roi[(roi >= lo) & (roi <= hi)]
+    if roi.size == 0:
+        return None
+    return np.median(roi) * depth_scale # Convert to meters
+
+
+def clip_boxes(boxes, shape):
+    """Clip (N, 4) x1, y1, x2, y2 boxes to the image, same rule as robust_median_depth."""
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4).copy()
+    boxes[:, 0:2] = np.maximum(boxes[:, 0:2], 0)
+    boxes[:, 2] = np.minimum(boxes[:, 2], shape[1] - 1)
+    boxes[:, 3] = np.minimum(boxes[:, 3], shape[0] - 1)
+    return boxes
+
+
+def _take(values, idx):
+    return np.take_along_axis(values, idx[:, None], axis=1)[:, 0].astype(np.float64)
+
+
+def batch_robust_depths(depth_image, boxes, depth_scale, lo_pct=5, hi_pct=95):
+    """
+    Robust median depth (m) of every box in one pass.
+    Matches robust_median_depth box by box: zeros are ignored, values outside the
+    [lo_pct, hi_pct] percentiles are trimmed and the median of the rest is returned.
+    Boxes without valid depth get NaN.
+    """
+    boxes = clip_boxes(boxes, depth_image.shape)
+    n_boxes = len(boxes)
+    if n_boxes == 0:
+        return np.empty(0, dtype=np.float64)
+
+    widths = np.maximum(boxes[:, 2] - boxes[:, 0] + 1, 0)
+    heights = np.maximum(boxes[:, 3] - boxes[:, 1] + 1, 0)
+    sizes = widths * heights
+
+    # One row per box, padded with _INVALID so every row can be sorted together
+    values = np.full((n_boxes, max(int(sizes.max()), 1)), _INVALID, dtype=np.int32)
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        if sizes[i]:
+            values[i, :sizes[i]] = depth_image[y1:y2+1, x1:x2+1].ravel()
+    values[values == 0] = _INVALID
+    values.sort(axis=1)
+
+    valid = (values < _INVALID).sum(axis=1)
+    has_depth = valid > 0
+    last = np.maximum(valid - 1, 0)
+
+    # Linear-interpolated percentiles, same definition as np.percentile
+    bounds = []
+    for pct in (lo_pct, hi_pct):
+        pos = last * (pct / 100.0)
+        below = np.floor(pos).astype(np.int64)
+        above = np.minimum(below + 1, last)
+        v_below, v_above = _take(values, below), _take(values, above)
+        bounds.append(v_below + (v_above - v_below) * (pos - below))
+    lo, hi = bounds
+
+    # Rows are sorted, so the kept values are the contiguous run [start, stop)
+    start = (values < lo[:, None]).sum(axis=1)
+    stop = (values <= hi[:, None]).sum(axis=1)
+    kept = stop - start
+    has_depth &= kept > 0
+
+    mid_lo = np.clip(start + (kept - 1) // 2, 0, values.shape[1] - 1)
+    mid_hi = np.clip(start + kept // 2, 0, values.shape[1] - 1)
+    median = (_take(values, mid_lo) + _take(values, mid_hi)) / 2.0
+
+    return np.where(has_depth, median * depth_scale, np.nan)
+
+
+def backproject_centers(boxes, depths, camera_matrix, dist_coeffs=None):
+    """Camera-frame XYZ (m) of each box center at the given depths, shape (N, 3)."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2.0,
+                        (boxes[:, 1] + boxes[:, 3]) / 2.0], axis=1)
+
+    if dist_coeffs is not None and np.any(dist_coeffs) and len(centers):
+        normalized = cv.undistortPoints(centers.reshape(-1, 1, 2), camera_matrix, dist_coeffs).reshape(-1, 2)
+    else:
+        fx, fy = camera_matrix[0, 0], camera_matrix[1, 1]
+        cx, cy = camera_matrix[0, 2], camera_matrix[1, 2]
+        normalized = np.stack([(centers[:, 0] - cx) / fx, (centers[:, 1] - cy) / fy], axis=1)
+
+    depths = np.asarray(depths, dtype=np.float64)
+    return np.column_stack([normalized * depths[:, None], depths])
+
+
+def refine_pose_pnp(box, Z, camera_matrix, dist_coeffs, tvec_guess,
+                    width=WIDTH_STRAWBERRY, height=HEIGHT_STRAWBERRY):
+    """Iterative PnP on the box corners, seeded with the closed-form translation."""
+    x1, y1, x2, y2 = box
+    image_points = np.array([
+        (x1, y1),         # Top-left
+        (x2, y1),         # Top-right
+        (x2, y2),         # Bottom-right
+        (x1, y2)          # Bottom-left
+    ], dtype="double")
+
+    object_points = np.array([
+        (-width/2, -height/2, 0.0),  # Top-left
+        ( width/2, -height/2, 0.0),  # Top-right
+        ( width/2,  height/2, 0.0),  # Bottom-right
+        (-width/2,  height/2, 0.0)   # Bottom-left
+    ])
+
+    rvec = np.zeros((3,1), dtype=np.float64)   # neutral initial orientation
+    tvec = np.asarray(tvec_guess, dtype=np.float64).reshape(3, 1).copy()
+    success, rvec, tvec = cv.solvePnP(
+        objectPoints=object_points,
+        imagePoints=image_points,
+        cameraMatrix=camera_matrix,
+        distCoeffs=dist_coeffs,
+        rvec=rvec,
+        tvec=tvec,
+        useExtrinsicGuess=True,
+        flags=cv.SOLVEPNP_ITERATIVE
+    )
+    if not success:
+        return None
+    tvec[2,0] = Z # Keep the measured depth
+    R, _ = cv.Rodrigues(rvec)
+    return R, tvec.reshape(3)
+
+
+def batch_poses(depth_image, boxes, depth_scale, camera_matrix, dist_coeffs=None, refine=False, timings=None):
+    """
+    Depths (N,) and camera-frame poses (N, 4, 4), both in meters, for every box.
+    Poses are identity-rotation translations to the box center; with refine=True
+    iterative PnP is run per box to add orientation. Boxes without depth (or with a
+    failed refinement) get NaN depth and a NaN pose.
+    If timings is a dict, the seconds spent in "depth", "backproject" and "pnp" are stored in it.
+    """
+    t0 = time.perf_counter()
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    depths = batch_robust_depths(depth_image, boxes, depth_scale)
+    t1 = time.perf_counter()
+
+    poses = np.tile(np.eye(4), (len(boxes), 1, 1))
+    poses[:, :3, 3] = backproject_centers(boxes, depths, camera_matrix, dist_coeffs)
+    t2 = time.perf_counter()
+
+    if refine:
+        for i in np.flatnonzero(~np.isnan(depths)):
+            result = refine_pose_pnp(boxes[i], depths[i], camera_matrix, dist_coeffs, poses[i, :3, 3])
+            if result is None:
+                depths[i] = np.nan
+                continue
+            poses[i, :3, :3], poses[i, :3, 3] = result
+
+    poses[np.isnan(depths)] = np.nan
+    if timings is not None:
+        timings.update(depth=t1 - t0, backproject=t2 - t1, pnp=time.perf_counter() - t2)
+    return depths, poses
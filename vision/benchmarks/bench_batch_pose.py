@@ -0,0 +1,100 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Compares the per-box depth + solvePnP loop used by the perception scripts
+# against the batched pose stage (batch_pose.py) on synthetic 1280x720 depth maps.
+# Usage: python vision/benchmarks/bench_batch_pose.py [--repeats 50]
+
+import argparse
+import os
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from batch_pose import (HEIGHT_STRAWBERRY, WIDTH_STRAWBERRY, batch_poses,
+                        robust_median_depth)
+
+DEPTH_SCALE = 0.001
+CAMERA_MATRIX = np.array([[910.0,   0.0, 640.0],
+                          [  0.0, 910.0, 360.0],
+                          [  0.0,   0.0,   1.0]], dtype=np.float64)
+DIST_COEFFS = np.zeros(5, dtype=np.float64)
+
+
+def synthetic_scene(n_boxes, rng, width=1280, height=720):
+    """Depth map (z16) with a background plane, n strawberry blobs, holes and noise."""
+    depth = np.full((height, width), 900, dtype=np.float64)
+    depth += rng.normal(0, 4, depth.shape)
+    yy, xx = np.mgrid[0:height, 0:width]
+
+    boxes = []
+    for _ in range(n_boxes):
+        r = rng.integers(25, 70)
+        cx, cy = rng.integers(r, width - r), rng.integers(r, height - r)
+        z = rng.uniform(300, 600)
+        inside = (xx - cx) ** 2 + (yy - cy) ** 2 <= r * r
+        depth[inside] = z + rng.normal(0, 3, inside.sum())
+        boxes.append((cx - r, cy - r, cx + r, cy + r))
+
+    depth[rng.random(depth.shape) < 0.05] = 0  # Missing depth
+    return depth.clip(0, 65535).astype(np.uint16), boxes
+
+
+def per_box(depth, boxes):
+    """The current path: robust_median_depth + iterative solvePnP for each box."""
+    w, h = WIDTH_STRAWBERRY, HEIGHT_STRAWBERRY
+    object_points = np.array([(-w/2, -h/2, 0.0), (w/2, -h/2, 0.0), (w/2, h/2, 0.0), (-w/2, h/2, 0.0)])
+    depths, poses = [], []
+    for x1, y1, x2, y2 in boxes:
+        Z = robust_median_depth(DEPTH_SCALE, depth, x1, y1, x2, y2)
+        if Z is None:
+            depths.append(np.nan)
+            poses.append(None)
+            continue
+        image_points = np.array([(x1, y1), (x2, y1), (x2, y2), (x1, y2)], dtype="double")
+        rvec = np.zeros((3,1), dtype=np.float64)
+        tvec = np.array([[0],[0],[Z]], dtype=np.float64)
+        success, rvec, tvec = cv.solvePnP(object_points, image_points, CAMERA_MATRIX, DIST_COEFFS,
+                                          rvec=rvec, tvec=tvec, useExtrinsicGuess=True,
+                                          flags=cv.SOLVEPNP_ITERATIVE)
+        tvec[2,0] = Z
+        depths.append(Z)
+        poses.append(tvec.reshape(3))
+    return np.array(depths), poses
+
+
+def time_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return np.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-box vs batched depth/pose benchmark")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 5, 15, 30])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>5} | {'per-box ms':>10} | {'batch ms':>8} | {'batch+PnP ms':>12} | {'speedup':>7} | max |dZ| m")
+    for n in args.counts:
+        depth, boxes = synthetic_scene(n, rng)
+
+        ref_depths, _ = per_box(depth, boxes)
+        depths, _ = batch_poses(depth, boxes, DEPTH_SCALE, CAMERA_MATRIX, DIST_COEFFS)
+        max_err = np.nanmax(np.abs(ref_depths - depths)) if n else 0.0
+
+        t_ref = time_ms(lambda: per_box(depth, boxes), args.repeats)
+        t_batch = time_ms(lambda: batch_poses(depth, boxes, DEPTH_SCALE, CAMERA_MATRIX, DIST_COEFFS), args.repeats)
+        t_refine = time_ms(lambda: batch_poses(depth, boxes, DEPTH_SCALE, CAMERA_MATRIX, DIST_COEFFS, refine=True),
+                           args.repeats)
+        print(f"{n:>5} | {t_ref:>10.2f} | {t_batch:>8.2f} | {t_refine:>12.2f} | {t_ref / t_batch:>6.1f}x | {max_err:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Checkpoint selection for deployment. Reads every run in
+# Neuronal_Network/runs/detect (args.yaml + results.csv), then evaluates the weights of each
+# run on a fixed validation set at several input sizes: mAP50 / mAP50-95 (bench_detector.py
+# metric), warm CPU latency percentiles and peak memory. Every (run, imgsz) is measured in a
+# fresh process, so its peak RSS is its own. The output is a table with the Pareto front of
+# latency vs mAP50-95 marked (optionally as CSV and a PNG plot) to pick the model and imgsz.
+# Runs without weights on disk are listed with their training metrics only.
+# Usage: python vision/benchmarks/bench_checkpoints.py [--imgsz 320 480 640] [--threads 4]
+#            [--backend pt|onnx] [--csv checkpoints.csv] [--plot checkpoints.png]
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+
+import cv2 as cv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from onnx_detector import dataset_images, export_onnx, load_detector
+from bench_detector import evaluate, latency_ms
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:  # the plot is optional, the table is always printed
+    plt = None
+
+VISION_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+RUNS_DIR = os.path.join(VISION_DIR, "Neuronal_Network", "runs", "detect")
+PERCENTILES = (50, 90, 99)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (nan when it cannot be read)."""
+    if sys.platform == "win32":
+        # No resource module on Windows; the peak working set is the equivalent
+        try:
+            import psutil
+        except ImportError:
+            return float("nan")
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def read_run(run_dir):
+    """Training summary of one run: args and the epoch best.pt was saved at (ultralytics fitness)."""
+    import yaml
+    with open(os.path.join(run_dir, "args.yaml")) as f:
+        args = yaml.safe_load(f)
+    run = {"name": os.path.basename(run_dir), "dir": run_dir, "model": args.get("model"),
+           "epochs": args.get("epochs"), "train_imgsz": args.get("imgsz"), "best_epoch": None,
+           "train_map50": None, "train_map": None}
+    results = os.path.join(run_dir, "results.csv")
+    if os.path.exists(results):
+        with open(results) as f:
+            rows = [{k.strip(): v.strip() for k, v in row.items()} for row in csv.DictReader(f)]
+        if rows:
+            best = max(rows, key=lambda r: 0.1 * float(r["metrics/mAP50(B)"]) + 0.9 * float(r["metrics/mAP50-95(B)"]))
+            run.update(best_epoch=int(best["epoch"]), train_map50=float(best["metrics/mAP50(B)"]),
+                       train_map=float(best["metrics/mAP50-95(B)"]))
+    return run
+
+
+def discover_runs(runs_dir, weights_name="best.pt"):
+    runs = []
+    for name in sorted(os.listdir(runs_dir)):
+        run_dir = os.path.join(runs_dir, name)
+        if os.path.exists(os.path.join(run_dir, "args.yaml")):
+            run = read_run(run_dir)
+            weights = os.path.join(run_dir, "weights", weights_name)
+            run["weights"] = weights if os.path.exists(weights) else None
+            runs.append(run)
+    return runs
+
+
+def measure(job):
+    """One (weights, imgsz) measurement; runs in its own process."""
+    weights, imgsz, backend, threads, images, latency_images, classes = job
+    kwargs = {"imgsz": imgsz}
+    if backend == "onnx":
+        # Static input: one export per size, kept next to the checkpoint
+        path = weights[:-len(".pt")] + f"-{imgsz}.onnx"
+        if not os.path.exists(path):
+            os.replace(export_onnx(weights, imgsz), path)
+        weights, kwargs = path, {}
+    model = load_detector(weights, threads=threads)
+    frames = [f for f in (cv.imread(p) for p in images[:latency_images]) if f is not None]
+    latency = latency_ms(model, frames, percentiles=PERCENTILES, **kwargs)
+    map50, map5095 = evaluate(model, images, classes, **kwargs)
+    peak_mb = peak_rss_mb()
+    return {"latency": latency, "map50": map50, "map": map5095, "peak_mb": peak_mb}
+
+
+def pareto(rows):
+    """Flag the rows no other row beats on both latency (p50) and mAP50-95."""
+    for row in rows:
+        row["pareto"] = not any(
+            o is not row and o["latency"][0] <= row["latency"][0] and o["map"] >= row["map"]
+            and (o["latency"][0] < row["latency"][0] or o["map"] > row["map"])
+            for o in rows)
+    return rows
+
+
+def plot(rows, path):
+    if plt is None:
+        print("matplotlib not installed, no plot written")
+        return
+    fig, ax = plt.subplots(figsize=(7, 5))
+    for row in rows:
+        ax.scatter(row["latency"][0], row["map"], color="tab:red" if row["pareto"] else "tab:gray")
+        ax.annotate(f"{row['name']}@{row['imgsz']}", (row["latency"][0], row["map"]), fontsize=8,
+                    xytext=(4, 4), textcoords="offset points")
+    front = sorted((r for r in rows if r["pareto"]), key=lambda r: r["latency"][0])
+    ax.plot([r["latency"][0] for r in front], [r["map"] for r in front], color="tab:red", linestyle="--")
+    ax.set_xlabel("p50 CPU latency (ms)")
+    ax.set_ylabel("mAP50-95")
+    ax.grid(True)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print(f"Plot written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy vs CPU latency of every training run")
+    parser.add_argument("--runs", default=RUNS_DIR)
+    parser.add_argument("--weights-name", default="best.pt")
+    parser.add_argument("--data", default=os.path.join(VISION_DIR, "Neuronal_Network", "config.yaml"))
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--backend", choices=["pt", "onnx"], default="pt")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads (default: library default)")
+    parser.add_argument("--classes", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--val-images", type=int, default=0, help="limit the validation set (0 = all)")
+    parser.add_argument("--latency-images", type=int, default=50)
+    parser.add_argument("--csv", help="write the results to this CSV file")
+    parser.add_argument("--plot", help="write the Pareto plot to this PNG file")
+    args = parser.parse_args()
+
+    runs = discover_runs(args.runs, args.weights_name)
+    print(f"{'run':<10}{'model':<14}{'epochs':>7}{'imgsz':>7}{'best epoch':>12}{'train mAP50':>13}{'train mAP50-95':>16}  weights")
+    for run in runs:
+        train = (f"{run['best_epoch']:>12}{run['train_map50']:>13.3f}{run['train_map']:>16.3f}"
+                 if run["best_epoch"] is not None else f"{'-':>12}{'-':>13}{'-':>16}")
+        print(f"{run['name']:<10}{str(run['model']):<14}{str(run['epochs']):>7}{str(run['train_imgsz']):>7}{train}  "
+              f"{'yes' if run['weights'] else 'missing'}")
+
+    to_measure = [r for r in runs if r["weights"]]
+    if not to_measure:
+        sys.exit(f"\nno {args.weights_name} under {args.runs}/*/weights, nothing to measure")
+    images, _ = dataset_images(args.data, "val")
+    if args.val_images:
+        images = images[:args.val_images]  # sorted, so the same set for every run
+    if not images:
+        sys.exit(f"no validation images found from {args.data}")
+    print(f"\nMeasuring {len(to_measure)} runs x {len(args.imgsz)} sizes on {len(images)} validation images "
+          f"({args.backend}, threads={args.threads or 'default'})")
+
+    rows = []
+    # A fresh process per measurement: peak RSS is per model/size, no warm caches carried over
+    ctx = multiprocessing.get_context("spawn")
+    for run in to_measure:
+        for imgsz in args.imgsz:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(measure, ((run["weights"], imgsz, args.backend, args.threads, images,
+                                               args.latency_images, args.classes),))
+            rows.append(dict(result, name=run["name"], imgsz=imgsz))
+            print(f"  {run['name']}@{imgsz}: p50 {result['latency'][0]:.1f} ms, mAP50-95 {result['map']:.3f}")
+    pareto(rows)
+
+    header = f"\n{'run':<10}{'imgsz':>6}" + "".join(f"{f'p{p} ms':>9}" for p in PERCENTILES) + \
+             f"{'peak MB':>9}{'mAP50':>8}{'mAP50-95':>10}{'mAP/ms':>9}  pareto"
+    print(header)
+    for row in sorted(rows, key=lambda r: r["latency"][0]):
+        print(f"{row['name']:<10}{row['imgsz']:>6}" + "".join(f"{v:>9.1f}" for v in row["latency"]) +
+              f"{row['peak_mb']:>9.0f}{row['map50']:>8.3f}{row['map']:>10.3f}{row['map'] / row['latency'][0] * 1000:>9.2f}"
+              f"  {'*' if row['pareto'] else ''}")
+    print("mAP/ms: mAP50-95 per second of p50 latency (x1000); * = on the latency/accuracy Pareto front")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["run", "imgsz"] + [f"p{p}_ms" for p in PERCENTILES] + ["peak_mb", "map50", "map50_95", "pareto"])
+            for row in rows:
+                writer.writerow([row["name"], row["imgsz"]] + [f"{v:.2f}" for v in row["latency"]] +
+                                [f"{row['peak_mb']:.0f}", f"{row['map50']:.4f}", f"{row['map']:.4f}", int(row["pareto"])])
+        print(f"CSV written to {args.csv}")
+    if args.plot:
+        plot(rows, args.plot)
+
+
+if __name__ == "__main__":
+    main()
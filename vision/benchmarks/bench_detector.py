@@ -0,0 +1,167 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: CPU latency and mAP of the strawberry detector served by PyTorch (ultralytics)
+# against its ONNX Runtime exports (FP32 and static INT8, see onnx_detector.py), for several
+# thread counts. Latency is per frame, end to end (letterbox + inference + NMS), on the
+# validation images; mAP50 / mAP50-95 are computed here for every backend with the same code
+# (COCO-style, 101-point interpolation) so the numbers are comparable with each other.
+# Usage: python vision/benchmarks/bench_detector.py --weights vision/best.pt
+#            --onnx vision/best.onnx vision/best-int8.onnx --data vision/Neuronal_Network/config.yaml
+#            [--threads 1 2 4] [--report report.md]
+
+import argparse
+import os
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from onnx_detector import dataset_images, load_detector
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def to_numpy(values):
+    """ultralytics returns torch tensors, OnnxDetector numpy arrays."""
+    if hasattr(values, "cpu"):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+def predict(model, frame, conf, **kwargs):
+    boxes = model(frame, verbose=False, conf=conf, **kwargs)[0].boxes
+    return to_numpy(boxes.xyxy).reshape(-1, 4), to_numpy(boxes.conf).reshape(-1), to_numpy(boxes.cls).reshape(-1)
+
+
+def load_labels(image_path, shape):
+    """YOLO txt labels of an image (images/<split>/x.jpg -> labels/<split>/x.txt) as xyxy pixels + class."""
+    base = os.path.splitext(image_path)[0]
+    label_path = base.replace(os.sep + "images" + os.sep, os.sep + "labels" + os.sep) + ".txt"
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4)), np.zeros(0)
+    rows = np.loadtxt(label_path, ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 4)), np.zeros(0)
+    h, w = shape[:2]
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    return np.column_stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2]), rows[:, 0]
+
+
+def box_iou(a, b):
+    """(len(a), len(b)) IoU of xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(pred_xyxy, pred_conf, pred_cls, gt_xyxy, gt_cls):
+    """(n_pred, n_iou) true-positive flags: each ground truth matched once, highest confidence first."""
+    tp = np.zeros((len(pred_conf), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred_conf) == 0 or len(gt_cls) == 0:
+        return tp
+    iou = box_iou(pred_xyxy, gt_xyxy) * (pred_cls[:, None] == gt_cls[None, :])
+    order = np.argsort(-pred_conf)
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(gt_cls), dtype=bool)
+        for i in order:
+            candidates = np.where((iou[i] >= threshold) & ~taken)[0]
+            if len(candidates):
+                j = candidates[iou[i, candidates].argmax()]
+                taken[j] = True
+                tp[i, t] = True
+    return tp
+
+
+def average_precision(tp, conf, n_gt):
+    """AP per IoU threshold of one class (101-point interpolated precision/recall curve)."""
+    if n_gt == 0 or len(conf) == 0:
+        return np.zeros(len(IOU_THRESHOLDS))
+    order = np.argsort(-conf)
+    tp = tp[order]
+    tpc = np.cumsum(tp, axis=0)
+    fpc = np.cumsum(~tp, axis=0)
+    recall = tpc / n_gt
+    precision = tpc / (tpc + fpc)
+    points = np.linspace(0, 1, 101)
+    ap = []
+    for t in range(len(IOU_THRESHOLDS)):
+        envelope = np.maximum.accumulate(precision[::-1, t])[::-1]
+        idx = np.searchsorted(recall[:, t], points, side="left")
+        ap.append(np.where(idx < len(envelope), envelope[np.minimum(idx, len(envelope) - 1)], 0.0).mean())
+    return np.array(ap)
+
+
+def evaluate(model, images, classes, conf=0.001, **kwargs):
+    """mAP50 and mAP50-95 over the given classes (kwargs go to the model call, e.g. imgsz)."""
+    stats = {c: {"tp": [], "conf": [], "n_gt": 0} for c in classes}
+    for path in images:
+        frame = cv.imread(path)
+        if frame is None:
+            continue
+        xyxy, scores, cls = predict(model, frame, conf, **kwargs)
+        gt_xyxy, gt_cls = load_labels(path, frame.shape)
+        tp = match(xyxy, scores, cls, gt_xyxy, gt_cls)
+        for c in classes:
+            sel = cls == c
+            stats[c]["tp"].append(tp[sel])
+            stats[c]["conf"].append(scores[sel])
+            stats[c]["n_gt"] += int((gt_cls == c).sum())
+    aps = np.array([average_precision(np.concatenate(s["tp"]), np.concatenate(s["conf"]), s["n_gt"])
+                    for s in stats.values()])
+    return aps[:, 0].mean(), aps.mean()
+
+
+def latency_ms(model, frames, warmup=5, percentiles=(50, 95), **kwargs):
+    for frame in frames[:warmup]:
+        predict(model, frame, 0.25, **kwargs)
+    samples = []
+    for frame in frames:
+        t0 = time.perf_counter()
+        predict(model, frame, 0.25, **kwargs)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return tuple(np.percentile(samples, percentiles))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyTorch vs ONNX Runtime (FP32/INT8) detector on CPU")
+    parser.add_argument("--weights", default="vision/best.pt")
+    parser.add_argument("--onnx", nargs="*", default=["vision/best.onnx", "vision/best-int8.onnx"])
+    parser.add_argument("--data", default="vision/Neuronal_Network/config.yaml")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--classes", type=int, nargs="+", default=[0, 1], help="classes the model was trained on")
+    parser.add_argument("--latency-images", type=int, default=50)
+    parser.add_argument("--report", help="also write the table to this markdown file")
+    args = parser.parse_args()
+
+    images, names = dataset_images(args.data, "val")
+    if not images:
+        sys.exit(f"no validation images found from {args.data}")
+    frames = [f for f in (cv.imread(p) for p in images[:args.latency_images]) if f is not None]
+    print(f"{len(images)} validation images, latency on {len(frames)} of them ({frames[0].shape[1]}x{frames[0].shape[0]})")
+
+    lines = ["| model | threads | median ms | p95 ms | mAP50 | mAP50-95 |",
+             "|---|---:|---:|---:|---:|---:|"]
+    for path in [args.weights] + [p for p in args.onnx if os.path.exists(p)]:
+        # Accuracy does not depend on the thread count: evaluate once per model
+        m50, m5095 = evaluate(load_detector(path), images, args.classes)
+        for threads in args.threads:
+            median, p95 = latency_ms(load_detector(path, threads=threads), frames)
+            line = f"| {os.path.basename(path)} | {threads} | {median:.1f} | {p95:.1f} | {m50:.3f} | {m5095:.3f} |"
+            lines.append(line)
+            print(line)
+    print(f"\nclasses: {', '.join(str(names.get(c, c)) for c in args.classes)}; "
+          f"mAP difference vs {os.path.basename(args.weights)} is the export/quantization loss")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: End-to-end perception benchmark with per-stage timing. Runs
+# PerceptionSession.detect_all (digital_twin/strawberry_recognition.py) on a recording
+# (frame_source.py) or on synthetic 1280x720 scenes and reports p50/p95/p99 per stage
+# (frame wait, camera/align/copy or decode, inference, filtering, depth, back-projection,
+# PnP, drawing) and frames per second. --json writes the results with the commit they were
+# measured on; --compare checks them against an earlier file and exits with 1 when a stage
+# got slower than the threshold (for regression tests of the vision code).
+# Without --model the detector returns the synthetic ground-truth boxes, so every stage but
+# inference is measured without weights or a camera.
+# Usage: python vision/benchmarks/bench_perception.py [--source synthetic|<recording dir>]
+#            [--model vision/best.onnx] [--frames 200] [--json out.json] [--compare base.json --threshold 10]
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+
+VISION_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(VISION_DIR)
+sys.path.append(os.path.join(VISION_DIR, "..", "digital_twin"))
+from bench_batch_pose import CAMERA_MATRIX, DEPTH_SCALE, synthetic_scene
+from frame_source import ReplaySource
+from onnx_detector import Boxes, Results
+from strawberry_recognition import PerceptionSession
+
+PERCENTILES = (50, 95, 99)
+# Order of the stages in the report
+STAGES = ["wait", "camera", "align", "copy", "decode", "inference", "filter", "depth", "backproject", "pnp", "draw"]
+
+
+class SyntheticSource:
+    """
+    Frame source of synthetic scenes (bench_batch_pose depth maps + matching color
+    blobs), cycled; fps paces them like a camera (0 = as fast as asked).
+    """
+
+    def __init__(self, boxes_per_frame=8, distinct=20, fps=0.0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.scenes = []
+        for _ in range(distinct):
+            depth, boxes = synthetic_scene(boxes_per_frame, rng)
+            color = np.zeros(depth.shape + (3,), dtype=np.uint8)
+            color[:] = (40, 120, 40)  # leaves
+            for x1, y1, x2, y2 in boxes:
+                cv.circle(color, ((x1 + x2) // 2, (y1 + y2) // 2), (x2 - x1) // 2, (30, 30, 200), -1)
+            self.scenes.append((color, depth, boxes))
+        self.intrinsics = {"width": 1280, "height": 720, "fx": CAMERA_MATRIX[0, 0], "fy": CAMERA_MATRIX[1, 1],
+                           "ppx": CAMERA_MATRIX[0, 2], "ppy": CAMERA_MATRIX[1, 2], "coeffs": [0.0] * 5}
+        self.depth_scale = DEPTH_SCALE
+        self.fps = fps
+        self.served = 0
+        self.current_boxes = []
+        self._t_start = None
+
+    def start(self):
+        self._t_start = time.monotonic()
+
+    def stop(self):
+        pass
+
+    def latest(self, timeout=1.0, after=None):
+        if self.fps:
+            due = self._t_start + self.served / self.fps
+            time.sleep(max(due - time.monotonic(), 0))
+        color, depth, boxes = self.scenes[self.served % len(self.scenes)]
+        self.current_boxes = boxes
+        entry = {"color": color.copy(), "depth": depth, "timestamp": self.served * 1000 / (self.fps or 30),
+                 "arrival": time.monotonic(), "seq": self.served}
+        self.served += 1
+        return entry
+
+    def stats(self):
+        return {"captured": self.served, "consumed": self.served, "dropped": 0, "errors": 0}
+
+
+class GroundTruthDetector:
+    """Stands in for the model on synthetic frames: the scene's boxes as confident 'ripe' detections."""
+
+    names = {0: "ripe", 1: "unripe", 2: "peduncle"}
+
+    def __init__(self, source):
+        self.source = source
+
+    def __call__(self, frame, verbose=False):
+        xyxy = np.array(self.source.current_boxes, dtype=np.float32).reshape(-1, 4)
+        n = len(xyxy)
+        return [Results(Boxes(xyxy, np.full(n, 0.9, np.float32), np.zeros(n, np.float32)), self.names, frame.shape[:2])]
+
+
+def summarize(samples, frames, elapsed):
+    stages = {}
+    for name in STAGES + sorted(set(samples) - set(STAGES)):
+        if name in samples:
+            ms = np.array(samples[name]) * 1000
+            stages[name] = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+            stages[name]["mean"] = float(ms.mean())
+    return {"frames": frames, "fps": frames / elapsed, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=VISION_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold, min_ms):
+    """Rows of (stage, metric, base, now, change %, failed); a stage fails when p50 or p95 grew past threshold %."""
+    rows = []
+    for name, stats in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        for metric in ("p50", "p95"):
+            change = (stats[metric] - base[metric]) / base[metric] * 100 if base[metric] > 0 else 0.0
+            # Sub-min_ms stages are too noisy for a relative threshold
+            failed = change > threshold and stats[metric] - base[metric] > min_ms
+            rows.append((name, metric, base[metric], stats[metric], change, failed))
+    fps_change = (current["fps"] - baseline["fps"]) / baseline["fps"] * 100
+    rows.append(("total", "fps", baseline["fps"], current["fps"], fps_change, -fps_change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency of the perception pipeline")
+    parser.add_argument("--source", default="synthetic", help="'synthetic' or a frame_source recording directory")
+    parser.add_argument("--model", help=".pt / .onnx detector (default: synthetic ground truth, no inference)")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--boxes", type=int, default=8, help="strawberries per synthetic frame")
+    parser.add_argument("--fps", type=float, default=0.0, help="pace synthetic frames like a camera (0 = unpaced)")
+    parser.add_argument("--realtime", action="store_true", help="replay the recording in real time")
+    parser.add_argument("--refine", action="store_true", help="enable the iterative PnP refinement")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to check against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in %% for --compare")
+    parser.add_argument("--min-ms", type=float, default=0.2, help="ignore slowdowns smaller than this (ms)")
+    args = parser.parse_args()
+
+    if args.source == "synthetic":
+        source = SyntheticSource(args.boxes, fps=args.fps)
+        detector = None if args.model else GroundTruthDetector(source)
+    else:
+        source = ReplaySource(args.source, realtime=args.realtime, loop=True)
+        detector = None
+        if not args.model:
+            sys.exit("a recording needs --model (the synthetic detector only knows synthetic scenes)")
+
+    session = PerceptionSession(model_path=args.model, refine_pnp=args.refine, threads=args.threads,
+                                source=source, detector=detector)
+    samples = {}
+    # detect_all prints every candidate; keep that cost but not the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.warmup):
+            session.detect_all()
+        t_start = time.perf_counter()
+        for _ in range(args.frames):
+            t0 = time.perf_counter()
+            session.detect_all()
+            total = time.perf_counter() - t0
+            for name, seconds in session.timings.items():
+                samples.setdefault(name, []).append(seconds)
+            samples.setdefault("total", []).append(total)
+        elapsed = time.perf_counter() - t_start
+        session.close()
+
+    results = summarize(samples, args.frames, elapsed)
+    results["meta"] = {"commit": git_commit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                       "source": args.source, "model": args.model or "ground truth", "refine": args.refine,
+                       "threads": args.threads, "boxes": args.boxes if args.source == "synthetic" else None,
+                       "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+    print(f"{args.frames} frames from {args.source}, detector: {results['meta']['model']}, "
+          f"{results['fps']:.1f} fps (commit {results['meta']['commit']})")
+    print(f"{'stage':<12}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'mean ms':>10}")
+    for name, stats in results["stages"].items():
+        print(f"{name:<12}" + "".join(f"{stats[f'p{p}']:>10.2f}" for p in PERCENTILES) + f"{stats['mean']:>10.2f}")
+    # Capture stages run on the grabber thread, overlapped with the consumer: not part of total
+    print("camera/align/copy run on the capture thread and overlap with the rest; total = one detect_all() call")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold, args.min_ms)
+        print(f"\nvs {args.compare} (commit {baseline['meta'].get('commit')}), threshold {args.threshold:g}%")
+        differ = [k for k in ("source", "model", "refine", "threads", "boxes", "machine")
+                  if baseline["meta"].get(k) != results["meta"][k]]
+        if differ:
+            print(f"warning: runs differ in {', '.join(differ)}; the comparison is not like for like")
+        print(f"{'stage':<12}{'metric':>7}{'base':>10}{'now':>10}{'change':>9}")
+        for name, metric, base, now, change, failed in rows:
+            print(f"{name:<12}{metric:>7}{base:>10.2f}{now:>10.2f}{change:>+8.1f}%  {'FAIL' if failed else ''}")
+        failures = [r for r in rows if r[5]]
+        print("FAIL" if failures else "PASS")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
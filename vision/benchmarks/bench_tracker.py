@@ -0,0 +1,154 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Detect-every-frame vs detect-every-N + tracking (tracker.py) on a synthetic
+# 1280x720 sequence: a textured canopy panning across the camera with strawberries on it
+# and noisy, sometimes missing depth. The detector is simulated (ground-truth boxes with
+# jitter, occasional misses and low scores) and costs --inference-ms, so the effective
+# FPS reflects a CPU YOLO without needing the weights. Reports FPS, the fraction of frames
+# that ran the detector, ID switches, box error and the frame-to-frame depth jitter.
+# Usage: python vision/benchmarks/bench_tracker.py [--frames 300] [--inference-ms 80] [--every 1 3 5 10]
+
+import argparse
+import os
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from batch_pose import batch_poses
+from bench_batch_pose import CAMERA_MATRIX, DEPTH_SCALE, DIST_COEFFS
+from tracker import StrawberryTracker, box_iou
+
+WIDTH, HEIGHT = 1280, 720
+
+
+def make_sequence(n_frames, n_berries, pan_px, rng):
+    """Color/depth frames and ground-truth boxes (one id per strawberry) of a panning camera."""
+    canvas_w = WIDTH + int(abs(pan_px) * n_frames) + 200
+    texture = cv.GaussianBlur(rng.integers(0, 255, (HEIGHT // 4, canvas_w // 4, 3), dtype=np.uint8), (3, 3), 0)
+    canopy = cv.resize(texture, (canvas_w, HEIGHT), interpolation=cv.INTER_LINEAR)
+    canopy = (canopy * np.array([0.3, 0.8, 0.3])).astype(np.uint8)  # greenish leaves
+    berries = []
+    for _ in range(n_berries):
+        r = int(rng.integers(18, 40))
+        berries.append((int(rng.integers(r, canvas_w - r)), int(rng.integers(r, HEIGHT - r)), r,
+                        float(rng.uniform(350, 700))))
+    for cx, cy, r, _ in berries:
+        cv.circle(canopy, (cx, cy), r, (40, 40, 200), -1)
+        # Seeds: texture inside the fruit for the optical flow
+        for _ in range(12):
+            a, d = rng.uniform(0, 2 * np.pi), rng.uniform(0, 0.8 * r)
+            cv.circle(canopy, (int(cx + d * np.cos(a)), int(cy + d * np.sin(a))), 2, (90, 200, 230), -1)
+
+    yy, xx = np.mgrid[0:HEIGHT, 0:WIDTH]
+    frames = []
+    for i in range(n_frames):
+        x0 = int(round(i * pan_px)) + 100
+        color = canopy[:, x0:x0 + WIDTH].copy()
+        depth = np.full((HEIGHT, WIDTH), 900.0) + rng.normal(0, 4, (HEIGHT, WIDTH))
+        truth = {}
+        for k, (cx, cy, r, z) in enumerate(berries):
+            x = cx - x0
+            if r <= x < WIDTH - r:
+                inside = (xx - x) ** 2 + (yy - cy) ** 2 <= r * r
+                depth[inside] = z + rng.normal(0, 3, inside.sum())
+                truth[k] = (x - r, cy - r, x + r, cy + r)
+        depth[rng.random(depth.shape) < 0.05] = 0
+        frames.append((color, depth.clip(0, 65535).astype(np.uint16), truth))
+    return frames
+
+
+def simulated_detector(truth, rng, inference_ms, miss=0.05, low=0.1):
+    """Ground truth + box jitter, some boxes missed or scored low; sleeps inference_ms."""
+    time.sleep(inference_ms / 1000)
+    boxes, scores, ids = [], [], []
+    for k, (x1, y1, x2, y2) in truth.items():
+        u = rng.random()
+        if u < miss:
+            continue
+        j = rng.normal(0, 2, 4)
+        boxes.append((x1 + j[0], y1 + j[1], x2 + j[2], y2 + j[3]))
+        scores.append(rng.uniform(0.3, 0.7) if u < miss + low else rng.uniform(0.75, 0.95))
+        ids.append(k)
+    return np.array(boxes).reshape(-1, 4), np.array(scores), ids
+
+
+def run(frames, every, inference_ms, seed=1):
+    rng = np.random.default_rng(seed)
+    tracker = StrawberryTracker(detect_every=every)
+    owner = {}           # track id -> ground-truth id it first covered
+    switches, errors, jitter, last_depth = 0, [], [], {}
+    t0 = time.perf_counter()
+    for color, depth, truth in frames:
+        if tracker.needs_detection():
+            boxes, scores, _ = simulated_detector(truth, rng, inference_ms)
+            tracks = tracker.update(color, boxes, scores, ["ripe"] * len(scores))
+        else:
+            tracks = tracker.update(color)
+        tracker.update_geometry(depth, DEPTH_SCALE, CAMERA_MATRIX, DIST_COEFFS)
+
+        # Scoring (not timed separately, it is cheap next to the rest)
+        if tracks and truth:
+            gt_ids = list(truth)
+            iou = box_iou([t.xyxy for t in tracks], [truth[k] for k in gt_ids])
+            for t, row in zip(tracks, iou):
+                if row.max() < 0.3:
+                    continue
+                k = gt_ids[int(row.argmax())]
+                if owner.setdefault(t.id, k) != k:
+                    switches += 1
+                    owner[t.id] = k
+                gt = np.array(truth[k], dtype=np.float64)
+                errors.append(np.abs(t.xyxy - gt).mean())
+                if t.depth is not None:
+                    if t.id in last_depth:
+                        jitter.append(abs(t.depth - last_depth[t.id]))
+                    last_depth[t.id] = t.depth
+    elapsed = time.perf_counter() - t0
+    stats = tracker.stats()
+    # Identities: how many track ids covered each strawberry (1 = never lost)
+    per_berry = {}
+    for tid, k in owner.items():
+        per_berry.setdefault(k, set()).add(tid)
+    ids_per_berry = np.mean([len(v) for v in per_berry.values()]) if per_berry else 0.0
+    return {"fps": len(frames) / elapsed, "detect": stats["detection_ratio"], "switches": switches,
+            "ids_per_berry": ids_per_berry, "box_err": np.mean(errors) if errors else np.nan,
+            "jitter_mm": np.mean(jitter) * 1000 if jitter else np.nan}
+
+
+def raw_jitter(frames):
+    """Frame-to-frame depth change of each strawberry without tracking (per-frame batch_poses)."""
+    jitter, last = [], {}
+    for _, depth, truth in frames:
+        ids = list(truth)
+        depths, _ = batch_poses(depth, [truth[k] for k in ids], DEPTH_SCALE, CAMERA_MATRIX, DIST_COEFFS)
+        for k, Z in zip(ids, depths):
+            if k in last and not np.isnan(Z):
+                jitter.append(abs(Z - last[k]))
+            last[k] = Z
+    return np.mean(jitter) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect every frame vs detect every N + tracking")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--berries", type=int, default=25)
+    parser.add_argument("--pan", type=float, default=3.0, help="camera pan in px per frame")
+    parser.add_argument("--inference-ms", type=float, default=80.0, help="simulated detector cost per frame")
+    parser.add_argument("--every", type=int, nargs="+", default=[1, 3, 5, 10])
+    args = parser.parse_args()
+
+    frames = make_sequence(args.frames, args.berries, args.pan, np.random.default_rng(0))
+    print(f"{args.frames} frames, {args.berries} strawberries, pan {args.pan:g} px/frame, "
+          f"detector {args.inference_ms:g} ms; untracked depth jitter {raw_jitter(frames):.2f} mm")
+    print(f"{'detect every':>12}{'fps':>8}{'detector':>10}{'ids/berry':>11}{'switches':>10}{'box err px':>12}{'jitter mm':>11}")
+    for every in args.every:
+        r = run(frames, every, args.inference_ms)
+        print(f"{every:>12}{r['fps']:>8.1f}{r['detect'] * 100:>9.0f}%{r['ids_per_berry']:>11.2f}{r['switches']:>10}"
+              f"{r['box_err']:>12.1f}{r['jitter_mm']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
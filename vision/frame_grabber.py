@@ -0,0 +1,142 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Background capture stage for the RealSense pipeline. A dedicated thread
+# waits for frames, aligns depth to color and keeps the newest pairs in a small ring
+# buffer, so inference always works on the latest frame instead of the SDK queue.
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class FrameGrabber:
+    """
+    Capture thread with a latest-frame ring buffer.
+    Each entry is a dict with the color/depth arrays, the device timestamp (ms),
+    the host arrival time (time.monotonic), a sequence number and the capture
+    timings (s) of wait_for_frames, align.process and the array copies.
+    Frames overwritten before anyone reads them are counted as dropped.
+    on_frame, if given, is called on the capture thread with every new entry
+    (e.g. frame_source.Recorder.write); it must not block.
+    """
+
+    def __init__(self, pipeline, align, capacity=3, timeout_ms=1000, on_frame=None):
+        self.pipeline = pipeline
+        self.align = align
+        self.timeout_ms = timeout_ms
+        self.on_frame = on_frame
+
+        self._buffer = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        # Counters
+        self.captured = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.errors = 0
+        self._last_taken = -1
+        self._t_start = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        """Start the capture thread."""
+        if self._running:
+            return
+        self._running = True
+        self._t_start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the capture thread and wait for it to exit."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        while self._running:
+            t0 = time.perf_counter()
+            try:
+                frames = self.pipeline.wait_for_frames(self.timeout_ms)
+            except RuntimeError:
+                # Timeout or device hiccup, try again
+                self.errors += 1
+                continue
+
+            t1 = time.perf_counter()
+            frames = self.align.process(frames)
+            color_frame = frames.get_color_frame()
+            depth_frame = frames.get_depth_frame()
+            if not color_frame or not depth_frame:
+                self.errors += 1
+                continue
+            t2 = time.perf_counter()
+
+            # Copy out of the SDK buffers so the frames can be released right away
+            entry = {
+                "color": np.asanyarray(color_frame.get_data()).copy(),
+                "depth": np.asanyarray(depth_frame.get_data()).copy(),
+                "timestamp": frames.get_timestamp(),
+                "arrival": time.monotonic(),
+                "seq": self.captured,
+            }
+            entry["timings"] = {"camera": t1 - t0, "align": t2 - t1, "copy": time.perf_counter() - t2}
+
+            with self._cond:
+                self._buffer.append(entry)
+                self.captured += 1
+                self._cond.notify_all()
+
+            if self.on_frame is not None:
+                self.on_frame(entry)
+
+    def latest(self, timeout=1.0, after=None):
+        """
+        Return the newest frame pair, or None on timeout.
+        Waits for a pair that has not been returned before; if after is given
+        (a time.monotonic() value) the pair must also have arrived after it,
+        e.g. to make sure the frame was taken once the robot stopped moving.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._buffer:
+                    entry = self._buffer[-1]
+                    if entry["seq"] > self._last_taken and (after is None or entry["arrival"] >= after):
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None
+                self._cond.wait(remaining)
+
+            # Every pair between the previous read and this one was never consumed
+            self.dropped += entry["seq"] - self._last_taken - 1
+            self._last_taken = entry["seq"]
+            self.consumed += 1
+            return entry
+
+    def stats(self):
+        """Camera FPS, consumer (inference) FPS and drop counters since start."""
+        elapsed = time.monotonic() - self._t_start if self._t_start else 0.0
+        elapsed = max(elapsed, 1e-6)
+        return {
+            "camera_fps": self.captured / elapsed,
+            "inference_fps": self.consumed / elapsed,
+            "captured": self.captured,
+            "consumed": self.consumed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
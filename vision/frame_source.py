@@ -0,0 +1,380 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Frame sources for the perception scripts. Every source answers
+# latest(timeout, after) with the same entries as FrameGrabber (color, depth, timestamp,
+# arrival, seq) and exposes the color intrinsics and depth_scale, so perception runs the
+# same on the live camera or on a recording:
+#   RealSenseSource  live pipeline + aligned capture thread, optionally recording every pair
+#   Recorder         writes pairs to a recording directory on a background thread
+#   ReplaySource     plays a recording back in real time or as fast as possible
+# A recording is a directory with meta.json (intrinsics, depth_scale, format), index.csv
+# (one line per frame) and fixed-size chunks: depth_NNNNN.npy holds the raw z16 frames of
+# the chunk as one (N, H, W) array, loaded memory-mapped on replay, and color_NNNNN.bin
+# holds the JPEG-encoded color frames back to back (or color_NNNNN.npy with raw BGR).
+# Usage:
+#   python vision/frame_source.py record <dir> [--seconds 30] [--raw-color]
+#   python vision/frame_source.py info <dir>
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from frame_grabber import FrameGrabber
+
+try:
+    import pyrealsense2 as rs
+except ImportError:  # replay does not need the camera SDK
+    rs = None
+
+CHUNK_FRAMES = 64   # frames per chunk file (64 x 1280x720 z16 = 118 MB of depth)
+JPEG_QUALITY = 95
+INDEX_FIELDS = ["seq", "timestamp", "arrival", "chunk", "slot", "color_offset", "color_size"]
+
+
+def camera_matrix(intrinsics):
+    """3x3 camera matrix and distortion coefficients of an intrinsics dict."""
+    matrix = np.array([[intrinsics["fx"], 0.0, intrinsics["ppx"]],
+                       [0.0, intrinsics["fy"], intrinsics["ppy"]],
+                       [0.0, 0.0, 1.0]], dtype=np.float64)
+    return matrix, np.array(intrinsics["coeffs"][:5], dtype=np.float64)
+
+
+class RealSenseSource:
+    """
+    Live RealSense color + depth aligned to color, captured on a FrameGrabber thread.
+    If record is a directory, every captured pair is also written there (Recorder).
+    """
+
+    def __init__(self, width=1280, height=720, fps=30, warmup_frames=20, record=None, **record_options):
+        if rs is None:
+            raise ImportError("pyrealsense2 is required for the live camera")
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
+        config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        profile = self.pipeline.start(config)
+        self.align = rs.align(rs.stream.color)
+
+        color_intr = profile.get_stream(rs.stream.color).as_video_stream_profile().get_intrinsics()
+        self.intrinsics = {"width": color_intr.width, "height": color_intr.height,
+                           "fx": color_intr.fx, "fy": color_intr.fy, "ppx": color_intr.ppx, "ppy": color_intr.ppy,
+                           "coeffs": list(color_intr.coeffs), "model": str(color_intr.model)}
+        self.depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+
+        # Let auto-exposure settle before anything is consumed or recorded
+        for _ in range(warmup_frames):
+            self.pipeline.wait_for_frames()
+
+        self.recorder = None
+        if record is not None:
+            self.recorder = Recorder(record, self.intrinsics, self.depth_scale, **record_options)
+        self.grabber = FrameGrabber(self.pipeline, self.align,
+                                    on_frame=self.recorder.write if self.recorder else None)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self.grabber.start()
+
+    def stop(self):
+        """Stop capture, finish the recording and release the camera."""
+        if self.pipeline is None:
+            return
+        self.grabber.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.pipeline.stop()
+        self.pipeline = None
+
+    def latest(self, timeout=1.0, after=None):
+        return self.grabber.latest(timeout=timeout, after=after)
+
+    def stats(self):
+        stats = self.grabber.stats()
+        if self.recorder is not None:
+            stats.update(self.recorder.stats())
+        return stats
+
+
+class Recorder:
+    """
+    Writes color/depth pairs to a recording directory. write() only queues the pair (it
+    is called from the capture thread); a writer thread encodes and appends it to the
+    current chunk. When the writer falls behind, pairs are dropped and counted.
+    """
+
+    def __init__(self, path, intrinsics, depth_scale, chunk_frames=CHUNK_FRAMES, color_format="jpg",
+                 jpeg_quality=JPEG_QUALITY, max_queue=30):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.intrinsics = intrinsics
+        self.depth_scale = depth_scale
+        self.chunk_frames = chunk_frames
+        self.color_format = color_format
+        self.jpeg_quality = jpeg_quality
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._meta = None
+        self._depth = None  # memmap of the open chunk
+        self._color = None  # file or memmap of the open chunk
+        self._index = open(os.path.join(path, "index.csv"), "w", newline="")
+        self._index_writer = csv.writer(self._index)
+        self._index_writer.writerow(INDEX_FIELDS)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def write(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write what is queued, close the open chunk and the index."""
+        self._queue.put(None)
+        self._thread.join()
+        self._close_chunk()
+        self._index.close()
+        print(f"Recorded {self.written} frames to {self.path} ({self.bytes / 1e6:.0f} MB, {self.dropped} dropped)")
+
+    def stats(self):
+        return {"recorded": self.written, "record_dropped": self.dropped}
+
+    def _write_meta(self, entry):
+        h, w = entry["depth"].shape
+        self._meta = {"intrinsics": self.intrinsics, "depth_scale": self.depth_scale,
+                      "width": w, "height": h, "chunk_frames": self.chunk_frames,
+                      "color_format": self.color_format}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self._meta, f, indent=2)
+
+    def _open_chunk(self, chunk):
+        h, w = self._meta["height"], self._meta["width"]
+        self._depth = np.lib.format.open_memmap(os.path.join(self.path, f"depth_{chunk:05d}.npy"), mode="w+",
+                                                dtype=np.uint16, shape=(self.chunk_frames, h, w))
+        if self.color_format == "jpg":
+            self._color = open(os.path.join(self.path, f"color_{chunk:05d}.bin"), "wb")
+        else:
+            self._color = np.lib.format.open_memmap(os.path.join(self.path, f"color_{chunk:05d}.npy"), mode="w+",
+                                                    dtype=np.uint8, shape=(self.chunk_frames, h, w, 3))
+
+    def _close_chunk(self):
+        if self._depth is None:
+            return
+        self._depth.flush()
+        if self.color_format == "jpg":
+            self._color.close()
+        else:
+            self._color.flush()
+        self._index.flush()
+        used = self.written - (self.written - 1) // self.chunk_frames * self.chunk_frames
+        if used < self.chunk_frames:
+            # Last chunk only partly filled: keep just its frames
+            chunk = (self.written - 1) // self.chunk_frames
+            # Copy the frames out and drop the memmaps first: Windows cannot replace a mapped file
+            arrays = [("depth", np.array(self._depth[:used]))]
+            if self.color_format != "jpg":
+                arrays.append(("color", np.array(self._color[:used])))
+            self._depth = self._color = None
+            for name, array in arrays:
+                path = os.path.join(self.path, f"{name}_{chunk:05d}.npy")
+                np.save(path + ".tmp.npy", array)
+                os.replace(path + ".tmp.npy", path)
+        self._depth = self._color = None
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            if self._meta is None:
+                self._write_meta(entry)
+            chunk, slot = divmod(self.written, self.chunk_frames)
+            if slot == 0:
+                self._close_chunk()
+                self._open_chunk(chunk)
+            self._depth[slot] = entry["depth"]
+            self.bytes += entry["depth"].nbytes
+            if self.color_format == "jpg":
+                ok, data = cv.imencode(".jpg", entry["color"], [cv.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                offset, size = self._color.tell(), len(data)
+                self._color.write(data.tobytes())
+            else:
+                self._color[slot] = entry["color"]
+                offset, size = 0, entry["color"].nbytes
+            self.bytes += size
+            self._index_writer.writerow([entry["seq"], entry["timestamp"], f"{entry['arrival']:.6f}",
+                                         chunk, slot, offset, size])
+            self.written += 1
+
+
+class ReplaySource:
+    """
+    Recording played back through the FrameGrabber interface.
+    realtime=True: frames become available on the recorded schedule, so a slow consumer
+    gets the newest one and skips (drops) the rest, exactly like on the live camera.
+    realtime=False: every frame is returned in order, as fast as the consumer asks.
+    latest() returns None once the recording is over (unless loop=True).
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.intrinsics = self.meta["intrinsics"]
+        self.depth_scale = self.meta["depth_scale"]
+        with open(os.path.join(path, "index.csv"), newline="") as f:
+            self.index = [{k: float(v) if k in ("timestamp", "arrival") else int(v) for k, v in row.items()}
+                          for row in csv.DictReader(f)]
+        if not self.index:
+            raise ValueError(f"{path} has no frames")
+        # Schedule relative to the first frame, from the host arrival times
+        self.offsets = np.array([row["arrival"] for row in self.index]) - self.index[0]["arrival"]
+
+        self._chunks = {}
+        self._lock = threading.Lock()
+        self._t_start = None
+        self._next = 0       # first frame not yet returned
+        self._loops = 0
+        self.consumed = 0
+        self.dropped = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._t_start = time.monotonic()
+
+    def stop(self):
+        self._chunks.clear()
+
+    def _chunk(self, chunk):
+        if chunk not in self._chunks:
+            depth = np.load(os.path.join(self.path, f"depth_{chunk:05d}.npy"), mmap_mode="r")
+            if self.meta["color_format"] == "jpg":
+                color = np.memmap(os.path.join(self.path, f"color_{chunk:05d}.bin"), dtype=np.uint8, mode="r")
+            else:
+                color = np.load(os.path.join(self.path, f"color_{chunk:05d}.npy"), mmap_mode="r")
+            self._chunks = {chunk: (depth, color)}  # one chunk mapped at a time, replay is sequential
+        return self._chunks[chunk]
+
+    def _read(self, i, arrival):
+        t0 = time.perf_counter()
+        row = self.index[i]
+        depth, color = self._chunk(row["chunk"])
+        if self.meta["color_format"] == "jpg":
+            data = color[row["color_offset"]:row["color_offset"] + row["color_size"]]
+            frame = cv.imdecode(np.asarray(data), cv.IMREAD_COLOR)
+        else:
+            frame = np.array(color[row["slot"]])
+        return {"color": frame, "depth": depth[row["slot"]], "timestamp": row["timestamp"],
+                "arrival": arrival, "seq": self._loops * len(self.index) + i,
+                "timings": {"decode": time.perf_counter() - t0}}
+
+    def _rewind(self):
+        if not self.loop:
+            return False
+        self._loops += 1
+        self._next = 0
+        self._t_start = time.monotonic()
+        return True
+
+    def latest(self, timeout=1.0, after=None):
+        """Next (realtime: newest due) frame, or None at the end of the recording or on timeout."""
+        if self._t_start is None:
+            self.start()
+        with self._lock:
+            if self._next >= len(self.index) and not self._rewind():
+                return None
+            if not self.realtime:
+                i = self._next
+                self._next += 1
+                self.consumed += 1
+                return self._read(i, time.monotonic())
+
+            deadline = time.monotonic() + timeout
+            while True:
+                now = time.monotonic()
+                # Newest frame already due, not returned yet and (if asked) arrived after `after`
+                due = int(np.searchsorted(self.offsets, now - self._t_start, side="right")) - 1
+                if due >= self._next and (after is None or self._t_start + self.offsets[due] >= after):
+                    break
+                # Sleep until the next frame is due (or the deadline)
+                upcoming = max(self._next, due + 1)
+                if upcoming >= len(self.index):
+                    if due >= len(self.index) - 1 and not self._rewind():
+                        return None
+                    continue
+                wait = self._t_start + self.offsets[upcoming] - now
+                if now + wait > deadline:
+                    time.sleep(max(deadline - now, 0))
+                    return None
+                time.sleep(wait)
+
+            self.dropped += due - self._next
+            self._next = due + 1
+            self.consumed += 1
+            return self._read(due, self._t_start + self.offsets[due])
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self._t_start, 1e-6) if self._t_start else 1e-6
+        return {
+            "camera_fps": min(self._next, len(self.index)) / elapsed if self.realtime else self.consumed / elapsed,
+            "inference_fps": self.consumed / elapsed,
+            "captured": len(self.index),
+            "consumed": self.consumed,
+            "dropped": self.dropped,
+            "errors": 0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record RealSense color+depth, or describe a recording")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rec.add_argument("--seconds", type=float, default=30.0)
+    rec.add_argument("--raw-color", action="store_true", help="store BGR instead of JPEG")
+    rec.add_argument("--chunk-frames", type=int, default=CHUNK_FRAMES)
+    info = sub.add_parser("info")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        source = RealSenseSource(record=args.path, chunk_frames=args.chunk_frames,
+                                 color_format="raw" if args.raw_color else "jpg")
+        with source:
+            time.sleep(args.seconds)
+        print("Capture stats:", source.stats())
+    else:
+        replay = ReplaySource(args.path)
+        duration = replay.offsets[-1]
+        size = sum(os.path.getsize(os.path.join(args.path, f)) for f in os.listdir(args.path))
+        print(f"{len(replay.index)} frames, {duration:.1f} s ({len(replay.index) / max(duration, 1e-6):.1f} fps), "
+              f"{replay.meta['width']}x{replay.meta['height']}, color {replay.meta['color_format']}, "
+              f"depth_scale {replay.depth_scale}, {size / 1e6:.0f} MB")
+        print("intrinsics:", replay.intrinsics)
+
+
+if __name__ == "__main__":
+    main()
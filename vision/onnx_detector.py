@@ -0,0 +1,276 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: CPU inference backend for the strawberry detector. Exports the trained
+# YOLOv8n checkpoint to ONNX (optionally with static INT8 quantization calibrated on the
+# training images) and serves it with ONNX Runtime through OnnxDetector, which returns
+# results with the same boxes/cls/conf/xyxy/names as the ultralytics model, so the
+# perception scripts only change the line that loads the model (load_detector).
+# Export (the .onnx files are written next to the checkpoint):
+#   python vision/onnx_detector.py --weights vision/best.pt [--int8 --data Neuronal_Network/config.yaml]
+# The OpenVINO execution provider of ONNX Runtime is used when installed (provider="openvino").
+
+import argparse
+import ast
+import glob
+import os
+import random
+
+import cv2 as cv
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # only needed to serve/quantize .onnx models
+    ort = None
+
+IMGSZ = 640
+PAD_VALUE = 114  # letterbox gray, as in ultralytics
+DEFAULT_NAMES = {0: "ripe", 1: "unripe", 2: "peduncle"}  # Neuronal_Network/config.yaml
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# ---- Pre/post-processing ----
+
+def letterbox(frame, size=IMGSZ):
+    """Resize keeping the aspect ratio and pad to size x size; returns the image, ratio and (pad_x, pad_y)."""
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        frame = cv.resize(frame, (new_w, new_h), interpolation=cv.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    frame = cv.copyMakeBorder(frame, top, bottom, left, right, cv.BORDER_CONSTANT,
+                              value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return frame, ratio, (left, top)
+
+
+def preprocess(frame, size=IMGSZ):
+    """BGR frame -> (1, 3, size, size) float32 RGB in [0, 1], plus the letterbox ratio and padding."""
+    image, ratio, pad = letterbox(frame, size)
+    blob = cv.dnn.blobFromImage(image, 1 / 255.0, swapRB=True)
+    return blob, ratio, pad
+
+
+def postprocess(output, ratio, pad, shape, conf=0.25, iou=0.7, max_det=300):
+    """
+    Raw YOLOv8 output (1, 4 + classes, anchors) -> xyxy (N, 4), conf (N,), cls (N,)
+    in frame pixels, after class-aware NMS (same defaults as ultralytics predict).
+    """
+    pred = output[0].T  # (anchors, 4 + classes)
+    scores = pred[:, 4:]
+    cls = scores.argmax(axis=1)
+    best = scores[np.arange(len(scores)), cls]
+    keep = best > conf
+    pred, cls, best = pred[keep], cls[keep], best[keep]
+    if len(pred) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.float32)
+
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    xywh = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+    idx = cv.dnn.NMSBoxesBatched(xywh.tolist(), best.tolist(), cls.tolist(), conf, iou)
+    idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:max_det]
+
+    xyxy = np.column_stack([xywh[idx, 0], xywh[idx, 1], xywh[idx, 0] + xywh[idx, 2], xywh[idx, 1] + xywh[idx, 3]])
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / ratio
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / ratio
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+    return xyxy.astype(np.float32), best[idx].astype(np.float32), cls[idx].astype(np.float32)
+
+
+# ---- Results with the ultralytics layout ----
+
+class Boxes:
+    """
+    Detections of one frame, indexed like ultralytics Boxes: boxes.xyxy / .conf / .cls
+    are arrays for all of them, and iterating yields one Boxes per detection, so
+    int(box.cls[0]), float(box.conf[0]) and box.xyxy[0].tolist() work unchanged.
+    """
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, i):
+        i = slice(i, i + 1) if isinstance(i, (int, np.integer)) else i
+        return Boxes(self.xyxy[i], self.conf[i], self.cls[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def data(self):
+        """(N, 6) x1, y1, x2, y2, conf, cls."""
+        return np.column_stack([self.xyxy, self.conf, self.cls])
+
+
+class Results:
+    def __init__(self, boxes, names, orig_shape):
+        self.boxes = boxes
+        self.names = names
+        self.orig_shape = orig_shape
+
+
+# ---- Detector ----
+
+def session_options(threads=None):
+    """ONNX Runtime options for a fixed, single-stream CPU workload."""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads:
+        options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+class OnnxDetector:
+    """
+    ONNX Runtime replacement for YOLO(...) in the perception scripts:
+    detector(frame, verbose=False)[0].boxes and detector.names behave like ultralytics.
+    threads: intra-op CPU threads (None = one per physical core, ONNX Runtime default).
+    provider: "cpu" or "openvino" (OpenVINO execution provider, if installed).
+    """
+
+    def __init__(self, path, threads=None, conf=0.25, iou=0.7, provider="cpu"):
+        if ort is None:
+            raise ImportError("onnxruntime is required for .onnx models (pip install onnxruntime)")
+        providers = ["CPUExecutionProvider"]
+        if provider == "openvino":
+            providers.insert(0, "OpenVINOExecutionProvider")
+        self.path = path
+        self.threads = threads
+        self.conf = conf
+        self.iou = iou
+        self.session = ort.InferenceSession(path, sess_options=session_options(threads), providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+        # ultralytics stores the class names and input size in the model metadata
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta["names"]) if "names" in meta else dict(DEFAULT_NAMES)
+        self.imgsz = ast.literal_eval(meta["imgsz"])[0] if "imgsz" in meta else IMGSZ
+
+    def __call__(self, frame, verbose=False, conf=None, iou=None):
+        return [self.predict(frame, conf=conf, iou=iou)]
+
+    def predict(self, frame, conf=None, iou=None):
+        blob, ratio, pad = preprocess(frame, self.imgsz)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        xyxy, scores, cls = postprocess(output, ratio, pad, frame.shape,
+                                        conf=self.conf if conf is None else conf,
+                                        iou=self.iou if iou is None else iou)
+        return Results(Boxes(xyxy, scores, cls), self.names, frame.shape[:2])
+
+
+def load_detector(path, threads=None, **kwargs):
+    """YOLO model for .pt checkpoints, OnnxDetector for .onnx exports; same call and results."""
+    if path.endswith(".onnx"):
+        return OnnxDetector(path, threads=threads, **kwargs)
+    from ultralytics import YOLO
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return YOLO(path)
+
+
+# ---- Export ----
+
+def dataset_images(data_yaml, split="train"):
+    """Image paths of a split of an ultralytics dataset yaml (Neuronal_Network/config.yaml)."""
+    import yaml
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+    root = data.get("path") or os.path.dirname(os.path.abspath(data_yaml))
+    entries = data[split] if isinstance(data[split], list) else [data[split]]
+    images = []
+    for entry in entries:
+        folder = entry if os.path.isabs(entry) else os.path.join(root, entry)
+        images += [p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+                   if p.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(images), data.get("names", DEFAULT_NAMES)
+
+
+class CalibrationReader:
+    """Feeds letterboxed training images to the INT8 calibration, one at a time."""
+
+    def __init__(self, images, input_name, size=IMGSZ):
+        self.images = iter(images)
+        self.input_name = input_name
+        self.size = size
+
+    def get_next(self):
+        for path in self.images:
+            frame = cv.imread(path)
+            if frame is not None:
+                return {self.input_name: preprocess(frame, self.size)[0]}
+        return None
+
+
+def export_onnx(weights, imgsz=IMGSZ, opset=12):
+    """FP32 ONNX export of the checkpoint (static 1x3ximgszximgsz input); returns its path."""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, opset=opset, simplify=True, dynamic=False)
+
+
+def quantize_int8(fp32_path, data_yaml, n_calib=200, imgsz=IMGSZ, seed=0):
+    """
+    Static INT8 (QDQ, per-channel weights) copy of an ONNX export, calibrated on up to
+    n_calib training images. The Detect head (/model.22/) stays in FP32: quantizing the
+    box regression and the final concat costs most of the mAP for little speed.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnx
+
+    images, _ = dataset_images(data_yaml, "train")
+    if not images:
+        raise FileNotFoundError(f"no training images found from {data_yaml}")
+    random.Random(seed).shuffle(images)
+
+    base = fp32_path[:-len(".onnx")]
+    prepared = base + "-prep.onnx"
+    int8_path = base + "-int8.onnx"
+    quant_pre_process(fp32_path, prepared)
+
+    model = onnx.load(prepared)
+    head = [node.name for node in model.graph.node if node.name.startswith("/model.22/")]
+    input_name = model.graph.input[0].name
+    quantize_static(prepared, int8_path, CalibrationReader(images[:n_calib], input_name, imgsz),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=CalibrationMethod.MinMax, nodes_to_exclude=head)
+
+    # Keep names/imgsz so OnnxDetector reads them from the INT8 model too
+    quantized = onnx.load(int8_path)
+    for prop in onnx.load(fp32_path).metadata_props:
+        entry = quantized.metadata_props.add()
+        entry.key, entry.value = prop.key, prop.value
+    onnx.save(quantized, int8_path)
+    os.remove(prepared)
+    print(f"INT8 model calibrated on {min(n_calib, len(images))} images: {int8_path}")
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the strawberry detector to ONNX (FP32 / INT8)")
+    parser.add_argument("--weights", default="vision/best.pt")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--int8", action="store_true", help="also write a static INT8 model")
+    parser.add_argument("--data", default="vision/Neuronal_Network/config.yaml", help="dataset yaml for calibration")
+    parser.add_argument("--calib-images", type=int, default=200)
+    args = parser.parse_args()
+
+    fp32_path = export_onnx(args.weights, args.imgsz)
+    print(f"FP32 model: {fp32_path}")
+    if args.int8:
+        quantize_int8(fp32_path, args.data, args.calib_images, args.imgsz)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,142 +4,125 @@
 # performs object detection using a YOLOv8 model, and estimates the 3D pose of detected strawberries
 # using the PnP algorithm. 
 
+# Strawberries are tracked across frames (tracker.py): the detector runs at least every
+# --detect-every frames (earlier when a track loses confidence) and each strawberry keeps an ID with smoothed depth/position.
+# Usage: python vision/strawberry_identifier.py [--record DIR | --replay DIR [--fast]] [--model PATH]
+#            [--detect-every 5]
+
+import argparse
 import cv2 as cv
-from ultralytics import YOLO
 import numpy as np
-import pyrealsense2 as rs
-
-# Initialize RealSense pipeline
-pipeline = rs.pipeline()
-config = rs.config()
-
-# Enable color and depth streams
-config.enable_stream(rs.stream.color, 1280, 720, rs.format.bgr8, 30)
-config.enable_stream(rs.stream.depth, 1280, 720, rs.format.z16, 30)
-profile = pipeline.start(config)
-align = rs.align(rs.stream.color)
-
-# Get stream intrinsics
-depth_stream = profile.get_stream(rs.stream.depth).as_video_stream_profile()
-color_stream = profile.get_stream(rs.stream.color).as_video_stream_profile()
-depth_intr = depth_stream.get_intrinsics()
-color_intr = color_stream.get_intrinsics()
-
-depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
-
-# Load YOLOv8 model
-model = YOLO("vision\\best.pt")
+import frame_source
+from onnx_detector import load_detector
+from tracker import StrawberryTracker
+
+parser = argparse.ArgumentParser(description="Strawberry detection and pose on the live camera or a recording")
+parser.add_argument("--record", help="also record every captured color/depth pair to this directory")
+parser.add_argument("--replay", help="run on a recording (frame_source.py) instead of the camera")
+parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of in real time")
+parser.add_argument("--model", default="vision\\best.pt", help=".pt checkpoint or ONNX export (onnx_detector.py)")
+parser.add_argument("--detect-every", type=int, default=5, help="run the detector at least every N frames (1 = every frame)")
+args = parser.parse_args()
+
+# Live RealSense (color + aligned depth on a capture thread) or a recording
+if args.replay:
+    source = frame_source.ReplaySource(args.replay, realtime=not args.fast)
+else:
+    source = frame_source.RealSenseSource(warmup_frames=0, record=args.record)
+
+depth_scale = source.depth_scale
+
+# Load YOLOv8 model ("vision\\best.onnx" / "vision\\best-int8.onnx" for the CPU backend)
+model = load_detector(args.model)
 min_area = 500
 max_area = 50000
 
 width_strawberry = 0.0326 #m
 height_strawberry = 0.0342 #m
 
-# Construct camera matrix from RealSense intrinsics
-camera_matrix = np.array([[color_intr.fx,     0.0,     color_intr.ppx],
-              [0.0,         color_intr.fy, color_intr.ppy],
-              [0.0,         0.0,     1.0      ]], dtype=np.float64)
-
-dist_coeffs = np.array(color_intr.coeffs)
-
-def robust_median_depth(depth_image, x1, y1, x2, y2):
-    """Compute the robust median depth in the specified ROI in meters."""
-    x1, y1 = max(0, x1), max(0, y1)
-    x2, y2 = min(depth_image.shape[1] - 1, x2), min(depth_image.shape[0] - 1, y2)
-    roi = depth_image[y1:y2+1, x1:x2+1]
-    roi = roi[roi > 0]  # Remove zero values
-    if len(roi) == 0:
-        return None
-    # Filter out outliers
-    lo, hi = np.percentile(roi, [5, 95])
-    roi = roi[(roi >= lo) & (roi <= hi)]
-    if roi.size == 0:
-        return None
-    return np.median(roi) * depth_scale # Convert to meters
+# Camera matrix and distortion from the color intrinsics
+camera_matrix, dist_coeffs = frame_source.camera_matrix(source.intrinsics)
+
+# Iterative PnP only adds orientation on top of the closed-form position
+refine_pnp = False
+
+# Tracks carry the strawberries between detector runs; boxes down to the tracker's
+# low threshold are used to keep tracks alive, new ones need conf > 0.73
+tracker = StrawberryTracker(detect_every=args.detect_every, high_thresh=0.73)
+
+# Inference always takes the newest pair
+source.start()
 
 while True:
-    # Wait for a coherent pair of frames: depth and color
-    frames = pipeline.wait_for_frames()
-    frames = align.process(frames)
-    color_frame = frames.get_color_frame()
-    depth_frame = frames.get_depth_frame()
+    pair = source.latest()
 
-    if not color_frame or not depth_frame:
+    if pair is None:
         print("No frame")
         break
     
-    # Convert images to numpy arrays
-    frame = np.asanyarray(color_frame.get_data())
-    depth = np.asanyarray(depth_frame.get_data())
+    frame = pair["color"]
+    depth = pair["depth"]
     
-    # Perform inference
-    results = model(frame, verbose=False)[0]
-
-    for box in results.boxes:
-        cls_id = int(box.cls[0])
-        conf = float(box.conf[0])  # <-- convert to float
-        label = model.names[cls_id]
-        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-        area = (x2 - x1) * (y2 - y1)
-
-        if conf > 0.73 and min_area < area < max_area and label in ["ripe", "unripe"]:
-            Z = robust_median_depth(depth, x1, y1, x2, y2) # Meters
-            print("Depth (m):", Z)
-            if Z is None:
-                print(conf, "area:", area)
-                cv.rectangle(frame, (x1, y1), (x2, y2), (255,0,0), 2)
-                conf_text = f"{label} no depth {conf*100:.1f}%"
-                cv.putText(frame, conf_text, (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-                continue
-
-            image_points = np.array([
-                (x1, y1),         # Top-left
-                (x2, y1),         # Top-right
-                (x2, y2),         # Bottom-right
-                (x1, y2)          # Bottom-left
-            ], dtype="double")
-
-            object_points = np.array([
-                (-width_strawberry/2, -height_strawberry/2, 0.0),  # Top-left
-                ( width_strawberry/2, -height_strawberry/2, 0.0),  # Top-right
-                ( width_strawberry/2,  height_strawberry/2, 0.0),  # Bottom-right
-                (-width_strawberry/2,  height_strawberry/2, 0.0)   # Bottom-left
-            ])
-
-            # PnP with Z guess
-            rvec = np.zeros((3,1), dtype=np.float64)   # neutral initial orientation
-            tvec = np.array([[0],[0],[Z]], dtype=np.float64)
-            success, rvec, tvec = cv.solvePnP(
-                objectPoints=object_points,
-                imagePoints=image_points,
-                cameraMatrix=camera_matrix,
-                distCoeffs=dist_coeffs,
-                rvec=rvec,
-                tvec=tvec,
-                useExtrinsicGuess=True,              
-                flags=cv.SOLVEPNP_ITERATIVE
-            )
-
-            color = (0,255,255) if success else (0,0,255)
-            cv.rectangle(frame, (x1,y1), (x2,y2), color, 2)
-            conf_text = f"{label} {conf*100:.1f}%"
+    detected = tracker.needs_detection()
+    if detected:
+        # Perform inference
+        results = model(frame, verbose=False)[0]
+
+        boxes, scores, labels = [], [], []
+        for box in results.boxes:
+            cls_id = int(box.cls[0])
+            conf = float(box.conf[0])  # <-- convert to float
+            label = model.names[cls_id]
+            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+            area = (x2 - x1) * (y2 - y1)
+
+            if conf > tracker.low_thresh and min_area < area < max_area and label in ["ripe", "unripe"]:
+                boxes.append((x1, y1, x2, y2))
+                scores.append(conf)
+                labels.append(label)
+        tracks = tracker.update(frame, boxes, scores, labels)
+    else:
+        tracks = tracker.update(frame)
+
+    # Depth and position of every track box in one batched pass, smoothed per track
+    # (PnP refinement only on detector frames)
+    tracker.update_geometry(depth, depth_scale, camera_matrix, dist_coeffs, refine=refine_pnp and detected)
+
+    for track in tracks:
+        x1, y1, x2, y2 = map(int, track.xyxy.round())
+        label = track.label
+        if track.depth is None:
+            print(f"#{track.id}", track.score, "no depth")
+            cv.rectangle(frame, (x1, y1), (x2, y2), (255,0,0), 2)
+            conf_text = f"#{track.id} {label} no depth {track.score*100:.1f}%"
             cv.putText(frame, conf_text, (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-
-            if success:
-                tvec[2,0] = Z + (width_strawberry/2) # Adjust depth to box center
-                T_4x4 = np.eye(4)
-                T_4x4[:3, :3], _ = cv.Rodrigues(rvec)
-                T_4x4[:3, 3] = tvec.reshape(3)
-                print(T_4x4)
-
-                # # Draw the 3D axes
-                # axis_length = 0.1  # Length of the axes
-                # cv.drawFrameAxes(frame, camera_matrix, dist_coeffs, rvec, tvec, axis_length)
-
+            continue
+
+        print(f"#{track.id} Depth (m):", track.depth)
+        cv.rectangle(frame, (x1,y1), (x2,y2), (0,255,255), 2)
+        conf_text = f"#{track.id} {label} {track.score*100:.1f}%"
+        cv.putText(frame, conf_text, (x1, y1 - 10), cv.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
+
+        T_4x4 = np.eye(4)
+        if track.rotation is not None:
+            T_4x4[:3, :3] = track.rotation
+        T_4x4[:3, 3] = track.position
+        T_4x4[2, 3] = track.depth + (width_strawberry/2) # Adjust depth to box center
+        print(T_4x4)
+
+    stats = source.stats()
+    det_ratio = tracker.stats()["detection_ratio"]
+    stats_text = (f"cam {stats['camera_fps']:.1f} fps | inf {stats['inference_fps']:.1f} fps | "
+                  f"detector {det_ratio*100:.0f}% of frames | dropped {stats['dropped']}")
+    cv.putText(frame, stats_text, (10, 30), cv.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
     cv.imshow("YOLOv8 Inference", frame)
 
     if cv.waitKey(1) & 0xFF == ord('q'):
         break
 
+print("Capture stats:", source.stats())
+print("Tracker stats:", tracker.stats())
+source.stop()
+
 #cv.imwrite(img_path, frame)
 cv.destroyAllWindows()
@@ -0,0 +1,119 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Unit tests of tracker.py (Kalman box, two-stage matching, track ageing,
+# optical flow and the detection schedule) on small synthetic frames.
+# Usage: python -m pytest vision/tests
+
+import os
+import sys
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tracker import KalmanBox, StrawberryTracker, box_iou, greedy_match
+
+FRAME = np.zeros((120, 160), dtype=np.uint8)
+BOX = (40, 40, 70, 70)
+
+
+def textured(shift=0):
+    """Random texture, shifted right by shift px (the flow tests follow it)."""
+    texture = cv.GaussianBlur(np.random.default_rng(0).integers(0, 255, (240, 320), dtype=np.uint8), (5, 5), 0)
+    return np.ascontiguousarray(texture[:240, 40 - shift:280 - shift])
+
+
+def test_box_iou_and_greedy_match():
+    iou = box_iou([(0, 0, 10, 10), (20, 0, 30, 10)], [(20, 0, 30, 10), (5, 0, 15, 10), (100, 100, 110, 110)])
+    assert np.allclose(iou, [[0, 1 / 3, 0], [1, 0, 0]])
+    assert sorted(greedy_match(iou, 0.3)) == [(0, 1), (1, 0)]
+    assert greedy_match(iou, 0.5) == [(1, 0)]
+    assert greedy_match(np.zeros((0, 2)), 0.3) == []
+
+
+def test_kalman_box_learns_the_velocity():
+    kf = KalmanBox((0, 0, 20, 20))
+    for k in range(1, 15):
+        kf.predict()
+        kf.update((3 * k, 0, 3 * k + 20, 20))
+    kf.predict()
+    assert np.allclose(kf.xyxy, (45, 0, 65, 20), atol=1.0)
+
+
+def test_low_score_detection_keeps_the_track():
+    tracker = StrawberryTracker(flow=False)
+    tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+    # Partly occluded: only a low-score box, slightly moved
+    tracks = tracker.update(FRAME, [(42, 40, 72, 70)], [0.3], ["unripe"])
+    assert len(tracks) == 1 and tracks[0].id == 1
+    assert tracks[0].label == "ripe" and tracks[0].score == 0.9 and tracks[0].missed == 0
+    # A low-score box with no track to keep does not start one
+    assert len(tracker.update(FRAME, [(42, 40, 72, 70), (100, 10, 130, 40)], [0.3, 0.4], ["ripe"] * 2)) == 1
+
+
+def test_confident_detection_wins_the_first_stage():
+    tracker = StrawberryTracker(flow=False)
+    tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+    tracks = tracker.update(FRAME, [(41, 40, 71, 70), (40, 41, 70, 71)], [0.4, 0.8], ["unripe", "ripe"])
+    # The confident box took the track, the low-score one is left over and dropped
+    assert [t.id for t in tracks] == [1] and tracks[0].score == 0.8
+
+
+def test_tracks_age_out_after_max_missed():
+    tracker = StrawberryTracker(flow=False, max_missed=2)
+    tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+    for missed in (1, 2):
+        tracks = tracker.update(FRAME, [], [], [])
+        assert len(tracks) == 1 and tracks[0].missed == missed
+    assert tracker.update(FRAME, [], [], []) == []
+    # Frames without detection do not count as misses
+    tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+    for _ in range(5):
+        tracker.update(FRAME)
+    assert tracker.tracks[0].missed == 0 and tracker.tracks[0].since_detection == 5
+
+
+def test_flow_follows_the_image():
+    tracker = StrawberryTracker(flow_scale=1.0)
+    tracker.update(textured(0), [BOX], [0.9], ["ripe"])
+    for shift in (4, 8, 12):
+        tracks = tracker.update(textured(shift))
+    assert tracks[0].flow_quality > 0.5
+    assert np.allclose(tracks[0].xyxy, np.add(BOX, (12, 0, 12, 0)), atol=1.0)
+
+
+def test_detection_every_n_frames():
+    tracker = StrawberryTracker(detect_every=10, flow=False)
+    schedule = []
+    for _ in range(30):
+        detect = tracker.needs_detection()
+        schedule.append(detect)
+        tracker.update(FRAME, [BOX], [0.75], ["ripe"]) if detect else tracker.update(FRAME)
+    # Even a barely confident track lets the tracker wait the full 10 frames
+    assert [i for i, d in enumerate(schedule) if d] == [0, 10, 20]
+
+
+def test_early_detection_when_a_track_loses_confidence():
+    tracker = StrawberryTracker(detect_every=10, flow=False)
+    tracker.update(FRAME, [BOX, (100, 10, 130, 40)], [0.9, 0.9], ["ripe"] * 2)
+    tracker.update(FRAME)
+    assert not tracker.needs_detection()
+    # Flow lost most of its points on one track
+    tracker.tracks[1].flow_quality = 0.3
+    assert tracker.needs_detection()
+
+
+def test_missed_track_does_not_force_the_next_pass():
+    tracker = StrawberryTracker(detect_every=5, flow=False, max_missed=3)
+    tracker.update(FRAME, [BOX, (100, 10, 130, 40)], [0.9, 0.9], ["ripe"] * 2)
+    for _ in range(4):
+        tracker.update(FRAME)
+    # The detector misses the second strawberry: it has gone 15 frames without detection,
+    # but only the frames since this pass count for the early trigger
+    for _ in range(2):
+        tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+        for _ in range(4):
+            tracker.update(FRAME)
+    tracker.update(FRAME, [BOX], [0.9], ["ripe"])
+    assert tracker.tracks[1].since_detection == 15 and tracker.tracks[1].missed == 3
+    assert not tracker.needs_detection()
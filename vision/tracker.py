@@ -0,0 +1,323 @@
+# Author: Daniel De Regules Gamboa
+# Date: November 2025
+# Description: Multi-object tracker for the live identifier. Each strawberry gets a stable
+# track ID; a constant-velocity Kalman filter on the box predicts it between frames,
+# detections are associated ByteTrack-style (confident boxes first, then the low-score
+# ones to keep partly occluded fruit alive) and, on frames without detection, the boxes
+# follow the image through sparse optical flow. The detector runs at least every
+# detect_every frames (a ceiling), earlier when a track loses confidence: its flow fails,
+# or its score decays below min_confidence within the current interval. With the default
+# decay a confident track (score >= high_thresh) lasts about 12 frames, so on normal
+# motion detect_every up to 10 is honoured. Depth and position are smoothed per track,
+# with a gate against depth outliers, so the planner gets stable targets.
+
+import itertools
+
+import cv2 as cv
+import numpy as np
+
+from batch_pose import batch_poses
+
+
+def box_iou(a, b):
+    """(len(a), len(b)) IoU of xyxy boxes."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def greedy_match(iou, threshold):
+    """Pairs (row, col) by decreasing IoU, each row/col used once, IoU >= threshold."""
+    pairs = []
+    if iou.size == 0:
+        return pairs
+    rows, cols = np.nonzero(iou >= threshold)
+    used_r, used_c = set(), set()
+    for k in np.argsort(-iou[rows, cols]):
+        r, c = rows[k], cols[k]
+        if r not in used_r and c not in used_c:
+            used_r.add(r)
+            used_c.add(c)
+            pairs.append((r, c))
+    return pairs
+
+
+class KalmanBox:
+    """
+    Constant-velocity Kalman filter of a box as (cx, cy, w, h) + velocities, in pixels
+    per frame. Noise scales with the box size, as in ByteTrack.
+    """
+
+    STD_POSITION = 1 / 20
+    STD_VELOCITY = 1 / 160
+
+    def __init__(self, xyxy):
+        z = self._measurement(xyxy)
+        self.x = np.concatenate([z, np.zeros(4)])
+        size = max(z[2], z[3])
+        std = np.array([2 * self.STD_POSITION * size] * 4 + [10 * self.STD_VELOCITY * size] * 4)
+        self.P = np.diag(std ** 2)
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+
+    @staticmethod
+    def _measurement(xyxy):
+        x1, y1, x2, y2 = xyxy
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+    @property
+    def xyxy(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def predict(self):
+        size = max(self.x[2], self.x[3])
+        q = np.array([self.STD_POSITION * size] * 4 + [self.STD_VELOCITY * size] * 4) ** 2
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + np.diag(q)
+
+    def update(self, xyxy, noise=1.0):
+        """Correct with a measured box; noise scales the measurement std (1 = a detection)."""
+        z = self._measurement(xyxy)
+        size = max(self.x[2], self.x[3])
+        R = np.diag((noise * self.STD_POSITION * size * np.ones(4)) ** 2)
+        S = self.H @ self.P @ self.H.T + R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+
+class Track:
+    """One strawberry: Kalman box, label/score of its last detection and smoothed geometry."""
+
+    def __init__(self, track_id, xyxy, score, label):
+        self.id = track_id
+        self.kf = KalmanBox(xyxy)
+        self.score = score
+        self.label = label
+        self.hits = 1
+        self.age = 0                # frames since the track was created
+        self.since_detection = 0    # frames since it was last matched to a detection
+        self.missed = 0             # consecutive detection passes without a match
+        self.flow_quality = 1.0     # fraction of flow points kept on the last flow frame
+        self.prev_xyxy = self.kf.xyxy
+        self.depth = None           # smoothed Z (m)
+        self.position = None        # smoothed camera-frame XYZ (m)
+        self.rotation = None        # latest PnP rotation, if refined
+        self._outliers = 0
+
+    @property
+    def xyxy(self):
+        return self.kf.xyxy
+
+    def confidence(self, decay, frames=None):
+        """
+        Detection score, decayed per frame without detection and scaled by the flow quality.
+        frames caps the decayed frames (a track missed by a detection pass is aged by max_missed).
+        """
+        since = self.since_detection if frames is None else min(self.since_detection, frames)
+        return self.score * decay ** since * self.flow_quality
+
+    def smooth(self, Z, position, rotation, alpha, gate):
+        """EMA of depth/position; a depth jump larger than gate (m) is ignored unless it persists."""
+        if np.isnan(Z):
+            return
+        if self.depth is not None and abs(Z - self.depth) > gate:
+            self._outliers += 1
+            if self._outliers < 3:
+                return
+            self.depth = self.position = None  # the jump persisted: the fruit really moved
+        self._outliers = 0
+        if self.depth is None:
+            self.depth, self.position = Z, position.copy()
+        else:
+            self.depth += alpha * (Z - self.depth)
+            self.position += alpha * (position - self.position)
+        if rotation is not None:
+            self.rotation = rotation
+
+
+class StrawberryTracker:
+    """
+    Tracks detections across frames and decides when the detector has to run.
+
+    Per frame:  if tracker.needs_detection(): tracks = tracker.update(frame, boxes, scores, labels)
+                else:                         tracks = tracker.update(frame)
+                tracker.update_geometry(depth, depth_scale, camera_matrix, dist_coeffs)
+    Detections below high_thresh are only used to keep existing tracks (ByteTrack), so
+    pass every box above low_thresh. detect_every is the longest gap between detection
+    passes, not a fixed period.
+    """
+
+    def __init__(self, detect_every=5, high_thresh=0.73, low_thresh=0.1, match_iou=0.3, low_match_iou=0.5,
+                 max_missed=2, min_hits=1, decay=0.97, min_confidence=0.5, flow=True, flow_scale=0.5,
+                 depth_alpha=0.3, depth_gate=0.03):
+        self.detect_every = detect_every
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.decay = decay
+        self.min_confidence = min_confidence
+        self.flow = flow
+        self.flow_scale = flow_scale
+        self.depth_alpha = depth_alpha
+        self.depth_gate = depth_gate
+
+        self.tracks = []
+        self.frames = 0
+        self.detections = 0
+        self._since_detection = None   # frames since the last detection pass (None: never)
+        self._prev_gray = None
+        self._ids = itertools.count(1)
+
+    # ---- Scheduling ----
+
+    def needs_detection(self):
+        """True when the next frame should go through the detector."""
+        if self._since_detection is None or self._since_detection + 1 >= self.detect_every:
+            return True
+        frames = self._since_detection + 1
+        return any(t.confidence(self.decay, frames) < self.min_confidence for t in self.confirmed())
+
+    # ---- Update ----
+
+    def update(self, frame, boxes=None, scores=None, labels=None):
+        """
+        Advance one frame. With boxes (xyxy), scores and labels it is a detection
+        frame; without, tracks are predicted and moved by optical flow.
+        Returns the confirmed tracks.
+        """
+        self.frames += 1
+        gray = None
+        if self.flow:
+            gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            if self.flow_scale != 1.0:
+                gray = cv.resize(gray, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv.INTER_AREA)
+
+        for track in self.tracks:
+            track.prev_xyxy = track.xyxy  # where the flow looks for it in the previous frame
+            track.kf.predict()
+            track.age += 1
+            track.since_detection += 1
+
+        if boxes is not None:
+            self._associate(np.asarray(boxes, dtype=np.float64).reshape(-1, 4),
+                            np.asarray(scores, dtype=np.float64).reshape(-1), list(labels))
+            self.detections += 1
+            self._since_detection = 0
+        else:
+            if self.flow and self._prev_gray is not None:
+                self._flow_update(self._prev_gray, gray)
+            if self._since_detection is not None:
+                self._since_detection += 1
+
+        self._prev_gray = gray
+        return self.confirmed()
+
+    def _associate(self, boxes, scores, labels):
+        high = np.flatnonzero(scores >= self.high_thresh)
+        low = np.flatnonzero((scores >= self.low_thresh) & (scores < self.high_thresh))
+        predicted = np.array([t.xyxy for t in self.tracks]).reshape(-1, 4)
+
+        # 1) every track against the confident detections
+        matched_tracks, matched_high = set(), set()
+        for r, c in greedy_match(box_iou(predicted, boxes[high]), self.match_iou):
+            self._hit(self.tracks[r], boxes[high[c]], scores[high[c]], labels[high[c]])
+            matched_tracks.add(r)
+            matched_high.add(c)
+
+        # 2) the tracks left against the low-score detections (occlusion, blur)
+        left = [i for i in range(len(self.tracks)) if i not in matched_tracks]
+        for r, c in greedy_match(box_iou(predicted[left], boxes[low]), self.low_match_iou):
+            track = self.tracks[left[r]]
+            # Keeps the track alive and its box corrected, but not its label/score
+            self._hit(track, boxes[low[c]], track.score, track.label)
+            matched_tracks.add(left[r])
+
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        # 3) confident detections without a track start new ones
+        for c, i in enumerate(high):
+            if c not in matched_high:
+                self.tracks.append(Track(next(self._ids), boxes[i], scores[i], labels[i]))
+
+    def _hit(self, track, box, score, label):
+        track.kf.update(box)
+        track.score = score
+        track.label = label
+        track.hits += 1
+        track.missed = 0
+        track.since_detection = 0
+        track.flow_quality = 1.0
+
+    def _flow_update(self, prev, gray, max_points=20, fb_error=1.0):
+        """Shift each track box by the median sparse flow of the corners inside it."""
+        s = self.flow_scale
+        points, owners = [], []
+        for i, track in enumerate(self.tracks):
+            x1, y1, x2, y2 = (track.prev_xyxy * s).round().astype(int)
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, prev.shape[1] - 1), min(y2, prev.shape[0] - 1)
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                track.flow_quality = 0.0
+                continue
+            # Corners of the box crop only, not of the whole image
+            p0 = cv.goodFeaturesToTrack(prev[y1:y2, x1:x2], max_points, 0.01, 3)
+            if p0 is None or len(p0) < 3:
+                continue  # nothing to follow: Kalman prediction only
+            points.append(p0 + np.array([x1, y1], dtype=np.float32))
+            owners += [i] * len(p0)
+        if not points:
+            return
+
+        # One forward and one backward pass for the points of every track
+        p0 = np.concatenate(points)
+        owners = np.array(owners)
+        p1, st1, _ = cv.calcOpticalFlowPyrLK(prev, gray, p0, None)
+        p0r, st0, _ = cv.calcOpticalFlowPyrLK(gray, prev, p1, None)
+        # Forward-backward check: keep the points that come back where they started
+        good = (st1[:, 0] == 1) & (st0[:, 0] == 1) & (np.linalg.norm(p0 - p0r, axis=2)[:, 0] < fb_error)
+        flow = (p1 - p0)[:, 0] / s
+        for i in np.unique(owners):
+            track = self.tracks[i]
+            mine = owners == i
+            track.flow_quality = good[mine].mean()
+            if good[mine].sum() < 3:
+                continue
+            shift = np.median(flow[mine & good], axis=0)
+            # The box is measured from the track's own previous box, so a loosely trusted
+            # measurement would leave the box lagging further behind every frame
+            track.kf.update(track.prev_xyxy + np.tile(shift, 2), noise=0.5)
+
+    # ---- Geometry ----
+
+    def update_geometry(self, depth_image, depth_scale, camera_matrix, dist_coeffs=None, refine=False):
+        """Depth and position of every confirmed track box (batch_poses), smoothed per track."""
+        tracks = self.confirmed()
+        if not tracks:
+            return tracks
+        boxes = np.array([t.xyxy for t in tracks]).round().astype(np.int64)
+        depths, poses = batch_poses(depth_image, boxes, depth_scale, camera_matrix, dist_coeffs, refine=refine)
+        for track, Z, pose in zip(tracks, depths, poses):
+            track.smooth(Z, pose[:3, 3], pose[:3, :3] if refine else None, self.depth_alpha, self.depth_gate)
+        return tracks
+
+    def confirmed(self):
+        return [t for t in self.tracks if t.hits >= self.min_hits]
+
+    def stats(self):
+        return {"frames": self.frames, "detections": self.detections,
+                "detection_ratio": self.detections / self.frames if self.frames else 0.0,
+                "tracks": len(self.tracks)}